@@ -9,6 +9,10 @@ config = context.config
 # Interpret the config file for Python logging.
 fileConfig(config.config_file_name)
 
+# DATABASE_URL (the shared PostgreSQL database of storage.py) overrides the SQLite file
+if os.getenv('DATABASE_URL'):
+    config.set_main_option('sqlalchemy.url', os.environ['DATABASE_URL'])
+
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
     context.configure(url=url, literal_binds=True, compare_type=True)
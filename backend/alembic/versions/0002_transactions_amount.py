@@ -0,0 +1,72 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_transactions_amount'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+# SQLite can't ALTER TABLE ADD a STORED generated column, so the table is
+# rebuilt with it and the rows copied over (ids are kept).
+COLUMNS = 'id, date, type, product, quantity, price, customer, region, fingerprint'
+
+BASE_INDEXES = [
+    'CREATE INDEX idx_transactions_date ON transactions(date)',
+    'CREATE INDEX idx_transactions_product ON transactions(product)',
+    'CREATE INDEX idx_transactions_region ON transactions(region)',
+    'CREATE INDEX idx_transactions_customer ON transactions(customer)',
+    'CREATE UNIQUE INDEX ux_transactions_fingerprint ON transactions(fingerprint)',
+]
+
+# quantity and price trail amount so the indexes also cover SUM(quantity * price)
+# on SQLite builds that recompute a generated column instead of reading it
+# from the index
+COVERING_INDEXES = [
+    'CREATE INDEX idx_transactions_date_type_amount ON transactions(date, type, amount, quantity, price)',
+    'CREATE INDEX idx_transactions_product_date_amount ON transactions(product, date, amount, quantity, price)',
+    'CREATE INDEX idx_transactions_region_date_amount ON transactions(region, date, amount, quantity, price)',
+    'CREATE INDEX idx_transactions_customer_date_amount ON transactions(customer, date, amount, quantity, price)',
+]
+
+
+def _rebuild(amount_column: str):
+    op.execute(f'''
+    CREATE TABLE transactions_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT,
+        type TEXT,
+        product TEXT,
+        quantity REAL,
+        price REAL,
+        customer TEXT,
+        region TEXT,
+        fingerprint TEXT{amount_column}
+    )
+    ''')
+    op.execute(f'INSERT INTO transactions_new ({COLUMNS}) SELECT {COLUMNS} FROM transactions')
+    op.execute('DROP TABLE transactions')
+    op.execute('ALTER TABLE transactions_new RENAME TO transactions')
+    for statement in BASE_INDEXES:
+        op.execute(statement)
+
+
+def _is_sqlite() -> bool:
+    return op.get_bind().dialect.name == 'sqlite'
+
+
+def upgrade():
+    if _is_sqlite():
+        _rebuild(',\n        amount REAL GENERATED ALWAYS AS (quantity * price) STORED')
+    else:
+        op.add_column('transactions', sa.Column('amount', sa.Float(), sa.Computed('quantity * price', persisted=True)))
+    for statement in COVERING_INDEXES:
+        op.execute(statement)
+
+
+def downgrade():
+    if _is_sqlite():
+        _rebuild('')
+        return
+    for statement in COVERING_INDEXES:
+        op.execute(f'DROP INDEX {statement.split()[2]}')
+    op.drop_column('transactions', 'amount')
@@ -0,0 +1,131 @@
+"""Optional in-process DuckDB engine for analytical queries over datasets.
+
+With ``ANALYTICS_ENGINE=duckdb`` (and the duckdb package installed) the
+group-by, timeseries and summary queries over uploaded datasets run in an
+embedded DuckDB instead of SQLite or pandas. DuckDB scans the dataset's
+Parquet sidecar parts column by column, vectorized across all cores
+(``DUCKDB_THREADS`` caps it). A dataset without a complete sidecar is read
+from the SQLite file through DuckDB's sqlite extension, when it can be
+loaded.
+
+Queries are written in the SQLite dialect of the fallback path: the dataset
+is exposed under its own table name and ``TOTAL()`` behaves as in SQLite.
+Any DuckDB failure returns None and the caller answers through SQLite as
+before, so results never depend on the engine being available.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import duckdb  # type: ignore
+except Exception:  # pragma: no cover
+    duckdb = None  # type: ignore
+
+try:
+    from .columnar import dataset_parts
+except ImportError:  # support running as a module without package context
+    from columnar import dataset_parts
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'sqlite').lower()
+DUCKDB_ENABLED = ANALYTICS_ENGINE == 'duckdb' and duckdb is not None
+# 0 lets DuckDB use every core
+DUCKDB_THREADS = int(os.getenv('DUCKDB_THREADS', '0'))
+
+if ANALYTICS_ENGINE == 'duckdb' and duckdb is None:  # pragma: no cover
+    logger.warning('ANALYTICS_ENGINE=duckdb but duckdb is not installed; using SQLite')
+
+_instance = None
+_attached: dict = {}
+_lock = threading.Lock()
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _database():
+    """The process-wide in-memory DuckDB instance; queries run on cursors of it."""
+    global _instance
+    with _lock:
+        if _instance is None:
+            _instance = duckdb.connect(':memory:')
+            if DUCKDB_THREADS > 0:
+                _instance.execute(f'SET threads = {DUCKDB_THREADS}')
+            _instance.execute('CREATE MACRO total(x) AS coalesce(CAST(sum(x) AS DOUBLE), 0.0)')
+        return _instance
+
+
+def _sqlite_alias(database: str) -> Optional[str]:
+    """Alias of the SQLite file, attached read-only to the DuckDB instance on
+    first use; None when the sqlite extension can't be loaded."""
+    with _lock:
+        if database not in _attached:
+            alias = f'sqlite_{len(_attached)}'
+            try:
+                _instance.execute(f'ATTACH {_quote(database)} AS {alias} (TYPE sqlite, READ_ONLY)')
+            except Exception as e:
+                logger.warning(f'Cannot attach {database} to DuckDB, only Parquet sidecars will be used: {e}')
+                alias = None
+            _attached[database] = alias
+        return _attached[database]
+
+
+def _cursor(database: str, table_name: str, version: int, attach: bool):
+    """A DuckDB cursor with ``table_name`` defined as a view over the dataset,
+    or None when the dataset can't be read."""
+    instance = _database()
+    parts = dataset_parts(database, table_name, version)
+    if parts is not None:
+        # union_by_name: an append may have widened an int64 column to double
+        source = f'read_parquet([{", ".join(_quote(p) for p in parts)}], union_by_name = true)'
+    else:
+        alias = _sqlite_alias(database) if attach else None
+        if alias is None:
+            return None
+        source = f'{alias}."{table_name}"'
+    cur = instance.cursor()
+    try:
+        cur.execute(f'CREATE TEMP VIEW "{table_name}" AS SELECT * FROM {source}')
+    except Exception:
+        cur.close()
+        raise
+    return cur
+
+
+def _run(database: str, table_name: str, version: int, sql: str, params: Sequence, attach: bool, fetch):
+    if not DUCKDB_ENABLED:
+        return None
+    try:
+        cur = _cursor(database, table_name, version, attach)
+        if cur is None:
+            return None
+        try:
+            return fetch(cur.execute(sql, list(params)))
+        finally:
+            cur.close()
+    except Exception as e:
+        logger.warning(f'DuckDB query on {table_name} failed, falling back to SQLite: {e}')
+        return None
+
+
+def fetch_rows(database: str, table_name: str, version: int, sql: str, params: Sequence = (),
+               attach: bool = True) -> Optional[List[tuple]]:
+    """Rows of ``sql`` run by DuckDB over version ``version`` of the dataset.
+
+    ``attach=False`` only answers from the Parquet parts of that version,
+    which keeps the result consistent with a SQLite snapshot that read the
+    same version.
+    """
+    return _run(database, table_name, version, sql, params, attach, lambda r: r.fetchall())
+
+
+def fetch_frame(database: str, table_name: str, version: int, sql: str, params: Sequence = (),
+                attach: bool = True) -> Optional[pd.DataFrame]:
+    """``fetch_rows`` as a DataFrame."""
+    return _run(database, table_name, version, sql, params, attach, lambda r: r.df())
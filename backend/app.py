@@ -1,7 +1,8 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, status, Body, Query, Request
-from fastapi.responses import JSONResponse, RedirectResponse, Response, PlainTextResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Body, Query, Request
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 try:
     from pydantic import EmailStr
@@ -9,39 +10,68 @@ except ImportError:
     # Fallback for older pydantic versions
     EmailStr = str
 import pandas as pd
-import numpy as np
-import sqlite3
 import os
 import io
+import csv
 import zipfile
+import asyncio
+import tempfile
+import uuid
+import multiprocessing
+import concurrent.futures
+import functools
+import inspect
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 import hashlib
 import time
-from collections import defaultdict, deque
+import base64
+import threading
+from collections import OrderedDict, defaultdict, deque
 import logging
 import json
-import math
 from datetime import datetime
 
-# Helper function to clean NaN values and handle JSON serialization
-def clean_nan_values(obj):
-    """Recursively clean NaN values and handle JSON serialization issues"""
-    if isinstance(obj, dict):
-        return {k: clean_nan_values(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_nan_values(item) for item in obj]
-    elif isinstance(obj, pd.Timestamp):
-        return str(obj)
-    elif isinstance(obj, (pd.Series, pd.DataFrame)):
-        return obj.to_dict() if hasattr(obj, 'to_dict') else str(obj)
-    elif isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-        return 0.0
-    elif pd.isna(obj):
-        return None
-    else:
-        return obj
+try:
+    from .ingest import (clean_nan_values, ingest_into, ingest_file, create_job, update_job, load_job, JOB_FIELDS,
+                         ensure_jobs_table, ensure_metadata_table, advance_store_version, hash_fileobj, find_by_content_hash,
+                         find_version_by_hash, load_file_metadata, dataset_stats, catalog_stats, UploadParseError, EmptyUploadError,
+                         IngestCancelled, SchemaMismatchError, DatasetNotFoundError, DatasetExistsError)
+except ImportError:  # support running as a module without package context
+    from ingest import (clean_nan_values, ingest_into, ingest_file, create_job, update_job, load_job, JOB_FIELDS,
+                        ensure_jobs_table, ensure_metadata_table, advance_store_version, hash_fileobj, find_by_content_hash,
+                        find_version_by_hash, load_file_metadata, dataset_stats, catalog_stats, UploadParseError, EmptyUploadError,
+                        IngestCancelled, SchemaMismatchError, DatasetNotFoundError, DatasetExistsError)
+
+try:
+    from .roles import SQL_AFFINITY_DTYPES, detect_roles, is_iso_date, roles_for
+    from .analytics_engine import DUCKDB_ENABLED, fetch_frame, fetch_rows
+    from .columnar import read_dataset
+    from .db import WriteQueueFull, close_pools, connect, observe_writes, pool_for
+    from .frame_cache import FrameCache, typed_frame
+    from .registry import ActiveDataset, DatasetRegistry, load_active
+    from .response_cache import CachedResponse, ResponseCache
+    from .singleflight import SingleFlight
+    from .rollup import ROLLUP_TABLE, build_rollup, clear_rollup, rollup_available, rollup_measure
+    from .search import (TRANSACTION_SEARCH_COLUMNS, build_search_index, clear_search_index, search_columns,
+                         search_filter)
+    from . import storage
+except ImportError:  # support running as a module without package context
+    from roles import SQL_AFFINITY_DTYPES, detect_roles, is_iso_date, roles_for
+    from analytics_engine import DUCKDB_ENABLED, fetch_frame, fetch_rows
+    from columnar import read_dataset
+    from db import WriteQueueFull, close_pools, connect, observe_writes, pool_for
+    from frame_cache import FrameCache, typed_frame
+    from registry import ActiveDataset, DatasetRegistry, load_active
+    from response_cache import CachedResponse, ResponseCache
+    from singleflight import SingleFlight
+    from rollup import ROLLUP_TABLE, build_rollup, clear_rollup, rollup_available, rollup_measure
+    from search import (TRANSACTION_SEARCH_COLUMNS, build_search_index, clear_search_index, search_columns,
+                        search_filter)
+    import storage
 
 # Import enhanced user services
 try:
@@ -96,18 +126,159 @@ except ImportError:
 
 # Optional Prometheus metrics
 try:
-    from prometheus_client import Counter, Summary, generate_latest, CONTENT_TYPE_LATEST  # type: ignore
+    from prometheus_client import Counter, Gauge, Summary, generate_latest, CONTENT_TYPE_LATEST  # type: ignore
     METRICS_ENABLED = True
 except Exception:  # pragma: no cover
     METRICS_ENABLED = False
-    Counter = Summary = generate_latest = CONTENT_TYPE_LATEST = None  # type: ignore
+    Counter = Gauge = Summary = generate_latest = CONTENT_TYPE_LATEST = None  # type: ignore
 
-DB_DIR = os.path.dirname(__file__)
+# Directory of the database, its WAL and its Parquet sidecars (business_parquet/)
+DB_DIR = os.getenv('DB_DIR', os.path.dirname(__file__))
 DB_NAME = "business.db"
 if os.getenv('PYTEST_CURRENT_TEST'):
     DB_NAME = "business_test.db"
 DATABASE = os.path.join(DB_DIR, DB_NAME)
 
+
+def _reader():
+    """A pooled read connection; ``close()`` returns it to the pool."""
+    return pool_for(DATABASE).reader()
+
+
+def _submit_write(fn, *args, exclusive: bool = False, **kwargs):
+    """Queue ``fn(conn, *args, **kwargs)`` for the writer thread (see db.WriteQueue);
+    a full queue is answered with 503 so clients back off."""
+    try:
+        return pool_for(DATABASE).writes.submit(fn, *args, exclusive=exclusive, **kwargs)
+    except WriteQueueFull as e:
+        if METRICS_ENABLED:
+            WRITE_QUEUE_REJECTED.inc()
+        raise HTTPException(status_code=503, detail=f'Too many pending writes: {e}', headers={'Retry-After': '1'})
+
+
+def _write(fn, *args, exclusive: bool = False, **kwargs):
+    """``_submit_write`` and wait for the result."""
+    return _submit_write(fn, *args, exclusive=exclusive, **kwargs).result()
+
+
+def _catalog_stats(table_name: str, version: int, acc, columns: List[str]):
+    """Queue the catalog write of statistics a read request had to scan;
+    skipped when the write queue is full, the next request scans again."""
+    try:
+        pool_for(DATABASE).writes.submit(catalog_stats, table_name, version, acc, columns)
+    except WriteQueueFull:
+        pass
+
+
+# Active dataset and file_metadata lookups, cached until the data changes
+datasets = DatasetRegistry(_reader)
+
+# Serialized report/analytics responses kept per data version; 0 disables the cache
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', str(64 * 1024 * 1024)))
+_responses = ResponseCache(RESPONSE_CACHE_BYTES)
+
+# Typed dataset columns shared by the pandas paths, kept per data version
+FRAME_CACHE_BYTES = int(os.getenv('FRAME_CACHE_BYTES', str(512 * 1024 * 1024)))
+_frames = FrameCache(FRAME_CACHE_BYTES)
+
+
+# Identical expensive computations running at once share one execution
+_flights = SingleFlight()
+
+
+def _request_params(kwargs: dict) -> str:
+    """Query/body parameters of an endpoint call, normalized to a key."""
+    return json.dumps({k: v for k, v in kwargs.items() if not k.startswith('_') and not isinstance(v, Request)},
+                      sort_keys=True, default=str)
+
+
+def _cached_entry(result) -> CachedResponse:
+    if isinstance(result, Response):
+        headers = tuple((k, v) for k, v in result.headers.items() if k not in ('content-length', 'content-type'))
+        return CachedResponse(bytes(result.body), result.media_type, headers)
+    return CachedResponse(JSONResponse(content=jsonable_encoder(result)).body, 'application/json', ())
+
+
+def _cached(endpoint: str, shared: bool = False):
+    """Serve a read endpoint from the response cache, keyed by its query/body
+    parameters and the data version. ``shared`` endpoints read the
+    transactions table, which other replicas change when DATABASE_URL is
+    set, so they are always computed then."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if RESPONSE_CACHE_BYTES <= 0 or (shared and storage.SHARED_STORAGE):
+                return fn(*args, **kwargs)
+            params = _request_params(kwargs)
+            version = datasets.version
+            entry = _responses.get(endpoint, params, version)
+            if entry is None:
+                entry = _cached_entry(fn(*args, **kwargs))
+                _responses.put(endpoint, params, version, entry)
+            return Response(content=entry.body, media_type=entry.media_type, headers=dict(entry.headers))
+        return wrapper
+    return decorate
+
+
+def _coalesced(endpoint: str):
+    """Run concurrent calls of an endpoint with the same parameters, at the
+    same data version, once; every caller gets that call's result."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (endpoint, _request_params(kwargs), datasets.version)
+            return _flights.do(key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def _etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(t.strip().removeprefix('W/') == tag for t in if_none_match.split(','))
+
+
+def _etag(endpoint: str, shared: bool = False):
+    """Strong ETag of a GET endpoint from its parameters and the data version.
+
+    A request whose If-None-Match holds the current tag is answered 304
+    before the endpoint runs. ``shared`` endpoints get no tag while
+    DATABASE_URL is set (see ``_cached``).
+    """
+    def decorate(fn):
+        signature = inspect.signature(fn)
+        parameters = list(signature.parameters.values())
+        parameters.append(inspect.Parameter('_request', inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+
+        @functools.wraps(fn)
+        def wrapper(*args, _request: Request, **kwargs):
+            if shared and storage.SHARED_STORAGE:
+                return fn(*args, **kwargs)
+            params = _request_params(kwargs)
+            digest = hashlib.sha256(f'{datasets.tag}:{endpoint}:{params}'.encode())
+            tag = f'"{digest.hexdigest()[:32]}"'
+            headers = {'ETag': tag, 'Cache-Control': 'private, no-cache'}
+            if _etag_matches(_request.headers.get('if-none-match'), tag):
+                return Response(status_code=304, headers=headers)
+            result = fn(*args, **kwargs)
+            if not isinstance(result, Response):
+                result = JSONResponse(content=jsonable_encoder(result))
+            result.headers.update(headers)
+            return result
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+    return decorate
+
+
+def _transactions_frame(conn) -> pd.DataFrame:
+    """Every transaction, from the shared database when DATABASE_URL is set
+    and borrowed from the frame cache otherwise."""
+    if storage.SHARED_STORAGE:
+        return storage.read_transactions()
+    return _load_frame(conn, 'transactions', dates=['date'])
+
 # Always load the .env that sits next to this file, regardless of current working directory
 ENV_PATH = Path(__file__).with_name('.env')
 load_dotenv(dotenv_path=str(ENV_PATH), encoding='utf-8')
@@ -122,17 +293,17 @@ except ImportError:  # support running as a module without package context
     from auth import create_access_token, get_current_user, verify_login, jwt_enabled
 
 
+# SUM() expression of a transaction's amount; init_db picks the form the
+# covering indexes can answer
+AMOUNT_SQL = 'amount'
+
 # Initialize enhanced database if available
 if ENHANCED_AUTH:
     init_enhanced_db()
 else:
     # Initialize legacy database
-    def init_db():
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        # Simple transactions table. In a real app we'd normalize.
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
+    TRANSACTIONS_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS {table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT,
             type TEXT,
@@ -141,23 +312,70 @@ else:
             price REAL,
             customer TEXT,
             region TEXT,
-            fingerprint TEXT
+            fingerprint TEXT,
+            amount REAL GENERATED ALWAYS AS (quantity * price) STORED
         )
-        ''')
+        '''
+
+    def _probe_amount_sql(c) -> str:
+        """``amount`` when SQLite answers SUM(amount) from the covering indexes.
+        SQLite 3.40 and older recompute a generated column from the table row,
+        so there the equivalent quantity * price, which the trailing index
+        columns cover, avoids the heap lookups."""
+        plan = c.execute('EXPLAIN QUERY PLAN SELECT SUM(amount) FROM transactions WHERE date >= ?', ('',)).fetchall()
+        return 'amount' if any('COVERING' in str(r[-1]) for r in plan) else '(quantity * price)'
+
+    def _add_transactions_amount(c):
+        """Rebuild transactions with the stored ``amount`` column (as migration
+        0002 does); SQLite can't add a STORED generated column in place."""
+        cols = 'id, date, type, product, quantity, price, customer, region, fingerprint'
+        c.execute(TRANSACTIONS_SCHEMA.format(table='transactions_new'))
+        c.execute(f'INSERT INTO transactions_new ({cols}) SELECT {cols} FROM transactions')
+        c.execute('DROP TABLE transactions')
+        c.execute('ALTER TABLE transactions_new RENAME TO transactions')
+
+    def _init_db(conn):
+        global AMOUNT_SQL
+        c = conn.cursor()
+        # Simple transactions table. In a real app we'd normalize.
+        c.execute(TRANSACTIONS_SCHEMA.format(table='transactions'))
         try:
-            cols = [r[1] for r in c.execute("PRAGMA table_info(transactions)").fetchall()]
+            cols = [r[1] for r in c.execute("PRAGMA table_xinfo(transactions)").fetchall()]
             if 'fingerprint' not in cols:
                 c.execute("ALTER TABLE transactions ADD COLUMN fingerprint TEXT")
-        except Exception:
-            pass
+                cols.append('fingerprint')
+            if 'amount' not in cols:
+                _add_transactions_amount(c)
+        except Exception as e:
+            logger.warning(f'Failed to migrate transactions table: {e}')
         # Indexes for performance and idempotency
         c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_product ON transactions(product)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_region ON transactions(region)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_customer ON transactions(customer)")
         c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_transactions_fingerprint ON transactions(fingerprint)")
-        conn.commit()
-        conn.close()
+        # Covering indexes for SUM(amount) over date ranges, per type / product / region /
+        # customer; quantity and price make them covering where SQLite recomputes amount
+        c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date_type_amount ON transactions(date, type, amount, quantity, price)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_product_date_amount ON transactions(product, date, amount, quantity, price)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_region_date_amount ON transactions(region, date, amount, quantity, price)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_customer_date_amount ON transactions(customer, date, amount, quantity, price)")
+        AMOUNT_SQL = _probe_amount_sql(c)
+        # Trigram index for substring search
+        if search_columns(conn, 'transactions') is None:
+            build_search_index(conn, 'transactions', TRANSACTION_SEARCH_COLUMNS)
+        # Daily rollup the reports and analytics endpoints aggregate over
+        if not rollup_available(conn):
+            build_rollup(conn)
+        # Catalog and job tables, so that requests never create them, which
+        # would wait for the write lock of an upload in progress
+        ensure_metadata_table(conn)
+        ensure_jobs_table(conn)
+        # The file may have been replaced while no process had it open
+        advance_store_version(conn)
+
+    def init_db():
+        _write(_init_db)
     
     init_db()
 
@@ -245,6 +463,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Structured logging
@@ -266,6 +485,35 @@ if METRICS_ENABLED:
     UPLOAD_ROWS_INSERTED = Counter('upload_rows_inserted_total', 'Rows inserted via upload')
     UPLOAD_ROWS_INVALID = Counter('upload_rows_invalid_total', 'Rows invalid via upload')
     UPLOAD_ROWS_DUPLICATE = Counter('upload_rows_duplicate_total', 'Rows duplicates via upload')
+    WRITE_QUEUE_DEPTH = Gauge('sqlite_write_queue_depth', 'Writes waiting for the SQLite writer thread')
+    WRITE_QUEUE_DEPTH.set_function(lambda: pool_for(DATABASE).writes.depth())
+    WRITE_QUEUE_REJECTED = Counter('sqlite_write_queue_rejected_total', 'Writes refused because the queue was full')
+    WRITE_COMMIT_TIME = Summary('sqlite_write_commit_latency_seconds',
+                                'Time from the start of a write transaction to its commit', ['kind'])
+    observe_writes(lambda kind, seconds: WRITE_COMMIT_TIME.labels(kind=kind).observe(seconds))
+    RESPONSE_CACHE_EVENTS = {
+        'hit': Counter('response_cache_hits_total', 'Responses served from the response cache', ['endpoint']),
+        'miss': Counter('response_cache_misses_total', 'Responses computed on a cache miss', ['endpoint']),
+        'eviction': Counter('response_cache_evictions_total', 'Responses evicted to stay within the byte limit',
+                            ['endpoint']),
+    }
+    RESPONSE_CACHE_SIZE = Gauge('response_cache_bytes', 'Bytes of responses held by the response cache')
+    RESPONSE_CACHE_SIZE.set_function(lambda: _responses.size)
+    _responses.observers.append(
+        lambda event, endpoint: RESPONSE_CACHE_EVENTS[event].labels(endpoint=endpoint).inc())
+    FRAME_CACHE_EVENTS = {
+        'hit': Counter('frame_cache_hits_total', 'Dataset columns borrowed from the frame cache'),
+        'miss': Counter('frame_cache_misses_total', 'Dataset columns read from storage on a cache miss'),
+        'eviction': Counter('frame_cache_evictions_total', 'Dataset columns evicted to stay within the byte limit'),
+    }
+    FRAME_CACHE_SIZE = Gauge('frame_cache_bytes', 'Bytes of dataset columns held by the frame cache')
+    FRAME_CACHE_SIZE.set_function(lambda: _frames.size)
+    _frames.observers.append(lambda event, table: FRAME_CACHE_EVENTS[event].inc())
+    COALESCED_REQUESTS = Counter('coalesced_requests_total',
+                                 'Requests that waited for an identical in-flight computation', ['endpoint'])
+    COMPUTATIONS_IN_FLIGHT = Gauge('coalesced_computations_in_flight', 'Coalescable computations running')
+    COMPUTATIONS_IN_FLIGHT.set_function(lambda: len(_flights))
+    _flights.observers.append(lambda event, endpoint: COALESCED_REQUESTS.labels(endpoint=endpoint).inc())
 
     @app.middleware('http')
     async def metrics_middleware(request: Request, call_next):
@@ -307,6 +555,263 @@ def rl_upload(request: Request):
 def rl_ai(request: Request):
     _rate_check('ai', _client_key(request))
 
+# ------------------ Upload workers ------------------
+# Parsing and storing uploads is CPU-bound, so it runs in a worker process
+# instead of on the event loop. Uploads are serialized (see _upload_slot), so
+# one worker is all they can keep busy and larger values are capped at 1;
+# UPLOAD_WORKERS=0 runs the ingest in the upload thread instead.
+UPLOAD_WORKERS = min(int(os.getenv('UPLOAD_WORKERS', '1')), 1)
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR') or None
+# Rows per chunk written by the streaming CSV exports
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '5000'))
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+_ingest_pool: Optional[ProcessPoolExecutor] = None
+# Uploads are ingested one at a time from this thread, outside the writer
+# queue: each holds SQLite's write lock for its whole transaction, so they'd
+# only queue up on it anyway, and the small writes queued for the writer
+# thread wait for the ingest in progress at most, not for every pending upload
+_upload_slot: Optional[ThreadPoolExecutor] = None
+
+def _get_ingest_pool() -> Optional[ProcessPoolExecutor]:
+    global _ingest_pool
+    if UPLOAD_WORKERS <= 0:
+        return None
+    if _ingest_pool is None:
+        _ingest_pool = ProcessPoolExecutor(max_workers=UPLOAD_WORKERS)
+    return _ingest_pool
+
+def _get_upload_slot() -> ThreadPoolExecutor:
+    global _upload_slot
+    if _upload_slot is None:
+        _upload_slot = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload')
+    return _upload_slot
+
+@app.on_event('shutdown')
+def _shutdown_ingest_pool():
+    global _ingest_pool, _upload_slot
+    if _upload_slot is not None:
+        _upload_slot.shutdown(wait=False, cancel_futures=True)
+        _upload_slot = None
+    if _ingest_pool is not None:
+        _ingest_pool.shutdown(wait=False, cancel_futures=True)
+        _ingest_pool = None
+
+@app.on_event('shutdown')
+def _close_db_pools():
+    close_pools()
+    storage.dispose()
+
+async def _spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """Copy the upload to a named temp file that worker processes can open,
+    hashing it on the way. Returns (path, sha256 hex digest).
+    """
+    suffix = os.path.splitext(file.filename or '')[1]
+    fd, path = tempfile.mkstemp(prefix='upload_', suffix=suffix, dir=UPLOAD_TMP_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = await file.read(UPLOAD_SPOOL_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def _ingest_fileobj(fileobj, filename: str, table_name: str, content_hash: Optional[str], append: bool) -> dict:
+    conn = connect(DATABASE)
+    try:
+        return ingest_into(conn, fileobj, filename, table_name, content_hash=content_hash, append=append)
+    finally:
+        conn.close()
+
+def _ingest_in_thread(fileobj, filename: str, table_name: str, content_hash: Optional[str] = None,
+                      append: bool = False) -> dict:
+    return _get_upload_slot().submit(_ingest_fileobj, fileobj, filename, table_name, content_hash,
+                                     append).result()
+
+def _ingest_in_slot(pool: Optional[ProcessPoolExecutor], job: Optional[dict], *args):
+    """Store the upload job's row, then run ingest_file (in a worker process
+    when there is a pool); it writes through its own connection."""
+    if job is not None:
+        _with_job_db(create_job, job)
+    if pool is None:
+        return ingest_file(DATABASE, *args)
+    return pool.submit(ingest_file, DATABASE, *args).result()
+
+async def _ingest_spooled(path: str, filename: str, table_name: str, job_id: Optional[str] = None,
+                          content_hash: Optional[str] = None, append: bool = False) -> dict:
+    job = _upload_jobs.get(job_id) if job_id else None
+    progress = job['progress'] if job else None
+    future = _get_upload_slot().submit(_ingest_in_slot, _get_ingest_pool(), job['job'] if job else None,
+                                       path, filename, table_name, progress, job_id, content_hash, append)
+    if job:
+        job['future'] = future
+    return await asyncio.wrap_future(future)
+
+def _find_duplicate_upload(content_hash: str) -> Optional[dict]:
+    conn = _reader()
+    try:
+        return find_by_content_hash(conn, content_hash)
+    finally:
+        conn.close()
+
+def _load_dataset_for_append(table_name: str, content_hash: str):
+    """(file_metadata, earlier identical append) for an append target."""
+    conn = _reader()
+    try:
+        file_metadata = load_file_metadata(conn, table_name)
+        if file_metadata is None:
+            return None, None
+        return file_metadata, find_version_by_hash(conn, table_name, content_hash)
+    finally:
+        conn.close()
+
+# ------------------ Background upload jobs ------------------
+# Live progress of jobs running in this process; the upload_jobs table holds
+# the persisted state (written on creation, completion and failure).
+_upload_jobs: dict = {}
+_progress_manager = None
+
+def _new_progress():
+    """A progress mapping the ingest can update from a worker process."""
+    global _progress_manager
+    if _get_ingest_pool() is None:
+        return {}
+    if _progress_manager is None:
+        _progress_manager = multiprocessing.Manager()
+    return _progress_manager.dict()
+
+def _job_write(conn, fn, *args, **kwargs):
+    ensure_jobs_table(conn)
+    return fn(conn, *args, **kwargs)
+
+def _with_job_db(fn, *args, **kwargs):
+    return _write(_job_write, fn, *args, **kwargs)
+
+def _read_job(job_id: str) -> Optional[dict]:
+    conn = _reader()
+    try:
+        ensure_jobs_table(conn)
+        return load_job(conn, job_id)
+    finally:
+        conn.close()
+
+def _find_job(job_id: str) -> Optional[dict]:
+    """The stored job, or a live one whose row isn't written yet (it is
+    written when its ingest starts, see _ingest_in_slot)."""
+    job = _read_job(job_id)
+    live = _upload_jobs.get(job_id)
+    if job is None and live:
+        job = {**dict.fromkeys(JOB_FIELDS), **live['job']}
+    return job
+
+def _job_view(job: dict) -> dict:
+    live = _upload_jobs.get(job['id'])
+    if live and job['status'] in ('queued', 'running'):
+        progress = dict(live['progress'])
+        job['phase'] = progress.get('phase', job['phase'])
+        job['rows_parsed'] = progress.get('rows_parsed', job['rows_parsed'])
+        job['rows_inserted'] = progress.get('rows_inserted', job['rows_inserted'])
+        started_at = progress.get('started_at')
+        if started_at:
+            job['status'] = 'running'
+            elapsed = time.time() - started_at
+            job['rows_per_second'] = round(job['rows_inserted'] / elapsed, 1) if elapsed > 0 else None
+        if progress.get('cancel'):
+            job['status'] = 'cancelling'
+    job.pop('owner_pid', None)
+    return clean_nan_values(job)
+
+def _mark_interrupted_jobs(conn):
+    """Jobs left queued/running by a dead API process can never finish."""
+    rows = conn.execute("SELECT id, owner_pid FROM upload_jobs WHERE status IN ('queued','running')").fetchall()
+    for job_id, owner_pid in rows:
+        if job_id in _upload_jobs:
+            continue
+        alive = False
+        if owner_pid and owner_pid != os.getpid():
+            try:
+                os.kill(owner_pid, 0)
+                alive = True
+            except OSError:
+                alive = False
+        if not alive:
+            update_job(conn, job_id, status='failed', phase='interrupted', error='Interrupted by server restart')
+
+@app.on_event('startup')
+def _recover_upload_jobs():
+    try:
+        _with_job_db(_mark_interrupted_jobs)
+    except Exception as e:
+        logger.warning(f"Failed to recover upload jobs: {e}")
+
+def _settle_job(conn, job: dict, **fields):
+    """update_job, unless the ingest already committed the job as succeeded;
+    a job that ended before its ingest started gets its row here."""
+    stored = load_job(conn, job['id'])
+    if stored is None:
+        create_job(conn, {**job, **fields})
+    elif stored['status'] != 'succeeded':
+        update_job(conn, job['id'], **fields)
+
+async def _committed_ingest(job_id: str) -> Optional[dict]:
+    """After a cancel: the result of the job's ingest if it committed anyway,
+    None when it was rolled back or never started. A still running ingest is
+    asked to stop and waited for."""
+    live = _upload_jobs.get(job_id)
+    future = live.get('future') if live else None
+    if future is not None:
+        live['progress']['cancel'] = True
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except (Exception, asyncio.CancelledError):
+            pass
+    # The ingest marks its job succeeded in the transaction that commits the data
+    job = await run_in_threadpool(_read_job, job_id)
+    return job['result'] if job and job['status'] == 'succeeded' else None
+
+async def _run_upload_job(job_id: str, path: str, filename: str, table_name: str, content_hash: str, user,
+                          append: bool = False):
+    fields = None
+    try:
+        file_metadata = await _ingest_spooled(path, filename, table_name, job_id, content_hash, append)
+        _after_ingest(file_metadata, filename, user)
+    except (IngestCancelled, asyncio.CancelledError, concurrent.futures.CancelledError):
+        file_metadata = await _committed_ingest(job_id)
+        if file_metadata is None:
+            fields = {'status': 'cancelled', 'phase': 'cancelled'}
+        else:
+            try:
+                _after_ingest(file_metadata, filename, user)
+            except Exception as e:
+                logger.warning(f"Post-ingest step of upload job {job_id} failed: {e}")
+    except (SchemaMismatchError, DatasetNotFoundError, DatasetExistsError) as e:
+        fields = {'status': 'failed', 'phase': 'failed', 'error': str(e)}
+    except UploadParseError as e:
+        fields = {'status': 'failed', 'phase': 'failed', 'error': f'Failed to parse file: {str(e)}'}
+    except EmptyUploadError:
+        fields = {'status': 'failed', 'phase': 'failed', 'error': 'File contains no data'}
+    except Exception as e:
+        fields = {'status': 'failed', 'phase': 'failed', 'error': f'Failed to store data: {str(e)}'}
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    try:
+        if fields:
+            live = _upload_jobs[job_id]
+            fields['rows_parsed'] = dict(live['progress']).get('rows_parsed', 0)
+            await run_in_threadpool(_with_job_db, _settle_job, live['job'], **fields)
+    except Exception as e:
+        logger.warning(f"Failed to persist state of upload job {job_id}: {e}")
+    finally:
+        _upload_jobs.pop(job_id, None)
+
 # Cache for last upload invalid rows as CSV
 LAST_UPLOAD_ERROR_CSV: Optional[str] = None
 
@@ -325,7 +830,7 @@ def health():
 def debug_database_info():
     """Debug endpoint to check database state and uploaded data"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         cursor = conn.cursor()
         
         # Get all data tables
@@ -341,13 +846,17 @@ def debug_database_info():
             'datasets': []
         }
         
-        # Check each table's structure
+        # Check each table's structure; datasets answer from file_metadata
         for table in tables[:5]:  # Check first 5
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            row_count = cursor.fetchone()[0]
+            file_metadata = load_file_metadata(conn, table)
+            if file_metadata:
+                columns = file_metadata['columns']
+                row_count = file_metadata['row_count']
+            else:
+                cursor.execute(f"PRAGMA table_info({table})")
+                columns = [row[1] for row in cursor.fetchall()]
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                row_count = cursor.fetchone()[0]
             
             dataset_info = {
                 'table': table,
@@ -382,9 +891,11 @@ def debug_database_info():
 @app.get('/readyz')
 def readyz():
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         conn.execute('SELECT 1')
         conn.close()
+        if storage.SHARED_STORAGE:
+            storage.ping()
         return {"status":"ready"}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f'Readiness check failed: {e}')
@@ -403,354 +914,479 @@ def csv_template():
     return Response(content=csv_text, media_type='text/csv', headers=headers)
 
 
-@app.get('/export/summary')
-def export_summary(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    
-    # Get the latest uploaded dataset
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT table_name FROM file_metadata 
-    ORDER BY upload_timestamp DESC LIMIT 1
-    """)
-    result = cursor.fetchone()
-    
-    if not result:
-        # Fallback to legacy transactions table if no uploads
-        table_name = 'transactions'
+def _load_frame(conn, table_name: str, columns: Optional[List[str]] = None,
+                dates: Sequence[str] = (), pinned: Optional[ActiveDataset] = None) -> pd.DataFrame:
+    """The given columns of a dataset (all when none of them exist), borrowed
+    from the frame cache; the ones in ``dates`` are parsed as datetimes.
+
+    Columns missing from the cache are read from the dataset's Parquet
+    sidecar when it has one and from SQLite otherwise. The frame shares
+    memory with the cache, see frame_cache.
+
+    ``pinned`` is the dataset as a read transaction on ``conn`` saw it (see
+    _ExportSource). Its columns are read from that snapshot, bypassing the
+    cache (which holds the latest version) and the sidecar (whose parts a
+    re-created table replaces under the same version number).
+    """
+    file_metadata = None if pinned else datasets.metadata(table_name)
+    if file_metadata:
+        available = file_metadata['columns']
+    else:
+        available = [r[1] for r in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+    wanted = [c for c in dict.fromkeys(columns or []) if c in available] or available
+
+    def load(names: List[str]) -> pd.DataFrame:
+        if file_metadata:
+            df = read_dataset(DATABASE, table_name, file_metadata['version'] or 1, names)
+            if df is not None:
+                return df
+        projection = ', '.join(f'"{c}"' for c in names)
+        return pd.read_sql_query(f'SELECT {projection} FROM "{table_name}" ORDER BY rowid', conn)
+    if pinned:
+        return typed_frame(load(wanted), [d for d in dates if d])
+    return _frames.frame(table_name, datasets.version, wanted, load, [d for d in dates if d])
+
+
+def _engine_dataset(conn, table_name: str, pinned: Optional[ActiveDataset] = None) -> Optional[dict]:
+    """file_metadata of a dataset the analytics engine can query; None when
+    the engine is off, the table is not an uploaded dataset or the caller
+    reads a ``pinned`` snapshot (see _load_frame)."""
+    if not DUCKDB_ENABLED or pinned:
+        return None
+    return datasets.metadata(table_name)
+
+
+def _analytics_rows(conn, table_name: str, sql: str, params: Sequence = (), attach: bool = True,
+                    pinned: Optional[ActiveDataset] = None) -> list:
+    """Rows of ``sql`` (SQLite dialect, over ``table_name``) from the analytics
+    engine when it can answer, else from SQLite. ``attach=False`` keeps the
+    engine to the Parquet parts of the version ``conn`` sees; ``pinned``
+    keeps the query in SQLite, on the caller's read transaction."""
+    file_metadata = _engine_dataset(conn, table_name, pinned)
+    if file_metadata is not None:
+        rows = fetch_rows(DATABASE, table_name, file_metadata['version'] or 1, sql, params, attach)
+        if rows is not None:
+            return rows
+    return conn.execute(sql, params).fetchall()
+
+
+def _analytics_frame(conn, table_name: str, sql: str, params: Sequence = ()) -> pd.DataFrame:
+    """``_analytics_rows`` as a DataFrame."""
+    file_metadata = _engine_dataset(conn, table_name)
+    if file_metadata is not None:
+        df = fetch_frame(DATABASE, table_name, file_metadata['version'] or 1, sql, params)
+        if df is not None:
+            return df
+    return pd.read_sql_query(sql, conn, params=list(params))
+
+
+
+def _sql_date_range(roles: dict, start_date: Optional[str], end_date: Optional[str]):
+    """WHERE terms and params of a start/end date range, or None when the
+    dataset's dates are not ISO strings (and so don't compare correctly as text)."""
+    where, params = [], []
+    date_col = roles.get('date')
+    if date_col and (start_date or end_date):
+        if not roles.get('date_iso') or not all(is_iso_date(d) for d in (start_date, end_date) if d):
+            return None
+        if start_date:
+            where.append(f'"{date_col}" >= ?')
+            params.append(start_date)
+        if end_date:
+            where.append(f'"{date_col}" <= ?')
+            params.append(end_date)
+    return where, params
+
+
+def _sql_measures(roles: dict, price_col: Optional[str]) -> bool:
+    """The quantity and price columns are stored as numbers, so SQLite sums them like pandas."""
+    numeric = set(roles.get('numeric') or []) - set(roles.get('numeric_text') or [])
+    return not any(c and c not in numeric for c in (roles.get('quantity'), price_col))
+
+
+def _sql_group_amounts(conn, table_name: str, roles: dict, key_col: str, price_col: Optional[str],
+                       start_date: Optional[str] = None, end_date: Optional[str] = None,
+                       pinned: Optional[ActiveDataset] = None):
+    """(key, amount, quantity, rows) per group of ``key_col``, aggregated by SQLite.
+
+    amount is SUM(quantity * price) when the dataset has both roles and
+    SUM(price) otherwise. Returns None when SQL can't reproduce the pandas
+    result: measures stored as text, or a date range over dates that are not
+    ISO strings.
+    """
+    qty_col = roles.get('quantity')
+    date_range = _sql_date_range(roles, start_date, end_date)
+    if not _sql_measures(roles, price_col) or date_range is None:
+        return None
+    where, params = date_range
+    where = [f'"{key_col}" IS NOT NULL'] + where
+    if qty_col and price_col:
+        amount = f'TOTAL("{qty_col}" * "{price_col}")'
+    elif price_col:
+        amount = f'TOTAL("{price_col}")'
+    else:
+        amount = '0'
+    quantity = f'TOTAL("{qty_col}")' if qty_col else '0'
+    return _analytics_rows(conn, table_name, f"""
+    SELECT "{key_col}", {amount}, {quantity}, COUNT(*)
+    FROM "{table_name}"
+    WHERE {' AND '.join(where)}
+    GROUP BY "{key_col}"
+    ORDER BY "{key_col}"
+    """, params, attach=False, pinned=pinned)
+
+
+def _sql_summary(conn, table_name: str, roles: dict, start_date: Optional[str] = None,
+                 end_date: Optional[str] = None, pinned: Optional[ActiveDataset] = None):
+    """(total_sales, total_purchases, rows) of the summary export, computed by
+    SQLite; None when it has to fall back to pandas, as for _sql_group_amounts."""
+    type_col, qty_col, price_col = roles.get('type'), roles.get('quantity'), roles.get('price')
+    date_range = _sql_date_range(roles, start_date, end_date)
+    if not _sql_measures(roles, price_col) or date_range is None:
+        return None
+    where, params = date_range
+    if qty_col and price_col:
+        amount = f'"{qty_col}" * "{price_col}"'
+    elif price_col:
+        amount = f'"{price_col}"'
+    else:
+        amount = '1'
+    if type_col:
+        kind = f'lower(CAST("{type_col}" AS TEXT))'
+        sales = f"TOTAL(CASE WHEN {kind} = 'sale' THEN {amount} END)"
+        purchases = f"TOTAL(CASE WHEN {kind} = 'purchase' THEN {amount} END)"
     else:
-        table_name = result[0]
+        sales, purchases = f'TOTAL({amount})', '0'
+    sql = f'SELECT {sales}, {purchases}, COUNT(*) FROM "{table_name}"'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return _analytics_rows(conn, table_name, sql, params, attach=False, pinned=pinned)[0]
+
+
+def _filtered_frame(conn, table_name: str, roles: dict, columns: List[Optional[str]],
+                    start_date: Optional[str], end_date: Optional[str],
+                    pinned: Optional[ActiveDataset] = None) -> pd.DataFrame:
+    date_col = roles.get('date')
+    df = _load_frame(conn, table_name, [date_col] + columns, dates=[date_col], pinned=pinned)
     
-    # Check if table exists
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    if not cursor.fetchone():
-        conn.close()
-        return Response(content="metric,value\nno_data,0\n", media_type='text/csv', 
-                       headers={"Content-Disposition": "attachment; filename=summary.csv"})
+    if date_col and start_date:
+        df = df[df[date_col] >= start_date]
+    if date_col and end_date:
+        df = df[df[date_col] <= end_date]
+    return df
+
+
+class _ExportSource:
+    """The latest dataset as seen by one export request.
+
+    All reports of the request read through the same connection, and the
+    pandas fallbacks share a single filtered frame, loaded on first use.
+
+    With ``pinned``, ``conn`` holds a read transaction: the dataset is
+    resolved through it and every report reads that snapshot (see
+    _load_frame).
+    """
+
+    def __init__(self, conn, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                 pinned: bool = False):
+        self.conn = conn
+        self.start_date = start_date
+        self.end_date = end_date
+        active = load_active(conn) if pinned else datasets.active()
+        self.pinned = active if pinned else None
+        self.table_name, self.columns, self.roles, self.exists = \
+            active.table_name, active.columns, active.roles, active.exists
+        self._frame = None
+
+    def frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            wanted = [self.roles.get(r) for r in ('type', 'quantity', 'price', 'value', 'product', 'region', 'customer')]
+            self._frame = _filtered_frame(self.conn, self.table_name, self.roles, wanted,
+                                          self.start_date, self.end_date, self.pinned)
+        return self._frame
+
+
+def _pandas_by_product(df, product_col, qty_col, price_col):
+    if qty_col and price_col:
+        df = df.assign(amount=df[qty_col] * df[price_col])
+        grouped = df.groupby(product_col).agg({'amount':'sum', qty_col:'sum'}).reset_index()
+        grouped.columns = ['product', 'amount', 'quantity']
+    elif price_col:
+        grouped = df.groupby(product_col)[price_col].sum().reset_index()
+        grouped.columns = ['product', 'amount']
+        grouped['quantity'] = 0
+    else:
+        grouped = df.groupby(product_col).size().reset_index(name='count')
+        grouped['amount'] = 0
+        grouped['quantity'] = grouped['count']
+        grouped = grouped[['product', 'amount', 'quantity']]
+    return grouped
+
+
+def _pandas_group_amount(df, key_col, qty_col, price_col):
+    if qty_col and price_col:
+        df = df.assign(amount=df[qty_col] * df[price_col])
+        grouped = df.groupby(key_col)['amount'].sum().reset_index()
+    elif price_col:
+        grouped = df.groupby(key_col)[price_col].sum().reset_index()
+        grouped.columns = [key_col, 'amount']
+    else:
+        grouped = df.groupby(key_col).size().reset_index(name='amount')
+    return grouped
+
+
+def _summary_csv(src: _ExportSource) -> str:
+    if not src.exists:
+        return "metric,value\nno_data,0\n"
     
-    # Try to read with date column detection
+    roles = src.roles
     try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        # Auto-detect date column
-        date_col = None
-        for col in df.columns:
-            if 'date' in col.lower():
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-                date_col = col
-                break
-        
-        # Apply date filters
-        if date_col and start_date:
-            df = df[df[date_col] >= start_date]
-        if date_col and end_date:
-            df = df[df[date_col] <= end_date]
-        
-        # Calculate summary based on available columns
-        sales = df[df.get('type', df.get('Type', pd.Series())).astype(str).str.lower()=='sale'] if 'type' in df.columns or 'Type' in df.columns else df
-        purchases = df[df.get('type', df.get('Type', pd.Series())).astype(str).str.lower()=='purchase'] if 'type' in df.columns or 'Type' in df.columns else pd.DataFrame()
-        
-        # Calculate totals based on available columns
-        qty_col = next((c for c in df.columns if 'quantity' in c.lower() or 'qty' in c.lower()), None)
-        price_col = next((c for c in df.columns if 'price' in c.lower() or 'amount' in c.lower()), None)
-        
-        if qty_col and price_col:
-            total_sales = (sales[qty_col] * sales[price_col]).sum()
-            total_purchases = (purchases[qty_col] * purchases[price_col]).sum() if not purchases.empty else 0
-        elif price_col:
-            total_sales = sales[price_col].sum()
-            total_purchases = purchases[price_col].sum() if not purchases.empty else 0
+        totals = _sql_summary(src.conn, src.table_name, roles, src.start_date, src.end_date, src.pinned)
+        if totals is not None:
+            total_sales, total_purchases, rows = totals
         else:
-            total_sales = len(sales)
-            total_purchases = len(purchases)
+            df = src.frame()
+            
+            # Calculate summary based on available columns
+            type_col = roles.get('type')
+            sales = df[df[type_col].astype(str).str.lower()=='sale'] if type_col else df
+            purchases = df[df[type_col].astype(str).str.lower()=='purchase'] if type_col else pd.DataFrame()
+            
+            # Calculate totals based on available columns
+            qty_col = roles.get('quantity')
+            price_col = roles.get('price')
+            
+            if qty_col and price_col:
+                total_sales = (sales[qty_col] * sales[price_col]).sum()
+                total_purchases = (purchases[qty_col] * purchases[price_col]).sum() if not purchases.empty else 0
+            elif price_col:
+                total_sales = sales[price_col].sum()
+                total_purchases = purchases[price_col].sum() if not purchases.empty else 0
+            else:
+                total_sales = len(sales)
+                total_purchases = len(purchases)
+            rows = len(df)
         
         profit = total_sales - total_purchases
         
     except Exception as e:
-        conn.close()
         logger.warning(f"Export summary error: {e}")
-        return Response(content=f"metric,value\nerror,{str(e)}\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=summary.csv"})
+        return f"metric,value\nerror,{str(e)}\n"
     
-    conn.close()
-    out = (
+    return (
         "metric,value\n"
         f"total_sales,{float(total_sales)}\n"
         f"total_purchases,{float(total_purchases)}\n"
         f"profit,{float(profit)}\n"
-        f"rows,{len(df)}\n"
+        f"rows,{rows}\n"
     )
-    headers = {"Content-Disposition": "attachment; filename=summary.csv"}
-    return Response(content=out, media_type='text/csv', headers=headers)
 
 
-@app.get('/export/by_product')
-def export_by_product(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    
-    # Get the latest uploaded dataset
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT table_name FROM file_metadata 
-    ORDER BY upload_timestamp DESC LIMIT 1
-    """)
-    result = cursor.fetchone()
-    
-    if not result:
-        table_name = 'transactions'
-    else:
-        table_name = result[0]
-    
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    if not cursor.fetchone():
-        conn.close()
-        return Response(content="product,amount,quantity\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_product.csv"})
+def _by_product_csv(src: _ExportSource) -> str:
+    roles = src.roles
+    product_col = roles.get('product')
+    if not src.exists or not product_col:
+        return "product,amount,quantity\n"
     
     try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        conn.close()
-        
-        # Auto-detect date column
-        date_col = None
-        for col in df.columns:
-            if 'date' in col.lower():
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-                date_col = col
-                break
-        
-        if date_col and start_date:
-            df = df[df[date_col] >= start_date]
-        if date_col and end_date:
-            df = df[df[date_col] <= end_date]
-        
-        # Find product column
-        product_col = next((c for c in df.columns if 'product' in c.lower() or 'item' in c.lower()), None)
-        if not product_col:
-            return Response(content="product,amount,quantity\n", media_type='text/csv',
-                           headers={"Content-Disposition": "attachment; filename=by_product.csv"})
-        
         # Calculate amounts
-        qty_col = next((c for c in df.columns if 'quantity' in c.lower() or 'qty' in c.lower()), None)
-        price_col = next((c for c in df.columns if 'price' in c.lower() or 'amount' in c.lower()), None)
-        
-        if qty_col and price_col:
-            df['amount'] = df[qty_col] * df[price_col]
-            grouped = df.groupby(product_col).agg({'amount':'sum', qty_col:'sum'}).reset_index()
-            grouped.columns = ['product', 'amount', 'quantity']
-        elif price_col:
-            grouped = df.groupby(product_col)[price_col].sum().reset_index()
-            grouped.columns = ['product', 'amount']
-            grouped['quantity'] = 0
+        qty_col = roles.get('quantity')
+        price_col = roles.get('price')
+        
+        # Aggregate in SQLite; pandas is only the fallback
+        rows = _sql_group_amounts(src.conn, src.table_name, roles, product_col, price_col,
+                                  src.start_date, src.end_date, src.pinned)
+        if rows is not None:
+            grouped = pd.DataFrame(rows, columns=['product', 'amount', 'quantity', 'count'])
+            if not price_col:
+                grouped['amount'] = 0
+                grouped['quantity'] = grouped['count']
+            elif not qty_col:
+                grouped['quantity'] = 0
         else:
-            grouped = df.groupby(product_col).size().reset_index(name='count')
-            grouped['amount'] = 0
-            grouped['quantity'] = grouped['count']
-            grouped = grouped[['product', 'amount', 'quantity']]
+            grouped = _pandas_by_product(src.frame(), product_col, qty_col, price_col)
         
         # Build CSV
         lines = ["product,amount,quantity"]
         for _, row in grouped.iterrows():
             lines.append(f"{row['product']},{float(row['amount'])},{float(row.get('quantity', 0))}")
-        out = "\n".join(lines) + "\n"
+        return "\n".join(lines) + "\n"
         
     except Exception as e:
         logger.warning(f"Export by_product error: {e}")
-        return Response(content=f"product,amount,quantity\nerror,{str(e)},0\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_product.csv"})
-    
-    headers = {"Content-Disposition": "attachment; filename=by_product.csv"}
-    return Response(content=out, media_type='text/csv', headers=headers)
+        return f"product,amount,quantity\nerror,{str(e)},0\n"
 
 
-@app.get('/export/by_region')
-def export_by_region(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    
-    # Get the latest uploaded dataset
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT table_name FROM file_metadata 
-    ORDER BY upload_timestamp DESC LIMIT 1
-    """)
-    result = cursor.fetchone()
-    
-    if not result:
-        table_name = 'transactions'
-    else:
-        table_name = result[0]
-    
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    if not cursor.fetchone():
-        conn.close()
-        return Response(content="region,amount\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_region.csv"})
+def _group_amount_csv(src: _ExportSource, role: str) -> str:
+    """by_region / by_customer: the value amount per group of the ``role`` column."""
+    roles = src.roles
+    key_col = roles.get(role)
+    if not src.exists or not key_col:
+        return f"{role},amount\n"
     
     try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        conn.close()
-        
-        # Auto-detect date column
-        date_col = None
-        for col in df.columns:
-            if 'date' in col.lower():
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-                date_col = col
-                break
-        
-        if date_col and start_date:
-            df = df[df[date_col] >= start_date]
-        if date_col and end_date:
-            df = df[df[date_col] <= end_date]
-        
-        # Find region column
-        region_col = next((c for c in df.columns if 'region' in c.lower() or 'location' in c.lower() or 'area' in c.lower()), None)
-        if not region_col:
-            return Response(content="region,amount\n", media_type='text/csv',
-                           headers={"Content-Disposition": "attachment; filename=by_region.csv"})
-        
         # Calculate amounts
-        qty_col = next((c for c in df.columns if 'quantity' in c.lower() or 'qty' in c.lower()), None)
-        price_col = next((c for c in df.columns if 'price' in c.lower() or 'amount' in c.lower() or 'sales' in c.lower()), None)
-        
-        if qty_col and price_col:
-            df['amount'] = df[qty_col] * df[price_col]
-            grouped = df.groupby(region_col)['amount'].sum().reset_index()
-        elif price_col:
-            grouped = df.groupby(region_col)[price_col].sum().reset_index()
-            grouped.columns = [region_col, 'amount']
+        qty_col = roles.get('quantity')
+        price_col = roles.get('value')
+        
+        # Aggregate in SQLite; pandas is only the fallback
+        rows = _sql_group_amounts(src.conn, src.table_name, roles, key_col, price_col,
+                                  src.start_date, src.end_date, src.pinned)
+        if rows is not None:
+            grouped = pd.DataFrame([(r[0], r[1] if price_col else r[3]) for r in rows],
+                                   columns=[key_col, 'amount'])
         else:
-            grouped = df.groupby(region_col).size().reset_index(name='amount')
+            grouped = _pandas_group_amount(src.frame(), key_col, qty_col, price_col)
         
-        lines = ["region,amount"]
+        lines = [f"{role},amount"]
         for _, row in grouped.iterrows():
-            lines.append(f"{row[region_col]},{float(row['amount'])}")
-        out = "\n".join(lines) + "\n"
+            lines.append(f"{row[key_col]},{float(row['amount'])}")
+        return "\n".join(lines) + "\n"
         
     except Exception as e:
-        logger.warning(f"Export by_region error: {e}")
-        return Response(content=f"region,amount\nerror,{str(e)}\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_region.csv"})
-    
-    headers = {"Content-Disposition": "attachment; filename=by_region.csv"}
+        logger.warning(f"Export by_{role} error: {e}")
+        return f"{role},amount\nerror,{str(e)}\n"
+
+
+def _csv_export(build, filename: str, start_date: Optional[str], end_date: Optional[str]) -> Response:
+    conn = _reader()
+    try:
+        out = build(_ExportSource(conn, start_date, end_date))
+    finally:
+        conn.close()
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
     return Response(content=out, media_type='text/csv', headers=headers)
 
 
+@app.get('/export/summary')
+@_etag('/export/summary')
+@_cached('/export/summary')
+def export_summary(start_date: str = None, end_date: str = None):
+    return _csv_export(_summary_csv, 'summary.csv', start_date, end_date)
+
+
+@app.get('/export/by_product')
+@_etag('/export/by_product')
+@_cached('/export/by_product')
+def export_by_product(start_date: str = None, end_date: str = None):
+    return _csv_export(_by_product_csv, 'by_product.csv', start_date, end_date)
+
+
+@app.get('/export/by_region')
+@_etag('/export/by_region')
+@_cached('/export/by_region')
+def export_by_region(start_date: str = None, end_date: str = None):
+    return _csv_export(lambda src: _group_amount_csv(src, 'region'), 'by_region.csv', start_date, end_date)
+
+
 @app.get('/export/by_customer')
+@_etag('/export/by_customer')
+@_cached('/export/by_customer')
 def export_by_customer(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    
-    # Get the latest uploaded dataset
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT table_name FROM file_metadata 
-    ORDER BY upload_timestamp DESC LIMIT 1
-    """)
-    result = cursor.fetchone()
-    
-    if not result:
-        table_name = 'transactions'
-    else:
-        table_name = result[0]
-    
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    if not cursor.fetchone():
-        conn.close()
-        return Response(content="customer,amount\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_customer.csv"})
-    
+    return _csv_export(lambda src: _group_amount_csv(src, 'customer'), 'by_customer.csv', start_date, end_date)
+
+
+def _search_terms(conn, table_name: str, search: Optional[str], columns: List[str]):
+    """WHERE terms and params of an export search: the table's trigram index,
+    or a case-insensitive scan of ``columns`` when it can't be used."""
+    if not search:
+        return [], []
+    fts = search_filter(conn, table_name, search)
+    if fts:
+        return [fts[0]], fts[1]
+    columns = search_columns(conn, table_name) or columns
+    term = '(' + ' OR '.join(f'instr(lower(CAST("{c}" AS TEXT)), ?) > 0' for c in columns) + ')'
+    return [term], [search.lower()] * len(columns)
+
+
+def _transactions_query(table_name: str, roles: dict, start_date=None, end_date=None, product=None, region=None,
+                        customer=None, search_terms=None, sort_by='date', sort_dir='desc', limit=None, offset=None,
+                        columns: Optional[List[str]] = None):
+    """SELECT (sql, params) for the transactions export, with every filter,
+    the sort and the page pushed into SQLite; None when the dates are not ISO
+    strings, which pandas parses and writes out as ISO whatever the sort.
+
+    ``search_terms`` are the (terms, params) from _search_terms.
+    """
+    columns = columns or []
+    date_col = roles.get('date')
+    if date_col and not roles.get('date_iso'):
+        return None
+    date_range = _sql_date_range(roles, start_date, end_date)
+    if date_range is None:
+        return None
+    where, params = date_range
+    for value, col in ((product, roles.get('product')), (region, roles.get('region')),
+                       (customer, roles.get('customer'))):
+        if value and col:
+            where.append(f'"{col}" = ?')
+            params.append(value)
+    if search_terms:
+        where.extend(search_terms[0])
+        params.extend(search_terms[1])
+    sql = f'SELECT * FROM "{table_name}"'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    order_col = sort_by if sort_by in columns else date_col
+    if order_col:
+        direction = 'DESC' if sort_dir.lower() == 'desc' else 'ASC'
+        # NULLs last in both directions, as pandas sorts them; rowid keeps
+        # pages stable across requests
+        sql += f' ORDER BY ("{order_col}" IS NULL), "{order_col}" {direction}, rowid'
+    if limit is not None and offset is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+    return sql, params
+
+
+def _stream_csv(cursor):
+    """CSV chunks of EXPORT_CHUNK_ROWS rows from an executed cursor."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow([d[0] for d in cursor.description])
+    yield buf.getvalue().encode()
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+
+
+def _closing(chunks, conn):
+    """Pass ``chunks`` through, closing ``conn`` once the response is done with them."""
     try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+        yield from chunks
+    finally:
         conn.close()
-        
-        # Auto-detect date column
-        date_col = None
-        for col in df.columns:
-            if 'date' in col.lower():
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-                date_col = col
-                break
-        
-        if date_col and start_date:
-            df = df[df[date_col] >= start_date]
-        if date_col and end_date:
-            df = df[df[date_col] <= end_date]
-        
-        # Find customer column
-        customer_col = next((c for c in df.columns if 'customer' in c.lower() or 'client' in c.lower() or 'account' in c.lower()), None)
-        if not customer_col:
-            return Response(content="customer,amount\n", media_type='text/csv',
-                           headers={"Content-Disposition": "attachment; filename=by_customer.csv"})
-        
-        # Calculate amounts
-        qty_col = next((c for c in df.columns if 'quantity' in c.lower() or 'qty' in c.lower()), None)
-        price_col = next((c for c in df.columns if 'price' in c.lower() or 'amount' in c.lower() or 'sales' in c.lower()), None)
-        
-        if qty_col and price_col:
-            df['amount'] = df[qty_col] * df[price_col]
-            grouped = df.groupby(customer_col)['amount'].sum().reset_index()
-        elif price_col:
-            grouped = df.groupby(customer_col)[price_col].sum().reset_index()
-            grouped.columns = [customer_col, 'amount']
-        else:
-            grouped = df.groupby(customer_col).size().reset_index(name='amount')
-        
-        lines = ["customer,amount"]
-        for _, row in grouped.iterrows():
-            lines.append(f"{row[customer_col]},{float(row['amount'])}")
-        out = "\n".join(lines) + "\n"
-        
-    except Exception as e:
-        logger.warning(f"Export by_customer error: {e}")
-        return Response(content=f"customer,amount\nerror,{str(e)}\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=by_customer.csv"})
-    
-    headers = {"Content-Disposition": "attachment; filename=by_customer.csv"}
-    return Response(content=out, media_type='text/csv', headers=headers)
 
 
-@app.get('/export/transactions')
-def export_transactions(
-    start_date: str = None,
-    end_date: str = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
-    customer: Optional[str] = None,
-    search: Optional[str] = None,
-    sort_by: str = 'date',
-    sort_dir: str = 'desc',
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-):
-    conn = sqlite3.connect(DATABASE)
-    
-    # Get the latest uploaded dataset
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT table_name, columns FROM file_metadata 
-    ORDER BY upload_timestamp DESC LIMIT 1
-    """)
-    result = cursor.fetchone()
-    
-    if not result:
-        table_name = 'transactions'
-        columns = ['date','type','product','quantity','price','customer','region']
-    else:
-        table_name = result[0]
-        columns = json.loads(result[1])
-    
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    if not cursor.fetchone():
-        conn.close()
-        return Response(content=",".join(columns) + "\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=transactions.csv"})
+def _transactions_csv(src: _ExportSource, product=None, region=None, customer=None, search=None,
+                      sort_by='date', sort_dir='desc', limit=None, offset=None):
+    """The transactions export as an iterator of CSV chunks."""
+    if not src.exists:
+        return iter([(",".join(src.columns) + "\n").encode()])
     
+    conn, table_name, roles = src.conn, src.table_name, src.roles
+    start_date, end_date = src.start_date, src.end_date
     try:
-        # Build query with dynamic table name
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        conn.close()
-        
-        # Auto-detect date column
-        date_col = next((c for c in df.columns if 'date' in c.lower()), None)
+        table_columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+        terms = _search_terms(conn, table_name, search, table_columns)
+        query = _transactions_query(table_name, roles, start_date, end_date, product, region, customer, terms,
+                                    sort_by, sort_dir, limit, offset, table_columns)
+        if query is not None:
+            # Rows are streamed straight from the cursor, a chunk at a time
+            return _stream_csv(conn.execute(*query))
+        
+        # Fallback for non-ISO dates: search in SQLite, filter and sort in pandas
+        sql = f'SELECT * FROM "{table_name}"'
+        if terms[0]:
+            sql += ' WHERE ' + ' AND '.join(terms[0])
+        df = pd.read_sql_query(sql, conn, params=terms[1])
+        
+        date_col = roles.get('date')
         if date_col:
             df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
             
@@ -761,9 +1397,9 @@ def export_transactions(
                 df = df[df[date_col] <= end_date]
         
         # Apply other filters if columns exist
-        product_col = next((c for c in df.columns if 'product' in c.lower() or 'item' in c.lower()), None)
-        region_col = next((c for c in df.columns if 'region' in c.lower()), None)
-        customer_col = next((c for c in df.columns if 'customer' in c.lower() or 'client' in c.lower()), None)
+        product_col = roles.get('product')
+        region_col = roles.get('region')
+        customer_col = roles.get('customer')
         
         if product and product_col:
             df = df[df[product_col] == product]
@@ -772,12 +1408,6 @@ def export_transactions(
         if customer and customer_col:
             df = df[df[customer_col] == customer]
         
-        # Apply search across all text columns
-        if search:
-            search_lower = search.lower()
-            mask = df.astype(str).apply(lambda row: row.str.lower().str.contains(search_lower, na=False).any(), axis=1)
-            df = df[mask]
-        
         # Sort
         if sort_by in df.columns:
             df = df.sort_values(by=sort_by, ascending=(sort_dir.lower() != 'desc'))
@@ -789,34 +1419,108 @@ def export_transactions(
             df = df.iloc[offset:offset+limit]
         
         # Export all columns
-        out = df.to_csv(index=False)
+        return iter([df.to_csv(index=False).encode()])
         
     except Exception as e:
         logger.warning(f"Export transactions error: {e}")
-        return Response(content=f"error\n{str(e)}\n", media_type='text/csv',
-                       headers={"Content-Disposition": "attachment; filename=transactions.csv"})
-    
+        return iter([f"error\n{str(e)}\n".encode()])
+
+
+@app.get('/export/transactions')
+@_etag('/export/transactions')
+def export_transactions(
+    start_date: str = None,
+    end_date: str = None,
+    product: Optional[str] = None,
+    region: Optional[str] = None,
+    customer: Optional[str] = None,
+    search: Optional[str] = None,
+    sort_by: str = 'date',
+    sort_dir: str = 'desc',
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+):
+    """Rows of the latest dataset as CSV, streamed as they are read."""
+    conn = _reader()
+    try:
+        chunks = _transactions_csv(_ExportSource(conn, start_date, end_date), product, region, customer, search,
+                                   sort_by, sort_dir, limit, offset)
+    except Exception:
+        conn.close()
+        raise
     headers = {"Content-Disposition": "attachment; filename=transactions.csv"}
-    return Response(content=out, media_type='text/csv', headers=headers)
+    return StreamingResponse(_closing(chunks, conn), media_type='text/csv', headers=headers)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file for zipfile to write to; ``take`` hands back what it wrote so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_stream(reports, transactions):
+    """The export bundle, yielded as the zip is written. ``reports`` are small
+    (name, text) entries; the transactions CSV is compressed chunk by chunk."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in reports:
+            zf.writestr(name, content)
+        yield sink.take()
+        # size unknown up front, so reserve zip64 fields
+        with zf.open('transactions.csv', mode='w', force_zip64=True) as entry:
+            for chunk in transactions:
+                entry.write(chunk)
+                data = sink.take()
+                if data:
+                    yield data
+    yield sink.take()
 
 
 @app.get('/export/all.zip')
+@_etag('/export/all.zip')
 def export_all_zip(start_date: str = None, end_date: str = None):
-    """Bundle all CSV exports into a single zip for convenience."""
-    files = [
-        ('summary.csv', export_summary(start_date, end_date).body),
-        ('by_product.csv', export_by_product(start_date, end_date).body),
-        ('by_region.csv', export_by_region(start_date, end_date).body),
-        ('by_customer.csv', export_by_customer(start_date, end_date).body),
-        ('transactions.csv', export_transactions(start_date, end_date).body),
-    ]
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for name, content in files:
-            zf.writestr(name, content.decode() if isinstance(content, bytes) else content)
-    mem.seek(0)
+    """Bundle all CSV exports into a single zip for convenience.
+
+    Every report is read in one read transaction, so they all describe the
+    same snapshot: the dataset is resolved through the transaction and the
+    aggregates and the pandas fallbacks read it there too, not from the
+    frame cache, the Parquet sidecars or the analytics engine, which only
+    know the latest data. The archive is streamed while the transactions
+    are read.
+    """
+    conn = _reader()
+    try:
+        # before BEGIN: creating a missing catalog table would turn the read
+        # transaction into a write one and block uploads until the download ends
+        ensure_metadata_table(conn)
+        conn.execute('BEGIN')
+        src = _ExportSource(conn, start_date, end_date, pinned=True)
+        reports = [
+            ('summary.csv', _summary_csv(src)),
+            ('by_product.csv', _by_product_csv(src)),
+            ('by_region.csv', _group_amount_csv(src, 'region')),
+            ('by_customer.csv', _group_amount_csv(src, 'customer')),
+        ]
+        transactions = _transactions_csv(src)
+    except Exception:
+        conn.close()
+        raise
     headers = {"Content-Disposition": "attachment; filename=reports_bundle.zip"}
-    return Response(content=mem.read(), media_type='application/zip', headers=headers)
+    return StreamingResponse(_closing(_zip_stream(reports, transactions), conn), media_type='application/zip',
+                             headers=headers)
 
 @app.get('/export/upload_errors.csv')
 def export_upload_errors_csv():
@@ -828,22 +1532,22 @@ def export_upload_errors_csv():
 
 
 @app.get('/reports/income-statement')
+@_etag('/reports/income-statement', shared=True)
 def get_income_statement(start_date: str = None, end_date: str = None, _=Depends(require_api_key)):
     """Generate income statement (profit & loss) report"""
-    conn = sqlite3.connect(DATABASE)
+    conn = _reader()
     
-    # Try to get the latest uploaded dataset first
-    try:
-        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'data_%' ORDER BY name DESC LIMIT 1")
-        result = cursor.fetchone()
-        table_name = result[0] if result else 'transactions'
-    except:
-        table_name = 'transactions'
+    # The latest uploaded dataset, or the transactions table before any upload
+    active = datasets.active()
+    table_name = active.table_name
     
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {table_name}', conn, parse_dates=['date'] if 'date' in pd.read_sql_query(f'SELECT * FROM {table_name} LIMIT 0', conn).columns else None)
+        if table_name == 'transactions':
+            df = _transactions_frame(conn)
+        else:
+            df = _load_frame(conn, table_name, dates=['date'])
     except:
-        df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+        df = _transactions_frame(conn)
     finally:
         conn.close()
     
@@ -912,22 +1616,22 @@ def get_income_statement(start_date: str = None, end_date: str = None, _=Depends
     }
 
 @app.get('/reports/balance-sheet')
+@_etag('/reports/balance-sheet', shared=True)
 def get_balance_sheet(as_of_date: str = None, _=Depends(require_api_key)):
     """Generate balance sheet report"""
-    conn = sqlite3.connect(DATABASE)
+    conn = _reader()
     
-    # Try to get the latest uploaded dataset first
-    try:
-        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'data_%' ORDER BY name DESC LIMIT 1")
-        result = cursor.fetchone()
-        table_name = result[0] if result else 'transactions'
-    except:
-        table_name = 'transactions'
+    # The latest uploaded dataset, or the transactions table before any upload
+    active = datasets.active()
+    table_name = active.table_name
     
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {table_name}', conn, parse_dates=['date'] if 'date' in pd.read_sql_query(f'SELECT * FROM {table_name} LIMIT 0', conn).columns else None)
+        if table_name == 'transactions':
+            df = _transactions_frame(conn)
+        else:
+            df = _load_frame(conn, table_name, dates=['date'])
     except:
-        df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+        df = _transactions_frame(conn)
     finally:
         conn.close()
     
@@ -1250,23 +1954,32 @@ def submit_user_feedback(request: FeedbackRequest, current_user: User = Depends(
         db.close()
 
 # ------------------ Admin Utilities ------------------
+def _clear_transactions(conn) -> int:
+    """Delete every transaction with its search index and rollup rows; returns the count deleted."""
+    cur = conn.cursor()
+    # Capture count before delete for reporting
+    cur.execute('SELECT COUNT(*) FROM transactions')
+    count_before = cur.fetchone()[0] or 0
+    cur.execute('DELETE FROM transactions')
+    clear_search_index(conn, 'transactions')
+    clear_rollup(conn)
+    advance_store_version(conn)
+    return count_before
+
 @app.post('/admin/reset')
 def admin_reset(_=Depends(require_api_key)):
     """Delete all rows from transactions.
     Protected by API key when BACKEND_API_KEY is set; otherwise open (local dev convenience).
     """
     try:
-        conn = sqlite3.connect(DATABASE)
-        cur = conn.cursor()
-        # Capture count before delete for reporting
-        cur.execute('SELECT COUNT(*) FROM transactions')
-        count_before = cur.fetchone()[0] or 0
-        cur.execute('DELETE FROM transactions')
-        conn.commit()
-        conn.close()
+        count_before = storage.clear_transactions() if storage.SHARED_STORAGE else _write(_clear_transactions)
+        datasets.bump()
+        _clear_transaction_totals()
         global LAST_UPLOAD_ERROR_CSV
         LAST_UPLOAD_ERROR_CSV = None
         return {'status': 'ok', 'deleted': int(count_before)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to reset DB: {e}')
 
@@ -1275,23 +1988,70 @@ if ENHANCED_AUTH:
 else:
     init_db()
 
+def _ensure_schema():
+    """init_db when the transactions table is missing; only a read otherwise,
+    so uploads don't wait behind queued writes."""
+    conn = _reader()
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'").fetchone()
+    finally:
+        conn.close()
+    if not exists:
+        init_db()
+
 # Optional: start with an empty DB (dev convenience)
 if os.getenv('START_EMPTY', '').lower() in ('1','true','yes'):
     try:
-        _conn = sqlite3.connect(DATABASE)
-        _cur = _conn.cursor()
-        _cur.execute('DELETE FROM transactions')
-        _conn.commit()
-        _conn.close()
+        if storage.SHARED_STORAGE:
+            storage.clear_transactions()
+        else:
+            _write(_clear_transactions)
         logger.info('START_EMPTY enabled: cleared all rows from transactions on startup')
     except Exception as _e:
         logger.warning(f'START_EMPTY enabled but failed to clear DB: {_e}')
 
+def _after_ingest(file_metadata: dict, filename: str, user):
+    """Activity log and metrics shared by synchronous and background uploads."""
+    global LAST_UPLOAD_ERROR_CSV
+    datasets.bump()
+    appended = file_metadata['table_name'] == 'transactions'
+    rows = file_metadata.get('rows_inserted', file_metadata.get('row_count'))
+    if appended:
+        LAST_UPLOAD_ERROR_CSV = file_metadata.pop('invalid_csv', None)
+    # Log activity if enhanced auth is enabled
+    if ENHANCED_AUTH and user:
+        UserService.log_activity(
+            user.id,
+            "file_upload",
+            f"Uploaded {filename} with {rows} rows",
+            {"table_name": file_metadata['table_name'], "columns": file_metadata.get('columns'), "row_count": rows}
+        )
+
+    # metrics
+    if METRICS_ENABLED:
+        try:
+            UPLOAD_ROWS_INSERTED.inc(rows)
+            if appended:
+                UPLOAD_ROWS_DUPLICATE.inc(file_metadata['rows_duplicate'])
+                UPLOAD_ROWS_INVALID.inc(file_metadata['rows_invalid'])
+        except Exception:
+            pass
+
 @app.post('/upload')
-async def upload_file(request: Request, file: UploadFile = File(...), user=Depends(require_api_key)):
+async def upload_file(request: Request, file: UploadFile = File(...), background: bool = False,
+                      mode: str = 'dataset', table_name: Optional[str] = None, user=Depends(require_api_key)):
+    """Ingest an uploaded file into a new data_<ts> table.
+
+    Passing ``table_name`` of an existing dataset appends the rows to it
+    instead (the columns must match) and bumps the dataset's version.
+    ``mode=transactions`` instead appends the rows to the transactions table,
+    skipping rows whose fingerprint is already stored. With ``background=true``
+    the request returns 202 with a job id right after the upload is received;
+    poll GET /upload/jobs/{job_id} for progress.
+    """
     # ensure DB schema in case file was deleted (e.g., tests)
     try:
-        init_db()
+        await run_in_threadpool(_ensure_schema)
     except Exception:
         pass
     # rate limit
@@ -1304,128 +2064,184 @@ async def upload_file(request: Request, file: UploadFile = File(...), user=Depen
     supported_extensions = ['.csv', '.xlsx', '.xls', '.json', '.txt', '.tsv', '.parquet']
     if not any(filename.lower().endswith(ext) for ext in supported_extensions):
         raise HTTPException(status_code=400, detail=f'Supported file types: {", ".join(supported_extensions)}')
+    if mode not in ('dataset', 'transactions'):
+        raise HTTPException(status_code=400, detail="mode must be 'dataset' or 'transactions'")
+    append = bool(table_name)
+    if append and mode != 'dataset':
+        raise HTTPException(status_code=400, detail='table_name can only be used with mode=dataset')
 
-    contents = await file.read()
-    
-    # Dynamic file parsing - support multiple formats
+    # Create a dynamic table structure based on the actual data
+    if not append:
+        table_name = f"data_{int(time.time())}_{uuid.uuid4().hex[:8]}" if mode == 'dataset' else 'transactions'
+
+    # Hash the bytes first (while spooling them for a worker process when one
+    # is used) so a re-upload of the same file short-circuits to its table
+    path = None
+    if background or _get_ingest_pool() is not None:
+        path, content_hash = await _spool_upload(file)
+    else:
+        content_hash = await run_in_threadpool(hash_fileobj, file.file)
+
+    if append:
+        target, previous = await run_in_threadpool(_load_dataset_for_append, table_name, content_hash)
+        if target is None or previous:
+            if path:
+                os.remove(path)
+        if target is None:
+            raise HTTPException(status_code=404, detail=f'Dataset {table_name} not found')
+        if previous:
+            return clean_nan_values({
+                'status': 'ok',
+                'message': f'{filename} was already appended to {table_name} as version {previous["version"]}',
+                'deduplicated': True,
+                'table_name': table_name,
+                'rows_inserted': 0,
+                'row_count': target['row_count'],
+                'version': target['version'],
+                'columns': target['columns']
+            })
+
+    existing = await run_in_threadpool(_find_duplicate_upload, content_hash) \
+        if mode == 'dataset' and not append else None
+    if existing:
+        if path:
+            os.remove(path)
+        return clean_nan_values({
+            'status': 'ok',
+            'message': f'{filename} was already uploaded as {existing["table_name"]}',
+            'deduplicated': True,
+            'table_name': existing['table_name'],
+            'rows_inserted': 0,
+            'columns': existing['columns'],
+            'metadata': existing,
+            'sample_data': existing['sample_data']
+        })
+
+    if background:
+        # The job's row is written when its ingest starts, so answering
+        # doesn't wait for the SQLite write lock an earlier upload may hold
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'table_name': table_name,
+            'original_filename': filename,
+            'status': 'queued',
+            'phase': 'queued',
+            'rows_parsed': 0,
+            'rows_inserted': 0,
+            'owner_pid': os.getpid(),
+            'created_at': datetime.now().isoformat(),
+        }
+        _upload_jobs[job_id] = {'progress': _new_progress(), 'future': None, 'job': job}
+        _upload_jobs[job_id]['task'] = asyncio.create_task(
+            _run_upload_job(job_id, path, filename, table_name, content_hash, user, append)
+        )
+        return JSONResponse(status_code=202, content={
+            'status': 'accepted',
+            'job_id': job_id,
+            'table_name': table_name,
+            'status_url': f'/upload/jobs/{job_id}'
+        })
+
+    # Stream the upload into SQLite chunk by chunk off the event loop; the
+    # table and its file_metadata row are written in one transaction
     try:
-        if filename.lower().endswith('.csv'):
-            df = pd.read_csv(pd.io.common.BytesIO(contents))
-        elif filename.lower().endswith('.tsv'):
-            df = pd.read_csv(pd.io.common.BytesIO(contents), sep='\t')
-        elif filename.lower().endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(pd.io.common.BytesIO(contents))
-        elif filename.lower().endswith('.json'):
-            df = pd.read_json(pd.io.common.BytesIO(contents))
-        elif filename.lower().endswith('.parquet'):
-            df = pd.read_parquet(pd.io.common.BytesIO(contents))
+        if path:
+            file_metadata = await _ingest_spooled(path, filename, table_name, content_hash=content_hash,
+                                                  append=append)
         else:
-            # Try CSV as fallback for .txt files
-            df = pd.read_csv(pd.io.common.BytesIO(contents))
-    except Exception as e:
+            file_metadata = await run_in_threadpool(_ingest_in_thread, file.file, filename, table_name,
+                                                    content_hash, append)
+    except HTTPException:
+        raise
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatasetExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SchemaMismatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadParseError as e:
         raise HTTPException(status_code=400, detail=f'Failed to parse file: {str(e)}')
-    
-    if df.empty:
+    except EmptyUploadError:
         raise HTTPException(status_code=400, detail='File contains no data')
-    
-    # Clean column names - make them database-friendly
-    df.columns = [col.strip().lower().replace(' ', '_').replace('-', '_').replace('.', '_') 
-                  for col in df.columns]
-    
-    # Remove any completely empty columns
-    df = df.dropna(axis=1, how='all')
-    
-    # Create a dynamic table structure based on the actual data
-    table_name = f"data_{int(time.time())}"
-    
-    # Store metadata about the uploaded file
-    file_metadata = {
-        'original_filename': filename,
-        'table_name': table_name,
-        'columns': list(df.columns),
-        'row_count': len(df),
-        'column_types': {col: str(df[col].dtype) for col in df.columns},
-        'upload_timestamp': datetime.now().isoformat(),
-        'sample_data': clean_nan_values(df.head(3).to_dict('records')) if len(df) > 0 else []
-    }
-    
-    # Store the data dynamically in SQLite
-    try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        # Create a dynamic table for this dataset
-        # Convert DataFrame to SQLite (pandas handles type inference)
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Store metadata in a metadata table
-        metadata_table = "file_metadata"
-        cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS {metadata_table} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            table_name TEXT UNIQUE,
-            original_filename TEXT,
-            columns TEXT,
-            row_count INTEGER,
-            column_types TEXT,
-            upload_timestamp TEXT,
-            sample_data TEXT
-        )
-        ''')
-        
-        # Insert metadata
-        cursor.execute(f'''
-        INSERT OR REPLACE INTO {metadata_table} 
-        (table_name, original_filename, columns, row_count, column_types, upload_timestamp, sample_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            table_name,
-            filename,
-            json.dumps(file_metadata['columns']),
-            file_metadata['row_count'],
-            json.dumps(file_metadata['column_types']),
-            file_metadata['upload_timestamp'],
-            json.dumps(file_metadata['sample_data'])
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log activity if enhanced auth is enabled
-        if ENHANCED_AUTH and user:
-            UserService.log_activity(
-                user.id,
-                "file_upload",
-                f"Uploaded {filename} with {len(df)} rows",
-                {"table_name": table_name, "columns": list(df.columns), "row_count": len(df)}
-            )
-        
-        # metrics
-        if METRICS_ENABLED:
-            try:
-                UPLOAD_ROWS_INSERTED.inc(len(df))
-            except Exception:
-                pass
-        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to store data: {str(e)}')
+    finally:
+        if path:
+            os.remove(path)
+
+    elapsed_seconds = file_metadata.pop('elapsed_seconds')
+    rows_per_second = file_metadata.pop('rows_per_second')
+    _after_ingest(file_metadata, filename, user)
+
+    if mode == 'transactions':
+        return {
+            'status': 'ok',
+            'message': f'Imported {file_metadata["rows_inserted"]} new transactions from {filename}',
+            'table_name': 'transactions',
+            'rows_inserted': file_metadata['rows_inserted'],
+            'rows_duplicate': file_metadata['rows_duplicate'],
+            'rows_invalid': file_metadata['rows_invalid'],
+            'elapsed_seconds': elapsed_seconds,
+            'rows_per_second': rows_per_second
+        }
+
+    if append:
         return clean_nan_values({
             'status': 'ok',
-            'message': f'Successfully uploaded {filename}',
+            'message': f'Appended {file_metadata["rows_inserted"]} rows from {filename} to {table_name}',
             'table_name': table_name,
-            'rows_inserted': len(df),
-            'columns': list(df.columns),
-            'metadata': file_metadata,
-            'sample_data': file_metadata['sample_data']
+            'rows_inserted': file_metadata['rows_inserted'],
+            'row_count': file_metadata['row_count'],
+            'version': file_metadata['version'],
+            'columns': file_metadata['columns'],
+            'elapsed_seconds': elapsed_seconds,
+            'rows_per_second': rows_per_second
         })
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Failed to store data: {str(e)}')
+
+    rows = file_metadata['row_count']
+    return clean_nan_values({
+        'status': 'ok',
+        'message': f'Successfully uploaded {filename}',
+        'table_name': table_name,
+        'rows_inserted': rows,
+        'columns': file_metadata['columns'],
+        'metadata': file_metadata,
+        'sample_data': file_metadata['sample_data'],
+        'elapsed_seconds': elapsed_seconds,
+        'rows_per_second': rows_per_second
+    })
+
+@app.get('/upload/jobs/{job_id}')
+def get_upload_job(job_id: str, _=Depends(require_api_key)):
+    """Status and progress of a background upload"""
+    job = _find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f'Upload job {job_id} not found')
+    return _job_view(job)
+
+@app.post('/upload/jobs/{job_id}/cancel')
+def cancel_upload_job(job_id: str, _=Depends(require_api_key)):
+    """Cancel a queued or running background upload; its table is rolled back"""
+    job = _find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f'Upload job {job_id} not found')
+    live = _upload_jobs.get(job_id)
+    if job['status'] not in ('queued', 'running') or not live:
+        raise HTTPException(status_code=409, detail=f'Upload job {job_id} is already {job["status"]}')
+    live['progress']['cancel'] = True
+    future = live.get('future')
+    if future is not None:
+        future.cancel()  # only succeeds while the job is still waiting for the upload slot
+    return _job_view(job)
 
 # New flexible data endpoints
 @app.get('/datasets')
+@_etag('/datasets')
 def list_datasets(_=Depends(require_api_key)):
     """Get all uploaded datasets"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         cursor = conn.cursor()
         
         # Check if metadata table exists
@@ -1438,9 +2254,10 @@ def list_datasets(_=Depends(require_api_key)):
             conn.close()
             return {'datasets': []}
         
+        ensure_metadata_table(conn)
         cursor.execute("""
         SELECT table_name, original_filename, columns, row_count, 
-               column_types, upload_timestamp, sample_data
+               column_types, upload_timestamp, sample_data, version
         FROM file_metadata 
         ORDER BY upload_timestamp DESC
         """)
@@ -1454,7 +2271,8 @@ def list_datasets(_=Depends(require_api_key)):
                 'row_count': row[3],
                 'column_types': json.loads(row[4]),
                 'upload_timestamp': row[5],
-                'sample_data': json.loads(row[6])
+                'sample_data': json.loads(row[6]),
+                'version': row[7] or 1
             }
             # Clean any NaN values before adding to response
             dataset = clean_nan_values(dataset)
@@ -1467,10 +2285,11 @@ def list_datasets(_=Depends(require_api_key)):
         raise HTTPException(status_code=500, detail=f'Failed to get datasets: {str(e)}')
 
 @app.get('/datasets/{table_name}/data')
+@_etag('/datasets/{table_name}/data')
 def get_dataset_data(table_name: str, limit: int = 1000, offset: int = 0, _=Depends(require_api_key)):
     """Get data from any uploaded dataset"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         
         # Verify table exists and get metadata
         cursor = conn.cursor()
@@ -1501,10 +2320,11 @@ def get_dataset_data(table_name: str, limit: int = 1000, offset: int = 0, _=Depe
         raise HTTPException(status_code=500, detail=f'Failed to get dataset data: {str(e)}')
 
 @app.get('/datasets/{table_name}/summary')
+@_etag('/datasets/{table_name}/summary')
 def get_dataset_summary(table_name: str, _=Depends(require_api_key)):
     """Get summary statistics for any dataset"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         
         # Verify table exists
         cursor = conn.cursor()
@@ -1513,41 +2333,37 @@ def get_dataset_summary(table_name: str, _=Depends(require_api_key)):
             conn.close()
             raise HTTPException(status_code=404, detail=f'Dataset {table_name} not found')
         
-        df = pd.read_sql_query(f'SELECT * FROM {table_name}', conn)
+        # Served from the column statistics catalog built at ingest
+        catalog = dataset_stats(conn, table_name, _catalog_stats)
         conn.close()
         
         summary = {
             'table_name': table_name,
-            'total_rows': len(df),
-            'columns': list(df.columns),
+            'total_rows': catalog['row_count'],
+            'columns': catalog['columns'],
+            'version': catalog['version'],
             'column_stats': {}
         }
         
-        for col in df.columns:
-            col_data = df[col].dropna()
-            
-            if col_data.dtype in ['int64', 'float64']:
-                # Handle NaN values properly
-                mean_val = col_data.mean() if len(col_data) > 0 else 0
-                min_val = col_data.min() if len(col_data) > 0 else 0
-                max_val = col_data.max() if len(col_data) > 0 else 0
-                std_val = col_data.std() if len(col_data) > 0 else 0
-                
+        for col, stats in catalog['column_stats'].items():
+            if stats['type'] == 'numeric':
                 summary['column_stats'][col] = {
                     'type': 'numeric',
-                    'count': len(col_data),
-                    'mean': float(mean_val) if not pd.isna(mean_val) else 0,
-                    'min': float(min_val) if not pd.isna(min_val) else 0,
-                    'max': float(max_val) if not pd.isna(max_val) else 0,
-                    'std': float(std_val) if not pd.isna(std_val) else 0
+                    'count': stats['count'],
+                    'null_count': stats['null_count'],
+                    'distinct_count': stats['distinct_count'],
+                    'mean': stats['mean'],
+                    'min': stats['min'],
+                    'max': stats['max'],
+                    'std': stats['std']
                 }
             else:
-                value_counts = col_data.value_counts().head(10)
                 summary['column_stats'][col] = {
                     'type': 'categorical',
-                    'count': len(col_data),
-                    'unique_values': len(col_data.unique()),
-                    'top_values': dict(value_counts) if len(value_counts) > 0 else {}
+                    'count': stats['count'],
+                    'null_count': stats['null_count'],
+                    'unique_values': stats['distinct_count'],
+                    'top_values': stats['top_values']
                 }
         
         return summary
@@ -1555,11 +2371,48 @@ def get_dataset_summary(table_name: str, _=Depends(require_api_key)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to get dataset summary: {str(e)}')
 
+# pandas aggregate -> SQL aggregate with the same result on numeric columns
+_ENGINE_AGGREGATES = {'sum': 'TOTAL', 'mean': 'AVG', 'count': 'COUNT', 'max': 'MAX', 'min': 'MIN'}
+
+def _engine_analysis(conn, table_name: str, analysis_type: str, body: dict) -> Optional[pd.DataFrame]:
+    """The groupby / timeseries result of analyze_dataset computed by the
+    analytics engine; None when pandas has to answer (engine off, unknown or
+    non-numeric columns, dates that aren't ISO strings)."""
+    file_metadata = _engine_dataset(conn, table_name)
+    if file_metadata is None:
+        return None
+    columns = file_metadata['columns']
+    roles = roles_for(columns, file_metadata['column_types'] or {}, file_metadata['roles'])
+    numeric = set(roles.get('numeric') or []) - set(roles.get('numeric_text') or [])
+
+    def total(value: str) -> str:
+        # pandas sums an integer column to integers
+        if pd.api.types.is_integer_dtype((file_metadata['column_types'] or {}).get(value) or 'object'):
+            return f'CAST(TOTAL("{value}") AS BIGINT)'
+        return f'TOTAL("{value}")'
+    if analysis_type == 'groupby':
+        key, value = body.get('group_by'), body.get('aggregate_column')
+        func = _ENGINE_AGGREGATES.get(body.get('aggregate_function', 'sum'))
+        if not func or key not in columns or value not in numeric or key == value:
+            return None
+        aggregate = total(value) if func == 'TOTAL' else f'{func}("{value}")'
+        sql = (f'SELECT "{key}", {aggregate} AS "{value}" FROM "{table_name}" '
+               f'WHERE "{key}" IS NOT NULL GROUP BY "{key}" ORDER BY "{key}"')
+    elif analysis_type == 'timeseries':
+        key, value = body.get('date_column'), body.get('value_column')
+        if key != roles.get('date') or not roles.get('date_iso') or value not in numeric or key == value:
+            return None
+        sql = (f'SELECT substr("{key}", 1, 10) AS "{key}", {total(value)} AS "{value}" FROM "{table_name}" '
+               f'WHERE "{key}" IS NOT NULL GROUP BY 1 ORDER BY 1')
+    else:
+        return None
+    return fetch_frame(DATABASE, table_name, file_metadata['version'] or 1, sql)
+
 @app.post('/datasets/{table_name}/analyze')
 def analyze_dataset(table_name: str, body: dict = Body(...), _=Depends(require_api_key)):
     """Flexible analytics endpoint for any dataset"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = _reader()
         
         # Verify table exists
         cursor = conn.cursor()
@@ -1568,51 +2421,51 @@ def analyze_dataset(table_name: str, body: dict = Body(...), _=Depends(require_a
             conn.close()
             raise HTTPException(status_code=404, detail=f'Dataset {table_name} not found')
         
-        df = pd.read_sql_query(f'SELECT * FROM {table_name}', conn)
-        conn.close()
-        
         analysis_type = body.get('type', 'summary')
         
         if analysis_type == 'summary':
-            # Basic summary statistics
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            categorical_cols = df.select_dtypes(include=['object', 'string']).columns
+            # Basic summary statistics, served from the column statistics catalog
+            catalog = dataset_stats(conn, table_name, _catalog_stats)
+            conn.close()
             
             result = {
                 'table_name': table_name,
-                'total_rows': len(df),
+                'total_rows': catalog['row_count'],
                 'numeric_summary': {},
                 'categorical_summary': {}
             }
             
-            for col in numeric_cols:
-                col_data = df[col].dropna()
-                mean_val = col_data.mean() if len(col_data) > 0 else 0
-                median_val = col_data.median() if len(col_data) > 0 else 0
-                std_val = col_data.std() if len(col_data) > 0 else 0
-                min_val = col_data.min() if len(col_data) > 0 else 0
-                max_val = col_data.max() if len(col_data) > 0 else 0
-                
-                result['numeric_summary'][col] = {
-                    'count': len(col_data),
-                    'mean': float(mean_val) if not pd.isna(mean_val) else 0,
-                    'median': float(median_val) if not pd.isna(median_val) else 0,
-                    'std': float(std_val) if not pd.isna(std_val) else 0,
-                    'min': float(min_val) if not pd.isna(min_val) else 0,
-                    'max': float(max_val) if not pd.isna(max_val) else 0
-                }
-            
-            for col in categorical_cols:
-                value_counts = df[col].value_counts().head(10)
-                result['categorical_summary'][col] = {
-                    'unique_count': len(df[col].unique()),
-                    'top_values': dict(value_counts)
-                }
+            for col, stats in catalog['column_stats'].items():
+                if stats['type'] == 'numeric':
+                    result['numeric_summary'][col] = {
+                        'count': stats['count'],
+                        'mean': stats['mean'],
+                        'median': stats['median'],
+                        'std': stats['std'],
+                        'min': stats['min'],
+                        'max': stats['max']
+                    }
+                else:
+                    result['categorical_summary'][col] = {
+                        # nulls count as one value, as in Series.unique()
+                        'unique_count': stats['distinct_count'] + (1 if stats['null_count'] else 0),
+                        'top_values': stats['top_values']
+                    }
             
             # Clean any NaN values before returning
             return clean_nan_values(result)
-            
-        elif analysis_type == 'groupby':
+        
+        # Only the columns the analysis names are loaded, unless the
+        # analytics engine aggregates the dataset itself
+        if analysis_type == 'groupby':
+            needed = [body.get('group_by'), body.get('aggregate_column')]
+        else:
+            needed = [body.get('date_column'), body.get('value_column')]
+        engine_df = _engine_analysis(conn, table_name, analysis_type, body)
+        df = _load_frame(conn, table_name, needed) if engine_df is None else None
+        conn.close()
+        
+        if analysis_type == 'groupby':
             # Group by analysis
             group_by_col = body.get('group_by')
             agg_col = body.get('aggregate_column')
@@ -1621,14 +2474,16 @@ def analyze_dataset(table_name: str, body: dict = Body(...), _=Depends(require_a
             if not group_by_col or not agg_col:
                 raise HTTPException(status_code=400, detail='group_by and aggregate_column required for groupby analysis')
             
-            if group_by_col not in df.columns:
+            if engine_df is None and group_by_col not in df.columns:
                 raise HTTPException(status_code=400, detail=f'Column {group_by_col} not found')
             
-            if agg_col not in df.columns:
+            if engine_df is None and agg_col not in df.columns:
                 raise HTTPException(status_code=400, detail=f'Column {agg_col} not found')
             
             try:
-                if agg_func == 'sum':
+                if engine_df is not None:
+                    result_df = engine_df
+                elif agg_func == 'sum':
                     result_df = df.groupby(group_by_col)[agg_col].sum().reset_index()
                 elif agg_func == 'mean':
                     result_df = df.groupby(group_by_col)[agg_col].mean().reset_index()
@@ -1661,17 +2516,20 @@ def analyze_dataset(table_name: str, body: dict = Body(...), _=Depends(require_a
             if not date_col or not value_col:
                 raise HTTPException(status_code=400, detail='date_column and value_column required for timeseries analysis')
             
-            if date_col not in df.columns or value_col not in df.columns:
+            if engine_df is None and (date_col not in df.columns or value_col not in df.columns):
                 raise HTTPException(status_code=400, detail='Specified columns not found')
             
             try:
-                # Try to parse the date column
-                df[date_col] = pd.to_datetime(df[date_col])
-                df = df.sort_values(date_col)
-                
-                # Group by date and sum values
-                timeseries_df = df.groupby(df[date_col].dt.date)[value_col].sum().reset_index()
-                timeseries_df[date_col] = timeseries_df[date_col].astype(str)
+                if engine_df is not None:
+                    timeseries_df = engine_df
+                else:
+                    # Try to parse the date column
+                    df[date_col] = pd.to_datetime(df[date_col])
+                    df = df.sort_values(date_col)
+                    
+                    # Group by date and sum values
+                    timeseries_df = df.groupby(df[date_col].dt.date)[value_col].sum().reset_index()
+                    timeseries_df[date_col] = timeseries_df[date_col].astype(str)
                 
                 return {
                     'table_name': table_name,
@@ -1692,10 +2550,44 @@ def analyze_dataset(table_name: str, body: dict = Body(...), _=Depends(require_a
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Analysis failed: {str(e)}')
 
+def _rollup_for_dates(conn, start_date: Optional[str], end_date: Optional[str]) -> bool:
+    """The daily rollup can answer a report over this date range: it exists
+    and the bounds are ISO dates, which compare as text like the stored ones."""
+    if any(d and not is_iso_date(d) for d in (start_date, end_date)):
+        return False
+    return rollup_available(conn)
+
+
 @app.get('/reports/summary')
+@_etag('/reports/summary', shared=True)
+@_cached('/reports/summary', shared=True)
 def report_summary(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+    if storage.SHARED_STORAGE:
+        total_sales, total_purchases, rows = storage.summary(start_date, end_date)
+        return {
+            'total_sales': total_sales,
+            'total_purchases': total_purchases,
+            'profit': total_sales - total_purchases,
+            'rows': rows
+        }
+    conn = _reader()
+    if _rollup_for_dates(conn, start_date, end_date):
+        where, params = _apply_date_and_filters('', [], start_date, end_date, None)
+        rows = conn.execute(
+            f'SELECT lower(type), TOTAL(amount), SUM(rows) FROM {ROLLUP_TABLE} WHERE 1=1{where} GROUP BY lower(type)',
+            params
+        ).fetchall()
+        conn.close()
+        amounts = {kind: amount for kind, amount, _ in rows}
+        total_sales = amounts.get('sale', 0.0)
+        total_purchases = amounts.get('purchase', 0.0)
+        return {
+            'total_sales': float(total_sales),
+            'total_purchases': float(total_purchases),
+            'profit': float(total_sales - total_purchases),
+            'rows': sum(n for _, _, n in rows)
+        }
+    df = _transactions_frame(conn)
     conn.close()
 
     if start_date:
@@ -1719,9 +2611,22 @@ def report_summary(start_date: str = None, end_date: str = None):
     }
 
 @app.get('/reports/by_product')
+@_etag('/reports/by_product', shared=True)
+@_cached('/reports/by_product', shared=True)
 def report_by_product(start_date: str = None, end_date: str = None):
-    conn = sqlite3.connect(DATABASE)
-    df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+    if storage.SHARED_STORAGE:
+        return {'by_product': storage.by_product(start_date, end_date)}
+    conn = _reader()
+    if _rollup_for_dates(conn, start_date, end_date):
+        where, params = _apply_date_and_filters('', [], start_date, end_date, None)
+        grouped = pd.read_sql_query(
+            f'SELECT product, TOTAL(amount) AS amount, TOTAL(quantity) AS quantity FROM {ROLLUP_TABLE} '
+            f'WHERE product IS NOT NULL{where} GROUP BY product ORDER BY product',
+            conn, params=params
+        )
+        conn.close()
+        return {'by_product': grouped.to_dict(orient='records')}
+    df = _transactions_frame(conn)
     conn.close()
 
     if start_date:
@@ -1735,9 +2640,11 @@ def report_by_product(start_date: str = None, end_date: str = None):
     return {'by_product': result}
 
 @app.get('/reports/inventory')
+@_etag('/reports/inventory', shared=True)
+@_cached('/reports/inventory', shared=True)
 def report_inventory():
-    conn = sqlite3.connect(DATABASE)
-    df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+    conn = _reader()
+    df = _transactions_frame(conn)
     conn.close()
     # stock in = purchases, stock out = sales
     purchases = df[df['type'].str.lower()=='purchase'].groupby('product')['quantity'].sum()
@@ -1747,6 +2654,75 @@ def report_inventory():
     inventory_df.columns = ['product','quantity']
     return {'inventory': inventory_df.to_dict(orient='records')}
 
+# Filtered COUNT(*) / SUM(amount) of /transactions, reused by every
+# page of the same filter set. Keyed on MAX(id): the table only grows, apart
+# from the resets, which clear this cache.
+TRANSACTION_TOTALS_CACHE_SIZE = 128
+_transaction_totals: "OrderedDict[tuple, tuple]" = OrderedDict()
+_transaction_totals_lock = threading.Lock()
+
+
+def _clear_transaction_totals():
+    with _transaction_totals_lock:
+        _transaction_totals.clear()
+
+
+def _transaction_totals_for(conn, where: str, params: list) -> tuple:
+    """(total rows, global amount) of the filtered transactions."""
+    key = (where, tuple(params), conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0])
+    with _transaction_totals_lock:
+        if key in _transaction_totals:
+            _transaction_totals.move_to_end(key)
+            return _transaction_totals[key]
+    total, global_amount = conn.execute(
+        f'SELECT COUNT(*), SUM({AMOUNT_SQL}) FROM transactions WHERE 1=1' + where, params
+    ).fetchone()
+    with _transaction_totals_lock:
+        _transaction_totals[key] = (total, global_amount)
+        while len(_transaction_totals) > TRANSACTION_TOTALS_CACHE_SIZE:
+            _transaction_totals.popitem(last=False)
+    return total, global_amount
+
+
+# normalize_transactions rejects rows without these
+TRANSACTION_NOT_NULL_COLUMNS = {'date', 'quantity', 'price'}
+
+
+def _encode_cursor(col: str, direction: str, value, row_id: int) -> str:
+    raw = json.dumps([col, direction, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str, col: str, direction: str):
+    """(value, id) of the last row of the previous page."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        c_col, c_dir, value, row_id = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if (c_col, c_dir) != (col, direction) or not isinstance(row_id, int):
+        raise HTTPException(status_code=400, detail='Cursor does not match sort_by/sort_dir')
+    return value, row_id
+
+
+def _after_cursor(col: str, direction: str, value, row_id: int) -> Tuple[str, list]:
+    """WHERE term selecting the rows after (value, id) in ORDER BY col, id.
+
+    The row-value comparison lets SQLite seek the column's index straight to
+    the cursor. SQLite sorts NULLs first, so they open an ASC listing and close
+    a DESC one; columns that can hold NULLs need the extra IS NULL terms.
+    """
+    op = '>' if direction == 'ASC' else '<'
+    if value is None:
+        if direction == 'ASC':
+            return f'(({col} IS NULL AND id > ?) OR {col} IS NOT NULL)', [row_id]
+        return f'({col} IS NULL AND id < ?)', [row_id]
+    term = f'({col}, id) {op} (?, ?)'
+    if direction == 'DESC' and col not in TRANSACTION_NOT_NULL_COLUMNS:
+        term = f'({term} OR {col} IS NULL)'
+    return term, [value, row_id]
+
+
 @app.get('/transactions')
 def list_transactions(
     limit: int = Query(50, ge=1, le=1000),
@@ -1759,49 +2735,87 @@ def list_transactions(
     search: Optional[str] = None,
     sort_by: str = Query('date'),
     sort_dir: str = Query('desc'),
+    cursor: Optional[str] = None,
 ):
-    # ensure DB exists
-    try:
-        init_db()
-    except Exception:
-        pass
-    base = 'SELECT * FROM transactions WHERE 1=1'
+    """A page of transactions. Pass ``pagination.next_cursor`` back as
+    ``cursor`` to fetch the next page without re-reading the skipped rows;
+    ``offset`` is ignored when a cursor is given."""
+    allowed_cols = {'date','type','product','quantity','price','customer','region'}
+    col = sort_by if sort_by in allowed_cols else 'date'
+    direction = 'DESC' if str(sort_dir).lower()=='desc' else 'ASC'
+    after = _decode_cursor(cursor, col, direction) if cursor else None
+    if after:
+        offset = 0
+    if storage.SHARED_STORAGE:
+        equals = [(name, '=', value) for name, value in
+                  (('product', product), ('region', region), ('customer', customer)) if value]
+        terms = storage.conditions(start_date, end_date, equals)
+        if search:
+            terms.append(storage.search_condition(search, TRANSACTION_SEARCH_COLUMNS))
+        df, total, global_amount = storage.transactions_page(terms, col, direction, limit + 1, offset, after)
+        return _transactions_page(df, limit, offset, col, direction, total, global_amount)
+    conn = _reader()
+    # ensure DB exists; only queue the schema setup when the table is missing
+    # so reads don't wait behind writes
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'").fetchone():
+        try:
+            init_db()
+        except Exception:
+            pass
+    where = ''
     params: List = []
     if start_date:
-        base += ' AND date >= ?'
+        where += ' AND date >= ?'
         params.append(start_date)
     if end_date:
-        base += ' AND date <= ?'
+        where += ' AND date <= ?'
         params.append(end_date)
     if product:
-        base += ' AND product = ?'
+        where += ' AND product = ?'
         params.append(product)
     if region:
-        base += ' AND region = ?'
+        where += ' AND region = ?'
         params.append(region)
     if customer:
-        base += ' AND customer = ?'
+        where += ' AND customer = ?'
         params.append(customer)
     if search:
-        base += ' AND (LOWER(product) LIKE ? OR LOWER(customer) LIKE ? OR LOWER(region) LIKE ? OR LOWER(type) LIKE ? )'
-        q = f"%{search.lower()}%"
-        params.extend([q, q, q, q])
-    count_q = 'SELECT COUNT(*) FROM (' + base + ')'
-    allowed_cols = {'date','type','product','quantity','price','customer','region'}
-    col = sort_by if sort_by in allowed_cols else 'date'
-    direction = 'DESC' if str(sort_dir).lower()=='desc' else 'ASC'
-    base += f' ORDER BY {col} {direction} LIMIT ? OFFSET ?'
-    params_paged = params + [limit, offset]
-    conn = sqlite3.connect(DATABASE)
-    total = conn.execute(count_q, params).fetchone()[0]
-    # Global amount total with same filters (no pagination)
-    amount_q = 'SELECT SUM(quantity * price) FROM (' + count_q[18:] + ')'  # hack: reuse WHERE body
+        # Substring search through the trigram index; LIKE scan for short queries
+        fts = search_filter(conn, 'transactions', search)
+        if fts:
+            where += ' AND ' + fts[0]
+            params.extend(fts[1])
+        else:
+            where += ' AND (LOWER(product) LIKE ? OR LOWER(customer) LIKE ? OR LOWER(region) LIKE ? OR LOWER(type) LIKE ? )'
+            q = f"%{search.lower()}%"
+            params.extend([q, q, q, q])
+    page_where, page_params = where, list(params)
+    if after:
+        after_where, after_params = _after_cursor(col, direction, *after)
+        page_where += ' AND ' + after_where
+        page_params += after_params
+    # id breaks ties so the keyset order is total; one extra row tells
+    # whether there is a next page
+    base = f'SELECT * FROM transactions WHERE 1=1{page_where} ORDER BY {col} {direction}, id {direction} LIMIT ? OFFSET ?'
     try:
-        global_amount = conn.execute('SELECT SUM(quantity * price) FROM transactions WHERE 1=1' + count_q.split('WHERE 1=1',1)[1].split(')')[0], params).fetchone()[0]
-    except Exception:
-        global_amount = None
-    df = pd.read_sql_query(base, conn, params=params_paged, parse_dates=['date'])
-    conn.close()
+        df = pd.read_sql_query(base, conn, params=page_params + [limit + 1, offset])
+        total, global_amount = _transaction_totals_for(conn, where, params)
+    finally:
+        conn.close()
+    return _transactions_page(df, limit, offset, col, direction, total, global_amount)
+
+
+def _transactions_page(df: pd.DataFrame, limit: int, offset: int, col: str, direction: str, total: int,
+                       global_amount) -> dict:
+    """Response of /transactions from up to ``limit + 1`` rows of the page."""
+    next_cursor = None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        last = df.iloc[-1]
+        value = last[col]
+        value = None if pd.isna(value) else (value.item() if hasattr(value, 'item') else value)
+        next_cursor = _encode_cursor(col, direction, value, int(last['id']))
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
     page_amount = float(((df['quantity'] * df['price']).sum())) if not df.empty else 0.0
     return {
         'transactions': df.to_dict(orient='records'),
@@ -1809,7 +2823,8 @@ def list_transactions(
             'limit': limit,
             'offset': offset,
             'total': total,
-            'returned': len(df)
+            'returned': len(df),
+            'next_cursor': next_cursor
         },
         'totals': {
             'page_amount': page_amount,
@@ -1818,7 +2833,12 @@ def list_transactions(
     }
 
 @app.get('/meta/distincts')
+@_etag('/meta/distincts', shared=True)
+@_cached('/meta/distincts', shared=True)
 def meta_distincts(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    if storage.SHARED_STORAGE:
+        values = storage.distincts(start_date, end_date)
+        return {'products': values['product'], 'regions': values['region'], 'customers': values['customer']}
     q = 'SELECT product, region, customer FROM transactions WHERE 1=1'
     params: List = []
     if start_date:
@@ -1827,7 +2847,7 @@ def meta_distincts(start_date: Optional[str] = None, end_date: Optional[str] = N
     if end_date:
         q += ' AND date <= ?'
         params.append(end_date)
-    conn = sqlite3.connect(DATABASE)
+    conn = _reader()
     df = pd.read_sql_query(q, conn, params=params)
     conn.close()
     products = sorted([x for x in df['product'].dropna().unique().tolist()]) if 'product' in df else []
@@ -1898,6 +2918,7 @@ def ai_test(_=Depends(require_api_key)):
 
 
 @app.get('/ai/query')
+@_coalesced('/ai/query')
 def ai_query(request: Request, query: str = 'most_profitable_product', start_date: str = None, end_date: str = None, _=Depends(require_api_key)):
     try:
         rl_ai(request)
@@ -1911,21 +2932,20 @@ def ai_query(request: Request, query: str = 'most_profitable_product', start_dat
     - by_region
     - by_customer
     """
-    conn = sqlite3.connect(DATABASE)
+    conn = _reader()
     
-    # Try to get the latest uploaded dataset first, fallback to transactions table
-    try:
-        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'data_%' ORDER BY name DESC LIMIT 1")
-        result = cursor.fetchone()
-        table_name = result[0] if result else 'transactions'
-    except:
-        table_name = 'transactions'
+    # The latest uploaded dataset, or the transactions table before any upload
+    active = datasets.active()
+    table_name = active.table_name
     
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {table_name}', conn, parse_dates=['date'] if 'date' in pd.read_sql_query(f'SELECT * FROM {table_name} LIMIT 0', conn).columns else None)
+        if table_name == 'transactions':
+            df = _transactions_frame(conn)
+        else:
+            df = _load_frame(conn, table_name, dates=['date'])
     except Exception as e:
         # Fallback to transactions table if there's an error
-        df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+        df = _transactions_frame(conn)
     finally:
         conn.close()
 
@@ -2062,34 +3082,55 @@ def _apply_date_and_filters(base: str, params: List, start_date: Optional[str],
     if end_date:
         base += ' AND date <= ?'
         params.append(end_date)
-    # simple filters: [{field, op, value}] with op in (=, like)
-    if filters:
-        for f in filters:
-            try:
-                field = str(f.get('field'))
-                op = str(f.get('op','='))
-                value = f.get('value')
-            except Exception:
-                continue
-            if field not in (ALLOWED_GROUP_FIELDS | {'type','product','customer','region'}):
-                continue
-            if op.lower() == 'like':
-                base += f' AND LOWER({field}) LIKE ?'
-                params.append(f"%{str(value).lower()}%")
-            else:
-                base += f' AND {field} = ?'
-                params.append(value)
+    for field, op, value in _valid_filters(filters):
+        if op == 'like':
+            base += f' AND LOWER({field}) LIKE ?'
+            params.append(f"%{str(value).lower()}%")
+        else:
+            base += f' AND {field} = ?'
+            params.append(value)
     return base, params
 
+def _valid_filters(filters: Optional[list]) -> List[Tuple[str, str, object]]:
+    """(field, op, value) of the simple filters [{field, op, value}] with op in (=, like)."""
+    valid = []
+    for f in filters or []:
+        try:
+            field = str(f.get('field'))
+            op = str(f.get('op','=')).lower()
+            value = f.get('value')
+        except Exception:
+            continue
+        if field not in (ALLOWED_GROUP_FIELDS | {'type','product','customer','region'}):
+            continue
+        valid.append((field, op, value))
+    return valid
+
+def _shared_conditions(start_date: Optional[str], end_date: Optional[str], filters: Optional[list]) -> list:
+    """_apply_date_and_filters for the shared database."""
+    return storage.conditions(start_date, end_date, _valid_filters(filters))
+
 def _metric_expr(metric: str) -> str:
     m = (metric or '').lower()
-    if m in ('sum_amount','amount','sum'): return '(quantity * price)'
+    # the stored amount column (or its expression), read from the covering indexes
+    if m in ('sum_amount','amount','sum'): return AMOUNT_SQL
     if m in ('sum_quantity','quantity'): return 'quantity'
     if m in ('count','rows'): return '1'
     # default amount
-    return '(quantity * price)'
+    return AMOUNT_SQL
+
+def _metric_source(conn, metric: str) -> Tuple[str, str]:
+    """(table, expression to SUM) for a metric: the daily rollup's measure
+    when the rollup exists, the raw transactions otherwise. Every allowed
+    group_by and filter field is a rollup dimension."""
+    expr = _metric_expr(metric)
+    measure = rollup_measure(expr)
+    if measure and rollup_available(conn):
+        return ROLLUP_TABLE, measure
+    return 'transactions', expr
 
 @app.post('/analytics/query')
+@_cached('/analytics/query', shared=True)
 def analytics_query(body: dict = Body(...), _=Depends(require_api_key)):
     metric = (body or {}).get('metric','sum_amount')
     group_by = (body or {}).get('group_by')
@@ -2099,49 +3140,61 @@ def analytics_query(body: dict = Body(...), _=Depends(require_api_key)):
     top_n = int((body or {}).get('top_n') or 0)
     if not group_by or group_by not in ALLOWED_GROUP_FIELDS:
         raise HTTPException(status_code=400, detail=f'group_by must be one of {sorted(ALLOWED_GROUP_FIELDS)}')
-    expr = _metric_expr(metric)
-    base = f'SELECT {group_by} AS label, SUM({expr}) AS value FROM transactions WHERE 1=1'
+    if storage.SHARED_STORAGE:
+        items = storage.metric_by(metric, group_by, _shared_conditions(start_date, end_date, filters), top_n)
+        return {'items': items, 'metric': metric, 'group_by': group_by}
+    conn = _reader()
+    table, expr = _metric_source(conn, metric)
+    base = f'SELECT {group_by} AS label, SUM({expr}) AS value FROM {table} WHERE 1=1'
     params: List = []
     base, params = _apply_date_and_filters(base, params, start_date, end_date, filters)
-    base += f' GROUP BY {group_by} ORDER BY value DESC'
+    # label breaks ties, so top_n cuts the same groups from either source
+    base += f' GROUP BY {group_by} ORDER BY value DESC, label'
     if top_n and top_n > 0:
         base += ' LIMIT ?'
         params.append(top_n)
-    conn = sqlite3.connect(DATABASE)
     df = pd.read_sql_query(base, conn, params=params)
     conn.close()
     items = df.to_dict(orient='records') if not df.empty else []
     return {'items': items, 'metric': metric, 'group_by': group_by}
 
 @app.post('/analytics/timeseries')
+@_cached('/analytics/timeseries', shared=True)
 def analytics_timeseries(body: dict = Body(...), _=Depends(require_api_key)):
     metric = (body or {}).get('metric','sum_amount')
     start_date = (body or {}).get('start_date')
     end_date = (body or {}).get('end_date')
     filters = (body or {}).get('filters', [])
-    expr = _metric_expr(metric)
-    base = f'SELECT date, SUM({expr}) AS value FROM transactions WHERE 1=1'
-    params: List = []
-    base, params = _apply_date_and_filters(base, params, start_date, end_date, filters)
-    base += ' GROUP BY date ORDER BY date ASC'
-    conn = sqlite3.connect(DATABASE)
-    df = pd.read_sql_query(base, conn, params=params, parse_dates=['date'])
-    conn.close()
+    if storage.SHARED_STORAGE:
+        df = storage.metric_series(metric, _shared_conditions(start_date, end_date, filters))
+    else:
+        conn = _reader()
+        table, expr = _metric_source(conn, metric)
+        base = f'SELECT date, SUM({expr}) AS value FROM {table} WHERE 1=1'
+        params: List = []
+        base, params = _apply_date_and_filters(base, params, start_date, end_date, filters)
+        base += ' GROUP BY date ORDER BY date ASC'
+        df = pd.read_sql_query(base, conn, params=params, parse_dates=['date'])
+        conn.close()
     dates = df['date'].dt.strftime('%Y-%m-%d').tolist() if not df.empty else []
     values = df['value'].tolist() if not df.empty else []
     return {'dates': dates, 'values': values, 'metric': metric}
 
 @app.post('/analytics/kpi')
+@_cached('/analytics/kpi', shared=True)
 def analytics_kpi(body: dict = Body(...), _=Depends(require_api_key)):
     metric = (body or {}).get('metric','sum_amount')
     start_date = (body or {}).get('start_date')
     end_date = (body or {}).get('end_date')
     filters = (body or {}).get('filters', [])
-    expr = _metric_expr(metric)
-    base = f'SELECT SUM({expr}) FROM transactions WHERE 1=1'
+    if storage.SHARED_STORAGE:
+        val = storage.metric_total(metric, _shared_conditions(start_date, end_date, filters))
+        return {'value': float(val or 0.0), 'metric': metric}
+    conn = _reader()
+    table, expr = _metric_source(conn, metric)
+    base = f'SELECT SUM({expr}) FROM {table} WHERE 1=1'
     params: List = []
     base, params = _apply_date_and_filters(base, params, start_date, end_date, filters)
-    conn = sqlite3.connect(DATABASE)
     val = conn.execute(base, params).fetchone()[0]
     conn.close()
     return {'value': float(val or 0.0), 'metric': metric}
@@ -2226,6 +3279,8 @@ def ai_dashboard_config(body: dict = Body(...), _=Depends(require_api_key)):
         return {'config': None, 'ai_error': f'AI produced invalid config: {str(e)}'}
 
 @app.post('/analytics/smart-dashboard')
+@_cached('/analytics/smart-dashboard')
+@_coalesced('/analytics/smart-dashboard')
 def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)):
     """Generate smart dashboard analytics based on uploaded dataset structure"""
     table_name = body.get('table_name')
@@ -2238,13 +3293,18 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
         raise HTTPException(status_code=400, detail='table_name is required')
     
     try:
-        conn = sqlite3.connect(DATABASE)
-        
-        # Get table schema
-        cursor = conn.execute(f"PRAGMA table_info({table_name})")
-        columns_info = cursor.fetchall()
-        columns = [col[1] for col in columns_info]  # column names
-        column_types = {col[1]: col[2] for col in columns_info}  # name: type mapping
+        conn = _reader()
+        
+        # Column roles were detected at upload time; fall back to the table
+        # schema for tables without file_metadata
+        file_metadata = datasets.metadata(table_name)
+        if file_metadata:
+            columns = file_metadata['columns']
+            roles = roles_for(columns, file_metadata['column_types'] or {}, file_metadata.get('roles'))
+        else:
+            columns_info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            columns = [col[1] for col in columns_info]
+            roles = detect_roles(columns, {col[1]: SQL_AFFINITY_DTYPES.get(col[2].upper()) for col in columns_info})
         
         # Get sample data to understand content
         query = f"SELECT * FROM {table_name} LIMIT 1000"
@@ -2252,18 +3312,7 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
         
         # Generate smart KPIs
         kpis = []
-        numeric_columns = [col for col in columns if column_types.get(col, '').upper() in ('INTEGER', 'REAL', 'NUMERIC')]
-        
-        # Also check for columns with numeric data even if type is TEXT
-        for col in columns:
-            if col not in numeric_columns:
-                try:
-                    # Try to convert to numeric
-                    numeric_vals = pd.to_numeric(df[col], errors='coerce')
-                    if numeric_vals.notna().sum() > len(df) * 0.5:  # More than 50% are numeric
-                        numeric_columns.append(col)
-                except:
-                    pass
+        numeric_columns = list(roles['numeric'])
         
         for col in numeric_columns[:4]:  # Limit to 4 KPIs
             try:
@@ -2342,7 +3391,7 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
         charts = []
         
         # Look for date columns for time series
-        date_columns = [col for col in columns if any(keyword in col.lower() for keyword in ['date', 'time', 'created', 'updated'])]
+        date_columns = roles['time_columns']
         if date_columns and numeric_columns:
             date_col = date_columns[0]
             value_col = numeric_columns[0]
@@ -2356,7 +3405,7 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
                 ORDER BY {date_col} 
                 LIMIT 50
                 """
-                time_df = pd.read_sql_query(time_query, conn)
+                time_df = _analytics_frame(conn, table_name, time_query)
                 if not time_df.empty:
                     charts.append({
                         'title': f'{value_col.replace("_", " ").title()} Over Time',
@@ -2370,7 +3419,7 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
                 pass
         
         # Look for categorical columns for distribution charts
-        categorical_columns = [col for col in columns if column_types.get(col, '').upper() in ('TEXT', 'VARCHAR')]
+        categorical_columns = roles['categorical']
         if categorical_columns and numeric_columns:
             cat_col = categorical_columns[0]
             value_col = numeric_columns[0]
@@ -2383,7 +3432,7 @@ def smart_dashboard_analytics(body: dict = Body(...), _=Depends(require_api_key)
                 ORDER BY value DESC 
                 LIMIT 10
                 """
-                dist_df = pd.read_sql_query(dist_query, conn)
+                dist_df = _analytics_frame(conn, table_name, dist_query)
                 if not dist_df.empty:
                     charts.append({
                         'title': f'{value_col.replace("_", " ").title()} by {cat_col.replace("_", " ").title()}',
@@ -2441,8 +3490,8 @@ def ai_nl_query(request: Request, body: dict = Body(...), _=Depends(require_api_
         }
 
     # Execute same path as ai_query
-    conn = sqlite3.connect(DATABASE)
-    df = pd.read_sql_query('SELECT * FROM transactions', conn, parse_dates=['date'])
+    conn = _reader()
+    df = _transactions_frame(conn)
     conn.close()
     if start_date:
         df = df[df['date'] >= start_date]
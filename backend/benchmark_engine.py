@@ -0,0 +1,141 @@
+"""Compare the DuckDB analytics engine against the current SQLite/pandas path.
+
+Builds a synthetic dataset through the regular ingest (SQLite table plus
+Parquet sidecar) in a temporary directory, then times the group-by,
+timeseries, summary and per-region queries of the dataset endpoints both
+ways and checks that they agree.
+
+    python benchmark_engine.py --rows 1000000 --repeat 5
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ['ANALYTICS_ENGINE'] = 'duckdb'
+
+import pandas as pd  # noqa: E402
+
+try:
+    from .analytics_engine import DUCKDB_ENABLED, fetch_frame  # noqa: E402
+    from .columnar import read_dataset  # noqa: E402
+    from .ingest import ingest_file  # noqa: E402
+except ImportError:  # support running as a module without package context
+    from analytics_engine import DUCKDB_ENABLED, fetch_frame  # noqa: E402
+    from columnar import read_dataset  # noqa: E402
+    from ingest import ingest_file  # noqa: E402
+
+TABLE = 'data_benchmark'
+
+
+def write_csv(path: str, rows: int):
+    rnd = random.Random(42)
+    regions = ['North', 'South', 'East', 'West', 'Central']
+    with open(path, 'w') as f:
+        f.write('date,type,product,region,customer,quantity,price\n')
+        for i in range(rows):
+            f.write(f'2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d},'
+                    f'{"sale" if rnd.random() < 0.7 else "purchase"},Product {rnd.randint(1, 200)},'
+                    f'{rnd.choice(regions)},Customer {rnd.randint(1, 5000)},'
+                    f'{rnd.randint(1, 20)},{rnd.randint(100, 50000) / 100}\n')
+
+
+def current_groupby(conn, database, version):
+    # analyze_dataset: _load_frame + pandas groupby
+    df = read_dataset(database, TABLE, version, ['product', 'quantity'])
+    return df.groupby('product')['quantity'].sum().reset_index()
+
+
+def current_timeseries(conn, database, version):
+    df = read_dataset(database, TABLE, version, ['date', 'price'])
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values('date')
+    out = df.groupby(df['date'].dt.date)['price'].sum().reset_index()
+    out['date'] = out['date'].astype(str)
+    return out
+
+
+SUMMARY_SQL = f'''
+SELECT TOTAL(CASE WHEN lower(CAST("type" AS TEXT)) = 'sale' THEN "quantity" * "price" END) AS sales,
+       TOTAL(CASE WHEN lower(CAST("type" AS TEXT)) = 'purchase' THEN "quantity" * "price" END) AS purchases,
+       COUNT(*) AS n
+FROM "{TABLE}" WHERE "date" >= ? AND "date" <= ?
+'''
+REGION_SQL = f'''
+SELECT "region", TOTAL("quantity" * "price") AS amount, TOTAL("quantity") AS quantity, COUNT(*) AS n
+FROM "{TABLE}" WHERE "region" IS NOT NULL GROUP BY "region" ORDER BY "region"
+'''
+GROUPBY_SQL = (f'SELECT "product", TOTAL("quantity") AS "quantity" FROM "{TABLE}" '
+               f'WHERE "product" IS NOT NULL GROUP BY "product" ORDER BY "product"')
+TIMESERIES_SQL = (f'SELECT substr("date", 1, 10) AS "date", TOTAL("price") AS "price" FROM "{TABLE}" '
+                  f'WHERE "date" IS NOT NULL GROUP BY 1 ORDER BY 1')
+RANGE = ('2024-03-01', '2024-09-30')
+
+CASES = [
+    ('groupby (analyze)', current_groupby,
+     lambda conn, db, v: fetch_frame(db, TABLE, v, GROUPBY_SQL)),
+    ('timeseries (analyze)', current_timeseries,
+     lambda conn, db, v: fetch_frame(db, TABLE, v, TIMESERIES_SQL)),
+    ('summary (export)', lambda conn, db, v: pd.read_sql_query(SUMMARY_SQL, conn, params=RANGE),
+     lambda conn, db, v: fetch_frame(db, TABLE, v, SUMMARY_SQL, RANGE)),
+    ('by_region (export)', lambda conn, db, v: pd.read_sql_query(REGION_SQL, conn),
+     lambda conn, db, v: fetch_frame(db, TABLE, v, REGION_SQL)),
+]
+
+
+def timed(fn, repeat: int):
+    result, times = None, []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times) * 1000
+
+
+def same(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    if a.shape != b.shape:
+        return False
+    for x, y in zip(a.itertuples(index=False), b.itertuples(index=False)):
+        for u, v in zip(x, y):
+            if isinstance(u, float) or isinstance(v, float):
+                if abs(float(u) - float(v)) > 1e-6 * max(1.0, abs(float(u))):
+                    return False
+            elif u != v:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if not DUCKDB_ENABLED:
+        raise SystemExit('duckdb is not installed')
+
+    workdir = tempfile.mkdtemp(prefix='engine_bench_')
+    try:
+        database = os.path.join(workdir, 'bench.db')
+        csv_path = os.path.join(workdir, 'bench.csv')
+        write_csv(csv_path, args.rows)
+        meta = ingest_file(database, csv_path, 'bench.csv', TABLE)
+        version = meta.get('version') or 1
+        conn = sqlite3.connect(database)
+        print(f'{args.rows:,} rows, median of {args.repeat} runs')
+        print(f'{"query":<22}{"current ms":>12}{"duckdb ms":>12}{"speedup":>10}  match')
+        for name, current, engine in CASES:
+            expected, current_ms = timed(lambda: current(conn, database, version), args.repeat)
+            actual, engine_ms = timed(lambda: engine(conn, database, version), args.repeat)
+            match = actual is not None and same(expected, actual)
+            print(f'{name:<22}{current_ms:>12.1f}{engine_ms:>12.1f}{current_ms / engine_ms:>9.1f}x  {match}')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Parquet sidecar copies of uploaded datasets.
+
+Next to the SQLite table, every dataset version is also written as one
+Parquet part file (``business_parquet/<table>/part-v000001.parquet``, one more
+part per append). Readers load them through memory-mapped Arrow with column
+projection and row-group predicate pushdown, which is far cheaper than a
+``SELECT *`` through sqlite3 when a handler needs a few columns.
+
+SQLite stays the source of truth: a part is written to a temporary file while
+the upload streams in and only renamed into place after the ingest commits.
+A dataset whose parts are missing or incomplete (pyarrow not installed,
+uploaded before sidecars existed, a failed write) is read from SQLite.
+Integer columns are stored as int64, widened to float64 once a chunk holds
+fractional values (as SQLite then reads them back), other numeric columns as
+float64 and everything else as strings, in the same text form SQLite holds
+them.
+"""
+import logging
+import os
+import sqlite3
+from typing import List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+    PARQUET_ENABLED = os.getenv('PARQUET_SIDECAR', '1') != '0'
+except Exception:  # pragma: no cover
+    pa = pq = None  # type: ignore
+    PARQUET_ENABLED = False
+
+logger = logging.getLogger(__name__)
+
+
+def parquet_dir(database: str) -> str:
+    """Sidecar root of a database file (``business.db`` -> ``business_parquet/``)."""
+    if os.getenv('PARQUET_DIR'):
+        return os.path.join(os.getenv('PARQUET_DIR'), os.path.splitext(os.path.basename(database))[0])
+    return os.path.splitext(os.path.abspath(database))[0] + '_parquet'
+
+
+
+def _database_path(conn: sqlite3.Connection) -> str:
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+def _part_path(database: str, table_name: str, version: int) -> str:
+    return os.path.join(parquet_dir(database), table_name, f'part-v{version:06d}.parquet')
+
+
+def dataset_parts(database: str, table_name: str, version: int) -> Optional[List[str]]:
+    """Part files of versions 1..``version``, or None unless all of them exist."""
+    if not PARQUET_ENABLED:
+        return None
+    parts = [_part_path(database, table_name, v) for v in range(1, (version or 1) + 1)]
+    return parts if all(os.path.exists(p) for p in parts) else None
+
+
+def _numeric(col: pd.Series, name: str) -> pd.Series:
+    values = pd.to_numeric(col, errors='coerce')
+    if values.notna().sum() != col.notna().sum():
+        raise ValueError(f'non-numeric values in numeric column {name}')
+    return values
+
+
+def _to_storage(chunk: pd.DataFrame, schema) -> pd.DataFrame:
+    """``chunk`` converted to the sidecar's int64 / float64 / string column types."""
+    out = {}
+    for field in schema:
+        col = chunk[field.name]
+        if pa.types.is_integer(field.type):
+            out[field.name] = _numeric(col, field.name).astype('Int64')
+        elif pa.types.is_floating(field.type):
+            out[field.name] = _numeric(col, field.name).astype('float64')
+        else:
+            if pd.api.types.is_datetime64_any_dtype(col):
+                col = col.dt.strftime('%Y-%m-%d %H:%M:%S')
+            out[field.name] = col.astype(object).where(col.notna(), None).map(
+                lambda v: v if v is None else str(v))
+    return pd.DataFrame(out)
+
+
+def _schema_for(chunk: pd.DataFrame):
+    fields = []
+    for col in chunk.columns:
+        values = chunk[col]
+        if pd.api.types.is_bool_dtype(values) or not pd.api.types.is_numeric_dtype(values):
+            fields.append(pa.field(col, pa.string()))
+        elif pd.api.types.is_integer_dtype(values):
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+
+def _widened(schema, chunk: pd.DataFrame):
+    """``schema`` with the int64 columns that ``chunk`` holds fractional values
+    for made float64; ``schema`` itself when none do."""
+    fields, changed = [], False
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            values = _numeric(chunk[field.name], field.name).dropna()
+            if len(values) and not (values % 1 == 0).all():
+                field, changed = pa.field(field.name, pa.float64()), True
+        fields.append(field)
+    return pa.schema(fields) if changed else schema
+
+
+class SidecarWriter:
+    """Writes one dataset version's Parquet part alongside the SQLite ingest.
+
+    Any write error only disables the sidecar for this version; it never
+    fails the upload.
+    """
+
+    def __init__(self, database: str, table_name: str, version: int, schema=None):
+        self.database = database
+        self.table_name = table_name
+        self.version = version
+        self.schema = schema
+        self.path = _part_path(database, table_name, version)
+        self.tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        self._writer = None
+        self.failed = False
+
+    @classmethod
+    def open(cls, conn: sqlite3.Connection, table_name: str, version: int, columns: Optional[List[str]] = None):
+        """A writer for ``version``, or None when sidecars are off or an earlier part is missing."""
+        if not PARQUET_ENABLED:
+            return None
+        database = _database_path(conn)
+        if not database:
+            return None
+        schema = None
+        if version > 1:
+            previous = dataset_parts(database, table_name, version - 1)
+            if previous is None:
+                return None
+            schema = pq.read_schema(previous[-1])
+            if columns is not None:
+                schema = pa.schema([schema.field(c) for c in columns])
+        return cls(database, table_name, version, schema)
+
+    def write(self, chunk: pd.DataFrame):
+        if self.failed:
+            return
+        try:
+            if self.schema is None:
+                self.schema = _schema_for(chunk)
+            schema = _widened(self.schema, chunk)
+            if schema is not self.schema:
+                self._rewrite(schema)
+            if self._writer is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+            table = pa.Table.from_pandas(_to_storage(chunk, self.schema), schema=self.schema, preserve_index=False)
+            self._writer.write_table(table)
+        except Exception as e:
+            logger.warning(f'Parquet sidecar for {self.table_name} v{self.version} disabled: {e}')
+            self.failed = True
+            self.discard()
+
+    def _rewrite(self, schema):
+        """Switch to ``schema``, converting the rows already written."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            written = pq.read_table(self.tmp_path).cast(schema)
+            self._writer = pq.ParquetWriter(self.tmp_path, schema)
+            self._writer.write_table(written)
+        self.schema = schema
+
+    def close(self):
+        """Finish the temporary part file (before the SQLite commit)."""
+        if self._writer is None or self.failed:
+            return
+        try:
+            self._writer.close()
+            self._writer = None
+        except Exception as e:
+            logger.warning(f'Parquet sidecar for {self.table_name} v{self.version} disabled: {e}')
+            self.failed = True
+            self.discard()
+
+    def publish(self):
+        """Move the part into place once the ingest has committed."""
+        if self.failed or not os.path.exists(self.tmp_path):
+            return
+        try:
+            if self.version == 1:
+                # a re-created table must not pick up parts of its predecessor
+                for name in os.listdir(os.path.dirname(self.path)):
+                    if name.startswith('part-v') and name.endswith('.parquet'):
+                        os.remove(os.path.join(os.path.dirname(self.path), name))
+            os.replace(self.tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f'Failed to publish Parquet sidecar for {self.table_name}: {e}')
+            self.discard()
+
+    def discard(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+            self._writer = None
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def read_dataset(database: str, table_name: str, version: int, columns: Optional[List[str]] = None,
+                 filters=None) -> Optional[pd.DataFrame]:
+    """The dataset from its Parquet parts, or None when it has no complete sidecar.
+
+    ``columns`` projects the read; ``filters`` are pyarrow predicates in DNF
+    (e.g. ``[('date', '>=', '2025-01-01')]``) applied while reading, so row
+    groups outside the range are skipped using their statistics.
+    """
+    parts = dataset_parts(database, table_name, version)
+    if parts is None:
+        return None
+    try:
+        tables = [pq.read_table(p, columns=columns, filters=filters, memory_map=True) for p in parts]
+        # an append may have widened an int64 column of the earlier parts
+        return pa.concat_tables(tables, promote_options='permissive').to_pandas()
+    except Exception as e:
+        logger.warning(f'Parquet read of {table_name} failed, falling back to SQLite: {e}')
+        return None
+
@@ -0,0 +1,364 @@
+"""Pooled, tuned SQLite connections.
+
+Handlers check a read connection out of the database's pool instead of
+connecting per request; ``close()`` hands it back, so the connect and the
+page cache survive across requests.
+
+Writes in the API process are queued to one writer thread that owns the
+writer connection, so they run one at a time in submission order instead of
+racing for SQLite's file lock. Small writes waiting together are committed as
+one transaction, each inside its own savepoint so a failing one doesn't take
+the others down. Writes that manage their own transaction can be submitted
+as exclusive and run alone. The queue is bounded: a submit that finds it full for WRITE_QUEUE_TIMEOUT
+seconds raises WriteQueueFull instead of piling up more work.
+
+Every connection runs with WAL journaling, so readers keep answering from the
+last committed snapshot while an upload writes, plus synchronous=NORMAL
+(durable at WAL checkpoints, still crash-safe), a memory-mapped file, a larger
+page cache and in-memory temp b-trees for sorts and GROUP BYs. Committed
+writes live in the ``-wal`` file until a checkpoint, so the database has to
+be kept (or mounted) together with it; ``close_pools()`` checkpoints and
+truncates the WAL at shutdown.
+
+Uploads don't go through the queue: each holds the write lock for its whole
+transaction, so they run one at a time on their own connection (opened
+through ``connect()`` with the same pragmas, in a worker process when the API
+uses them) and SQLite's lock orders them against the writer thread. A batch
+that finds the lock taken keeps retrying its BEGIN for up to WRITE_LOCK_WAIT
+seconds, so queued writes wait for the upload instead of failing once
+SQLITE_BUSY_TIMEOUT runs out.
+"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '30'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', str(32 * 1024)))
+# Idle read connections kept per database; more are opened under load and
+# closed again when handed back to a full pool
+SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', '16'))
+# Writes waiting for the writer thread before submits start to time out
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', '64'))
+WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', '5'))
+# Most small writes committed in one transaction
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '32'))
+# How long a batch keeps retrying for a write lock held by another connection
+# (an upload's ingest) before its writes fail
+WRITE_LOCK_WAIT = float(os.getenv('WRITE_LOCK_WAIT', '900'))
+
+
+class WriteQueueFull(Exception):
+    """The write queue stayed full for WRITE_QUEUE_TIMEOUT seconds."""
+
+
+def configure(conn: sqlite3.Connection):
+    """Apply the journal and cache pragmas to a fresh connection."""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+
+def is_busy(error: Exception) -> bool:
+    """Whether ``error`` is SQLite giving up on a lock held by another connection."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff == sqlite3.SQLITE_BUSY
+    return 'database is locked' in str(error)
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """A new, unpooled connection with the pragmas applied."""
+    conn = sqlite3.connect(database, timeout=SQLITE_BUSY_TIMEOUT, **kwargs)
+    configure(conn)
+    return conn
+
+
+class PooledConnection(sqlite3.Connection):
+    """A read connection whose ``close()`` returns it to its pool."""
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ('fn', 'args', 'kwargs', 'exclusive', 'future')
+
+    def __init__(self, fn, args, kwargs, exclusive):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.exclusive = exclusive
+        self.future = Future()
+
+
+class WriteQueue:
+    """The writer thread of one database and the bounded queue feeding it.
+
+    ``observers`` are called as ``fn(kind, seconds)`` after every commit,
+    with kind ``'batch'`` or ``'exclusive'`` and the time from the start of
+    the transaction to its commit.
+    """
+
+    def __init__(self, database: str, size: int = WRITE_QUEUE_SIZE, batch_size: int = WRITE_BATCH_SIZE):
+        self.database = database
+        self.batch_size = batch_size
+        self.observers: List[Callable[[str, float], None]] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, fn, *args, exclusive: bool = False, **kwargs) -> Future:
+        """Queue ``fn(conn, *args, **kwargs)`` for the writer thread.
+
+        Plain writes share a transaction with the writes queued next to them
+        and must not commit. ``exclusive`` writes run on their own and may
+        commit as they go; whatever they leave open is committed after them.
+        """
+        self._start()
+        write = _Write(fn, args, kwargs, exclusive)
+        try:
+            self._queue.put(write, timeout=WRITE_QUEUE_TIMEOUT)
+        except queue.Full:
+            raise WriteQueueFull(f'{self._queue.maxsize} writes already queued')
+        return write.future
+
+    def write(self, fn, *args, exclusive: bool = False, **kwargs):
+        """``submit`` and wait for the result."""
+        return self.submit(fn, *args, exclusive=exclusive, **kwargs).result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = None
+        pending = None
+        try:
+            while True:
+                write = pending if pending is not None else self._queue.get()
+                pending = None
+                if write is _STOP:
+                    return
+                if conn is None:
+                    try:
+                        conn = connect(self.database)
+                    except Exception as e:
+                        if write.future.set_running_or_notify_cancel():
+                            write.future.set_exception(e)
+                        continue
+                if write.exclusive:
+                    self._apply_exclusive(conn, write)
+                    continue
+                batch = [write]
+                while len(batch) < self.batch_size:
+                    try:
+                        write = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if write is _STOP or write.exclusive:
+                        pending = write
+                        break
+                    batch.append(write)
+                self._apply_batch(conn, batch)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _observe(self, kind: str, started: float):
+        seconds = time.perf_counter() - started
+        for observer in self.observers:
+            try:
+                observer(kind, seconds)
+            except Exception as e:
+                logger.warning(f'Write queue observer failed: {e}')
+
+    def _apply_batch(self, conn: sqlite3.Connection, batch: List[_Write]):
+        batch = [w for w in batch if w.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            self._begin(conn)
+            for write in batch:
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    result = write.fn(conn, *write.args, **write.kwargs)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    conn.execute('RELEASE queued_write')
+                    outcomes.append((write, None, e))
+                else:
+                    conn.execute('RELEASE queued_write')
+                    outcomes.append((write, result, None))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for write in batch:
+                write.future.set_exception(e)
+            return
+        self._observe('batch', started)
+        for write, result, error in outcomes:
+            if error is None:
+                write.future.set_result(result)
+            else:
+                write.future.set_exception(error)
+
+    def _begin(self, conn: sqlite3.Connection):
+        """BEGIN IMMEDIATE, retried while another connection holds the write
+        lock; nothing of the batch has run yet, so the retry is safe."""
+        deadline = time.monotonic() + WRITE_LOCK_WAIT
+        while True:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or time.monotonic() >= deadline:
+                    raise
+                logger.info(f'Write lock of {self.database} is held elsewhere, retrying')
+                time.sleep(0.01)
+
+    def _apply_exclusive(self, conn: sqlite3.Connection, write: _Write):
+        if not write.future.set_running_or_notify_cancel():
+            return
+        started = time.perf_counter()
+        try:
+            result = write.fn(conn, *write.args, **write.kwargs)
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            write.future.set_exception(e)
+            return
+        self._observe('exclusive', started)
+        write.future.set_result(result)
+
+    def close(self):
+        """Let the queued writes finish and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+
+class ConnectionPool:
+    """Read connections and the write queue of one database file."""
+
+    def __init__(self, database: str, size: int = SQLITE_READ_POOL_SIZE):
+        self.database = database
+        self.size = size
+        self.pid = os.getpid()
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self.writes = WriteQueue(database)
+
+    def reader(self) -> PooledConnection:
+        """An idle read connection, or a new one; ``close()`` it when done.
+
+        Connections are not tied to a thread, so a streaming response may
+        finish one from another worker thread, but only one caller uses a
+        connection at a time.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.database, check_same_thread=False, factory=PooledConnection)
+            conn.pool = self
+            return conn
+
+    def release(self, conn: PooledConnection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.pool = None
+            conn.close()
+            return
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.pool = None
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.pool = None
+            conn.close()
+        self.writes.close()
+        self.checkpoint()
+
+    def checkpoint(self):
+        """Copy the WAL into the database file and truncate it, so the file
+        holds every committed write on its own."""
+        conn = connect(self.database)
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# Observers of every pool's write queue (see WriteQueue), including pools
+# created later: close_pools() and a fork start new ones
+_write_observers: List[Callable[[str, float], None]] = []
+
+
+def pool_for(database: str) -> ConnectionPool:
+    """The process-wide pool of ``database``; a forked worker gets its own."""
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[database] = ConnectionPool(database)
+            pool.writes.observers.extend(_write_observers)
+        return pool
+
+
+def observe_writes(fn: Callable[[str, float], None]):
+    """Add ``fn`` to the write queue observers of every pool, present and future."""
+    with _pools_lock:
+        _write_observers.append(fn)
+        for pool in _pools.values():
+            pool.writes.observers.append(fn)
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        try:
+            pool.close()
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to close connections of {pool.database}: {e}')
@@ -0,0 +1,122 @@
+"""Row fingerprints and a Bloom filter over the transactions fingerprint index.
+
+Fingerprints are 128-bit hashes of a transaction's business columns, computed
+for a whole DataFrame at once with ``pd.util.hash_pandas_object``. The Bloom
+filter only ever answers "definitely new" or "maybe known"; maybe-known rows
+are confirmed against ``ux_transactions_fingerprint``, so a stale filter costs
+extra index lookups but never drops or duplicates a row.
+"""
+import math
+import sqlite3
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+FINGERPRINT_COLUMNS = ['date', 'type', 'product', 'quantity', 'price', 'customer', 'region']
+_HASH_KEYS = ('bm-fingerprint-1', 'bm-fingerprint-2')
+LOOKUP_BATCH = 500
+
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """(n, 2) uint64 fingerprint halves for normalized transaction rows."""
+    frame = df[FINGERPRINT_COLUMNS]
+    halves = [pd.util.hash_pandas_object(frame, index=False, hash_key=key).to_numpy()
+              for key in _HASH_KEYS]
+    return np.column_stack(halves)
+
+
+def to_hex(fingerprints: np.ndarray) -> List[str]:
+    return [f'{hi:016x}{lo:016x}' for hi, lo in fingerprints.tolist()]
+
+
+def from_hex(values: Iterable[str]) -> np.ndarray:
+    pairs = [(int(v[:16], 16), int(v[16:32], 16)) for v in values if v and len(v) == 32]
+    return np.array(pairs, dtype=np.uint64).reshape(-1, 2)
+
+
+class BloomFilter:
+    """Numpy-backed Bloom filter keyed by 128-bit fingerprints (double hashing)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(int(capacity), 1024)
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, fingerprints: np.ndarray) -> np.ndarray:
+        h1 = fingerprints[:, 0:1]
+        h2 = fingerprints[:, 1:2] | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)[None, :]
+        return (h1 + steps * h2) % np.uint64(self.size)
+
+    def add(self, fingerprints: np.ndarray):
+        if len(fingerprints) == 0:
+            return
+        pos = self._positions(fingerprints).ravel()
+        np.bitwise_or.at(self.bits, (pos >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (pos & np.uint64(7)).astype(np.uint8)))
+        self.count += len(fingerprints)
+
+    def might_contain(self, fingerprints: np.ndarray) -> np.ndarray:
+        if len(fingerprints) == 0:
+            return np.zeros(0, dtype=bool)
+        pos = self._positions(fingerprints)
+        bytes_ = self.bits[(pos >> np.uint64(3)).astype(np.int64)]
+        hit = (bytes_ >> (pos & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+        return hit.all(axis=1)
+
+
+class FingerprintIndex:
+    """Per-process Bloom filter kept in sync with the transactions table.
+
+    New rows are picked up incrementally by id; the filter is rebuilt when it
+    outgrows its capacity or the table was emptied or recreated underneath it.
+    """
+
+    def __init__(self, error_rate: float = 0.01):
+        self.error_rate = error_rate
+        self.bloom: Optional[BloomFilter] = None
+        self.last_id = 0
+
+    def sync(self, conn: sqlite3.Connection):
+        """Add fingerprints of rows inserted since the last sync (including this
+        connection's uncommitted ones)."""
+        max_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+        if self.bloom is not None and (max_id < self.last_id or self.bloom.count > self.bloom.capacity):
+            self.invalidate()
+        if self.bloom is None:
+            rows = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] or 0
+            self.bloom = BloomFilter(rows * 2, self.error_rate)
+        if max_id > self.last_id:
+            cur = conn.execute(
+                'SELECT fingerprint FROM transactions WHERE id > ? AND fingerprint IS NOT NULL',
+                (self.last_id,)
+            )
+            while True:
+                rows = cur.fetchmany(50000)
+                if not rows:
+                    break
+                self.bloom.add(from_hex(r[0] for r in rows))
+            self.last_id = max_id
+
+    def invalidate(self):
+        """Forget everything, e.g. after a rolled-back insert; rebuilt on next sync."""
+        self.bloom = None
+        self.last_id = 0
+
+    def known_mask(self, conn: sqlite3.Connection, fingerprints: np.ndarray, hexes: List[str]) -> np.ndarray:
+        """True where the fingerprint is already stored in transactions."""
+        known = np.zeros(len(hexes), dtype=bool)
+        candidates = np.flatnonzero(self.bloom.might_contain(fingerprints))
+        for start in range(0, len(candidates), LOOKUP_BATCH):
+            batch = candidates[start:start + LOOKUP_BATCH]
+            values = [hexes[i] for i in batch]
+            placeholders = ', '.join('?' for _ in values)
+            found = {r[0] for r in conn.execute(
+                f'SELECT fingerprint FROM transactions WHERE fingerprint IN ({placeholders})', values
+            )}
+            known[batch] = [hexes[i] in found for i in batch]
+        return known
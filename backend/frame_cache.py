@@ -0,0 +1,143 @@
+"""Byte-bounded LRU cache of dataset columns as typed pandas Series.
+
+The pandas paths of the reports, the AI query, the export fallbacks and the
+dataset analyses all start from a DataFrame of the stored data. Instead of
+every request reading the table again, each column is read once per data
+version (see registry.DatasetRegistry.version) and kept in a compact form:
+text with repeated values as a categorical, date columns parsed to
+datetime64. A request borrows a DataFrame assembled from the cached columns
+it names; only the missing ones are read.
+
+Borrowed frames share their arrays with the cache. Handlers may filter rows
+and add, replace or drop columns, which pandas' copy-on-write keeps away
+from the cached Series, but they must not hand the arrays to code that
+writes into them in place.
+
+``observers`` are called as ``fn(event, table)`` with event ``'hit'``,
+``'miss'`` or ``'eviction'``, once per column.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+import pandas as pd
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_RATIO = 0.5
+
+
+def _typed(values: pd.Series, date: bool) -> pd.Series:
+    if date:
+        # as read_sql_query's parse_dates
+        return pd.to_datetime(values, errors='coerce')
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        present = values.dropna()
+        if len(present) and pd.api.types.infer_dtype(present, skipna=True) == 'string' \
+                and present.nunique() <= len(values) * CATEGORY_RATIO:
+            return values.astype('category')
+    return values
+
+
+def typed_frame(raw: pd.DataFrame, dates: Sequence[str] = ()) -> pd.DataFrame:
+    """``raw`` in the form the cache serves its columns, for reads that bypass it."""
+    if not len(raw.columns):
+        return raw
+    return pd.concat([_typed(raw[c], c in dates) for c in raw.columns], axis=1)
+
+
+def _nbytes(values: pd.Series) -> int:
+    return int(values.memory_usage(index=False, deep=True))
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        # one column may take at most this share of the cache
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self.observers: List[Callable[[str, str], None]] = []
+        # (table, column, parsed as date) -> (Series, bytes)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _notify(self, event: str, table: str, times: int = 1):
+        for _ in range(times):
+            for observer in self.observers:
+                try:
+                    observer(event, table)
+                except Exception:
+                    pass
+
+    def _advance(self, version: int):
+        if version > self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _drop_table(self, table: str):
+        for key in [k for k in self._entries if k[0] == table]:
+            self._bytes -= self._entries.pop(key)[1]
+
+    def frame(self, table: str, version: int, columns: Sequence[str],
+              load: Callable[[List[str]], pd.DataFrame], dates: Sequence[str] = ()) -> pd.DataFrame:
+        """``columns`` of ``table`` at data ``version``, the ones in ``dates``
+        parsed as datetimes. ``load(names)`` reads the raw columns ``names``
+        from storage, rows in table order."""
+        keys = [(table, c, c in dates) for c in columns]
+        with self._lock:
+            self._advance(version)
+            current = version == self._version
+            found = {k: self._entries[k][0] for k in keys if current and k in self._entries}
+            for k in found:
+                self._entries.move_to_end(k)
+        missing = [k for k in keys if k not in found]
+        self._notify('hit', table, len(found))
+        self._notify('miss', table, len(missing))
+
+        if missing:
+            raw = load([c for _, c, _ in missing])
+            if found and len(raw) != len(next(iter(found.values()))):
+                # the cached columns came from another read of the table
+                with self._lock:
+                    self._drop_table(table)
+                missing, found = keys, {}
+                raw = load(list(columns))
+            loaded = {k: _typed(raw[k[1]], k[2]) for k in missing}
+            found.update(loaded)
+            self._store(version, loaded)
+        return pd.concat([found[k] for k in keys], axis=1) if keys else pd.DataFrame()
+
+    def _store(self, version: int, loaded: dict):
+        sized = [(key, values, _nbytes(values)) for key, values in loaded.items()]
+        evicted = []
+        with self._lock:
+            self._advance(version)
+            if version != self._version:
+                return
+            for key, values, size in sized:
+                if size > self.max_entry_bytes:
+                    continue
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous[1]
+                self._entries[key] = (values, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                key, (_, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+                evicted.append(key[0])
+        for table in evicted:
+            self._notify('eviction', table)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
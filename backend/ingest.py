@@ -0,0 +1,955 @@
+"""Streaming ingestion of uploaded files into per-upload ``data_<ts>`` tables.
+
+Delimited files are parsed in bounded chunks and every chunk is inserted into
+the target table inside a single transaction, so peak memory depends on
+UPLOAD_CHUNK_ROWS rather than on the size of the upload.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .columnar import SidecarWriter
+    from .db import connect
+    from .fingerprints import FINGERPRINT_COLUMNS, FingerprintIndex, row_fingerprints, to_hex
+    from .roles import (NUMERIC_TEXT_RATIO, count_iso_dates, count_numeric_values, detect_roles,
+                        is_text_dtype, roles_for)
+    from .rollup import build_rollup, update_rollup
+    from .search import TRANSACTION_SEARCH_COLUMNS, build_search_index, drop_search_index, index_rows, last_rowid
+    from .stats import (StatsAccumulator, clear_stats, ensure_stats_table, load_accumulator, load_stats,
+                        scan_table, store_stats)
+    from .storage import SHARED_STORAGE, insert_transactions, shared_engine
+except ImportError:  # support running as a module without package context
+    from columnar import SidecarWriter
+    from db import connect
+    from fingerprints import FINGERPRINT_COLUMNS, FingerprintIndex, row_fingerprints, to_hex
+    from roles import (NUMERIC_TEXT_RATIO, count_iso_dates, count_numeric_values, detect_roles,
+                       is_text_dtype, roles_for)
+    from rollup import build_rollup, update_rollup
+    from search import TRANSACTION_SEARCH_COLUMNS, build_search_index, drop_search_index, index_rows, last_rowid
+    from stats import (StatsAccumulator, clear_stats, ensure_stats_table, load_accumulator, load_stats,
+                       scan_table, store_stats)
+    from storage import SHARED_STORAGE, insert_transactions, shared_engine
+
+UPLOAD_CHUNK_ROWS = int(os.getenv('UPLOAD_CHUNK_ROWS', '50000'))
+SAMPLE_ROWS = 3
+MAX_ERROR_ROWS = 1000
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class UploadParseError(ValueError):
+    """The uploaded file could not be parsed."""
+
+
+class EmptyUploadError(ValueError):
+    """The uploaded file parsed fine but contained no rows."""
+
+
+class IngestCancelled(Exception):
+    """The ingest was cancelled through its upload job."""
+
+
+class DatasetNotFoundError(LookupError):
+    """An append targeted a dataset that has no file_metadata row."""
+
+
+class DatasetExistsError(ValueError):
+    """A new dataset was given the name of a table that already exists."""
+
+
+class SchemaMismatchError(ValueError):
+    """An appended file's columns differ from the dataset's."""
+
+
+def clean_column_names(columns) -> List[str]:
+    """Make column names database-friendly."""
+    return [str(col).strip().lower().replace(' ', '_').replace('-', '_').replace('.', '_')
+            for col in columns]
+
+
+def clean_nan_values(obj):
+    """Recursively clean NaN values and handle JSON serialization issues"""
+    if isinstance(obj, dict):
+        return {k: clean_nan_values(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [clean_nan_values(item) for item in obj]
+    elif isinstance(obj, pd.Timestamp):
+        return str(obj)
+    elif isinstance(obj, (pd.Series, pd.DataFrame)):
+        return obj.to_dict() if hasattr(obj, 'to_dict') else str(obj)
+    elif isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+        return 0.0
+    elif pd.isna(obj):
+        return None
+    else:
+        return obj
+
+
+def _as_text(chunk: pd.DataFrame, positions: List[int]) -> pd.DataFrame:
+    for i in positions:
+        col = chunk.iloc[:, i]
+        chunk.isetitem(i, col.astype(object).where(col.isna(), col.astype(str)))
+    return chunk
+
+
+def iter_upload_frames(fileobj, filename: str, chunk_rows: int = UPLOAD_CHUNK_ROWS,
+                       text_columns: Optional[List[int]] = None) -> Iterator[pd.DataFrame]:
+    """Yield the upload as DataFrames of at most ``chunk_rows`` rows.
+
+    CSV/TSV/TXT and Parquet are read incrementally; Excel and JSON have no
+    incremental reader in pandas, so they are loaded once and sliced. The
+    columns at the ``text_columns`` positions are read as text.
+    """
+    name = filename.lower()
+    text_columns = text_columns or []
+    fileobj.seek(0)
+    try:
+        if name.endswith(('.csv', '.tsv', '.txt')):
+            sep = '\t' if name.endswith('.tsv') else ','
+            reader = pd.read_csv(fileobj, sep=sep, chunksize=chunk_rows,
+                                 dtype={i: str for i in text_columns} or None)
+            with reader:
+                for chunk in reader:
+                    yield chunk
+            return
+        if name.endswith('.parquet'):
+            try:
+                import pyarrow.parquet as pq  # type: ignore
+            except ImportError:
+                pq = None
+            if pq is not None:
+                for batch in pq.ParquetFile(fileobj).iter_batches(batch_size=chunk_rows):
+                    yield _as_text(batch.to_pandas(), text_columns)
+                return
+            df = pd.read_parquet(fileobj)
+        elif name.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(fileobj)
+        elif name.endswith('.json'):
+            df = pd.read_json(fileobj)
+        else:
+            df = pd.read_csv(fileobj)
+    except UploadParseError:
+        raise
+    except Exception as e:
+        raise UploadParseError(str(e)) from e
+    df = _as_text(df, text_columns)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _merge_dtype(previous: Optional[str], current: str) -> str:
+    if previous is None or previous == current:
+        return current
+    # Text mixed with anything else stays text; only numeric types promote
+    if is_text_dtype(previous) or is_text_dtype(current):
+        return 'object'
+    try:
+        return str(np.promote_types(np.dtype(previous), np.dtype(current)))
+    except TypeError:
+        return 'object'
+
+
+class MetadataAccumulator:
+    """Builds ``file_metadata`` (row count, column types, sample rows) chunk by chunk."""
+
+    def __init__(self):
+        self.columns: List[str] = []
+        self.row_count = 0
+        self.column_types: Dict[str, str] = {}
+        self.sample_data: List[dict] = []
+        self._non_null: Dict[str, bool] = {}
+        self._numeric_values: Dict[str, int] = {}
+        self._value_counts: Dict[str, int] = {}
+        self._iso_dates: Dict[str, int] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        if not self.columns:
+            self.columns = list(chunk.columns)
+            self._non_null = {col: False for col in self.columns}
+        self.row_count += len(chunk)
+        for col in chunk.columns:
+            has_values = bool(chunk[col].notna().any())
+            # An all-null slice says nothing about the column's real type
+            if has_values or col not in self.column_types:
+                prev = self.column_types.get(col) if self._non_null.get(col) else None
+                self.column_types[col] = _merge_dtype(prev, str(chunk[col].dtype))
+            self._non_null[col] = self._non_null[col] or has_values
+        for col, count in count_numeric_values(chunk).items():
+            self._numeric_values[col] = self._numeric_values.get(col, 0) + count
+        for col, count in chunk.notna().sum().items():
+            self._value_counts[col] = self._value_counts.get(col, 0) + int(count)
+        for col, count in count_iso_dates(chunk).items():
+            self._iso_dates[col] = self._iso_dates.get(col, 0) + count
+        if len(self.sample_data) < SAMPLE_ROWS:
+            need = SAMPLE_ROWS - len(self.sample_data)
+            self.sample_data.extend(chunk.head(need).to_dict('records'))
+
+    def has_values(self, col: str) -> bool:
+        return bool(self._non_null.get(col))
+
+    def empty_columns(self) -> List[str]:
+        return [col for col in self.columns if not self._non_null.get(col)]
+
+    def numeric_text(self) -> List[str]:
+        """Text columns where most values parse as numbers."""
+        return [col for col in self.columns
+                if is_text_dtype(self.column_types.get(col))
+                and self._numeric_values.get(col, 0) > self.row_count * NUMERIC_TEXT_RATIO]
+
+    def iso_date_columns(self) -> List[str]:
+        """Columns where every value seen is an ISO-8601 date."""
+        return [col for col, count in self._iso_dates.items()
+                if count and count == self._value_counts.get(col)]
+
+    def finalize(self, filename: str, table_name: str) -> dict:
+        dropped = set(self.empty_columns())
+        columns = [col for col in self.columns if col not in dropped]
+        return {
+            'original_filename': filename,
+            'table_name': table_name,
+            'columns': columns,
+            'row_count': self.row_count,
+            'column_types': {col: self.column_types[col] for col in columns},
+            'roles': detect_roles(columns, self.column_types, self.numeric_text(), self.iso_date_columns()),
+            'upload_timestamp': datetime.now().isoformat(),
+            'sample_data': clean_nan_values([
+                {k: v for k, v in row.items() if k not in dropped} for row in self.sample_data
+            ]),
+        }
+
+
+def _frame_rows(df: pd.DataFrame):
+    """Rows of ``df`` as plain Python tuples that sqlite3 can bind."""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df = df.astype(object).where(df.notna(), None)
+    return df.itertuples(index=False, name=None)
+
+
+def insert_frame(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame):
+    placeholders = ', '.join('?' for _ in df.columns)
+    columns = ', '.join(f'"{col}"' for col in df.columns)
+    conn.executemany(f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})', _frame_rows(df))
+
+
+def hash_fileobj(fileobj) -> str:
+    """SHA-256 of a file object's contents, leaving it rewound."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(HASH_BLOCK_BYTES), b''):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def ensure_metadata_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS file_metadata (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT UNIQUE,
+        original_filename TEXT,
+        columns TEXT,
+        row_count INTEGER,
+        column_types TEXT,
+        upload_timestamp TEXT,
+        sample_data TEXT,
+        content_hash TEXT,
+        version INTEGER DEFAULT 1,
+        roles TEXT
+    )
+    ''')
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(file_metadata)").fetchall()]
+    for col, decl in (('content_hash', 'TEXT'), ('version', 'INTEGER DEFAULT 1'), ('roles', 'TEXT')):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE file_metadata ADD COLUMN {col} {decl}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_metadata_content_hash ON file_metadata(content_hash)")
+    # One row per upload that created or appended to a dataset. Named so that
+    # scans for uploaded tables (name LIKE 'data_%') don't take it for one
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='dataset_versions'").fetchone():
+        conn.execute('ALTER TABLE dataset_versions RENAME TO file_metadata_versions')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS file_metadata_versions (
+        table_name TEXT,
+        version INTEGER,
+        original_filename TEXT,
+        row_count INTEGER,
+        content_hash TEXT,
+        created_at TEXT,
+        PRIMARY KEY (table_name, version)
+    )
+    ''')
+    ensure_store_version_table(conn)
+    ensure_stats_table(conn)
+
+
+def ensure_store_version_table(conn: sqlite3.Connection):
+    # Counts the changes to the stored data, so every process can tell when
+    # its cached catalog and results are stale (see registry.py); the epoch
+    # tells a recreated database from an earlier one at the same count. Not
+    # named data_*, which is taken for uploaded datasets
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS store_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        epoch TEXT NOT NULL
+    )
+    ''')
+
+
+def advance_store_version(conn: sqlite3.Connection):
+    """Count a change to the stored data, in the caller's transaction."""
+    ensure_store_version_table(conn)
+    conn.execute(
+        'INSERT INTO store_version (id, version, epoch) VALUES (1, 1, lower(hex(randomblob(8)))) '
+        'ON CONFLICT (id) DO UPDATE SET version = version + 1'
+    )
+
+
+def read_store_version(conn: sqlite3.Connection) -> Tuple[str, int]:
+    """(epoch, version) of the stored data; ('', 0) before the first change."""
+    try:
+        row = conn.execute('SELECT epoch, version FROM store_version WHERE id = 1').fetchone()
+    except sqlite3.OperationalError as e:
+        if 'no such table' not in str(e):
+            raise
+        row = None
+    return (row[0], row[1]) if row else ('', 0)
+
+
+METADATA_FIELDS = ('table_name', 'original_filename', 'columns', 'row_count', 'column_types',
+                   'upload_timestamp', 'sample_data', 'content_hash', 'version', 'roles')
+_JSON_METADATA_FIELDS = ('columns', 'column_types', 'sample_data', 'roles')
+
+
+def store_file_metadata(conn: sqlite3.Connection, file_metadata: dict):
+    ensure_metadata_table(conn)
+    values = [file_metadata.get(field) for field in METADATA_FIELDS]
+    for i, field in enumerate(METADATA_FIELDS):
+        if field in _JSON_METADATA_FIELDS:
+            values[i] = json.dumps(values[i])
+    conn.execute(
+        f'INSERT OR REPLACE INTO file_metadata ({", ".join(METADATA_FIELDS)}) '
+        f'VALUES ({", ".join("?" for _ in METADATA_FIELDS)})',
+        values
+    )
+
+
+def _metadata_from_row(row) -> dict:
+    file_metadata = dict(zip(METADATA_FIELDS, row))
+    for field in _JSON_METADATA_FIELDS:
+        file_metadata[field] = json.loads(file_metadata[field]) if file_metadata[field] else None
+    return file_metadata
+
+
+def load_file_metadata(conn: sqlite3.Connection, table_name: str) -> Optional[dict]:
+    ensure_metadata_table(conn)
+    row = conn.execute(
+        f'SELECT {", ".join(METADATA_FIELDS)} FROM file_metadata WHERE table_name = ?', (table_name,)
+    ).fetchone()
+    return _metadata_from_row(row) if row else None
+
+
+def record_version(conn: sqlite3.Connection, table_name: str, version: int, filename: str,
+                   row_count: int, content_hash: Optional[str]):
+    conn.execute(
+        'INSERT OR REPLACE INTO file_metadata_versions '
+        '(table_name, version, original_filename, row_count, content_hash, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (table_name, version, filename, row_count, content_hash, datetime.now().isoformat())
+    )
+
+
+def find_version_by_hash(conn: sqlite3.Connection, table_name: str, content_hash: str) -> Optional[dict]:
+    """An earlier create/append of ``table_name`` with identical bytes."""
+    ensure_metadata_table(conn)
+    row = conn.execute(
+        'SELECT version, original_filename, row_count, created_at FROM file_metadata_versions '
+        'WHERE table_name = ? AND content_hash = ?',
+        (table_name, content_hash)
+    ).fetchone()
+    if not row:
+        return None
+    return {'version': row[0], 'original_filename': row[1], 'row_count': row[2], 'created_at': row[3]}
+
+
+def dataset_stats(conn: sqlite3.Connection, table_name: str, persist: Optional[Callable] = None) -> dict:
+    """Row count, columns and per-column statistics of a table.
+
+    Datasets are served from the column_stats catalog of their current
+    version. A dataset ingested before the catalog existed is scanned, and
+    the statistics are handed to ``persist(table_name, version, acc,
+    columns)`` to catalog them through the caller's writer; nothing is
+    written through ``conn``. Tables without file_metadata are scanned
+    every time.
+    """
+    conn.execute('BEGIN')
+    try:
+        file_metadata = load_file_metadata(conn, table_name)
+        if file_metadata is not None:
+            version = file_metadata.get('version') or 1
+            column_stats = load_stats(conn, table_name, version)
+            if column_stats is None:
+                acc = scan_table(conn, table_name, UPLOAD_CHUNK_ROWS)
+                # as load_stats would return them from the catalog
+                column_stats = {col: json.loads(json.dumps(acc.columns[col].summary()))
+                                for col in file_metadata['columns'] if col in acc.columns}
+                if persist is not None:
+                    persist(table_name, version, acc, file_metadata['columns'])
+            conn.rollback()
+            return {
+                'table_name': table_name,
+                'version': version,
+                'row_count': file_metadata['row_count'],
+                'columns': file_metadata['columns'],
+                'column_stats': column_stats or {},
+            }
+        conn.rollback()
+    except BaseException:
+        conn.rollback()
+        raise
+    columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+    acc = scan_table(conn, table_name, UPLOAD_CHUNK_ROWS)
+    column_stats = {col: acc.columns[col].summary() for col in columns if col in acc.columns}
+    row_count = next(iter(acc.columns.values())).rows if acc.columns else 0
+    return {
+        'table_name': table_name,
+        'version': None,
+        'row_count': row_count,
+        'columns': columns,
+        'column_stats': column_stats,
+    }
+
+
+def catalog_stats(conn: sqlite3.Connection, table_name: str, version: int, acc: StatsAccumulator,
+                  columns: List[str]):
+    """Catalog statistics scanned by ``dataset_stats``, unless the dataset
+    has moved past ``version`` or was cataloged meanwhile."""
+    file_metadata = load_file_metadata(conn, table_name)
+    if file_metadata is None or (file_metadata.get('version') or 1) != version:
+        return
+    if load_stats(conn, table_name, version) is None:
+        store_stats(conn, table_name, version, acc, columns)
+
+
+def find_by_content_hash(conn: sqlite3.Connection, content_hash: str) -> Optional[dict]:
+    """file_metadata of an earlier upload with identical bytes whose table still exists."""
+    ensure_metadata_table(conn)
+    rows = conn.execute(
+        f'SELECT {", ".join(METADATA_FIELDS)} FROM file_metadata WHERE content_hash = ? '
+        'ORDER BY upload_timestamp DESC',
+        (content_hash,)
+    ).fetchall()
+    for row in rows:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (row[0],)).fetchone()
+        if exists:
+            return _metadata_from_row(row)
+    return None
+
+
+def ensure_jobs_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS upload_jobs (
+        id TEXT PRIMARY KEY,
+        table_name TEXT,
+        original_filename TEXT,
+        status TEXT,
+        phase TEXT,
+        rows_parsed INTEGER DEFAULT 0,
+        rows_inserted INTEGER DEFAULT 0,
+        rows_per_second REAL,
+        error TEXT,
+        result TEXT,
+        owner_pid INTEGER,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+
+
+JOB_FIELDS = ('table_name', 'original_filename', 'status', 'phase', 'rows_parsed', 'rows_inserted',
+              'rows_per_second', 'error', 'result', 'owner_pid', 'created_at', 'updated_at')
+
+
+def create_job(conn: sqlite3.Connection, job: dict):
+    ensure_jobs_table(conn)
+    now = datetime.now().isoformat()
+    row = {field: job.get(field) for field in JOB_FIELDS}
+    row.update(created_at=now, updated_at=now)
+    conn.execute(
+        f'INSERT INTO upload_jobs (id, {", ".join(JOB_FIELDS)}) VALUES (?{", ?" * len(JOB_FIELDS)})',
+        (job['id'], *row.values())
+    )
+
+
+def update_job(conn: sqlite3.Connection, job_id: str, **fields):
+    fields = {k: v for k, v in fields.items() if k in JOB_FIELDS}
+    if isinstance(fields.get('result'), dict):
+        fields['result'] = json.dumps(fields['result'])
+    fields['updated_at'] = datetime.now().isoformat()
+    assignments = ', '.join(f'{k} = ?' for k in fields)
+    conn.execute(f'UPDATE upload_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+
+def load_job(conn: sqlite3.Connection, job_id: str) -> Optional[dict]:
+    ensure_jobs_table(conn)
+    cur = conn.execute(f'SELECT id, {", ".join(JOB_FIELDS)} FROM upload_jobs WHERE id = ?', (job_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    job = dict(zip(('id',) + JOB_FIELDS, row))
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def _report(progress, **fields):
+    if progress is not None:
+        progress.update(fields)
+
+
+def _clean_chunks(frames: Iterator[pd.DataFrame], filename: str, progress) -> Iterator[pd.DataFrame]:
+    """Chunks with cleaned column names; honours cancellation between chunks."""
+    while True:
+        if progress is not None and progress.get('cancel'):
+            raise IngestCancelled(f'Upload of {filename} was cancelled')
+        try:
+            chunk = next(frames)
+        except StopIteration:
+            return
+        except UploadParseError:
+            raise
+        except Exception as e:
+            raise UploadParseError(str(e)) from e
+        chunk.columns = clean_column_names(chunk.columns)
+        yield chunk
+
+
+def ingest_upload(conn: sqlite3.Connection, fileobj, filename: str, table_name: str,
+                  chunk_rows: int = UPLOAD_CHUNK_ROWS, progress=None, job_id: Optional[str] = None,
+                  content_hash: Optional[str] = None) -> dict:
+    """Stream ``fileobj`` into ``table_name`` and record its file_metadata.
+
+    Everything happens in one transaction: on any error the table and its
+    metadata row are rolled back together. Returns the file_metadata dict
+    plus ``elapsed_seconds`` and ``rows_per_second``.
+
+    ``progress`` is an optional mapping (a plain dict, or a Manager dict when
+    running in a worker process) that receives phase and row counters after
+    every chunk; setting its ``cancel`` key aborts the ingest. When ``job_id``
+    is given the upload_jobs row is marked succeeded in the same transaction.
+    ``content_hash`` is stored with the metadata for duplicate detection.
+    """
+    started = time.perf_counter()
+    sidecar = None
+    text_columns: List[int] = []
+    _report(progress, phase='ingesting', started_at=time.time())
+    conn.execute('BEGIN')
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone():
+            raise DatasetExistsError(f'Table {table_name} already exists')
+        while True:
+            acc = MetadataAccumulator()
+            stats = StatsAccumulator()
+            created: Optional[Dict[str, str]] = None
+            mixed: List[int] = []
+            frames = iter_upload_frames(fileobj, filename, chunk_rows, text_columns)
+            try:
+                for chunk in _clean_chunks(frames, filename, progress):
+                    if created is None:
+                        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                        drop_search_index(conn, table_name)
+                        clear_stats(conn, table_name)
+                        conn.execute(pd.io.sql.get_schema(chunk, table_name, con=conn))
+                        if sidecar:
+                            sidecar.discard()
+                        sidecar = SidecarWriter.open(conn, table_name, 1)
+                        created = {col: str(chunk[col].dtype) for col in chunk.columns}
+                    if chunk.empty:
+                        continue
+                    acc.update(chunk)
+                    # The table took its column types from the first chunk
+                    mixed = [i for i, col in enumerate(chunk.columns)
+                             if is_text_dtype(acc.column_types[col]) and not is_text_dtype(created[col])]
+                    if mixed:
+                        break
+                    stats.update(chunk)
+                    _report(progress, rows_parsed=acc.row_count)
+                    insert_frame(conn, table_name, chunk)
+                    if sidecar:
+                        sidecar.write(chunk)
+                    _report(progress, rows_inserted=acc.row_count)
+            finally:
+                frames.close()
+            if not mixed:
+                break
+            # Text turned up in a column created as numeric: load the file
+            # again with it read as text, so the table gets TEXT affinity and
+            # the earlier values keep their text form
+            text_columns.extend(mixed)
+
+        if acc.row_count == 0:
+            raise EmptyUploadError('File contains no data')
+
+        _report(progress, phase='finalizing')
+        # Columns that were empty in every chunk are dropped, as a whole-file dropna would
+        for col in acc.empty_columns():
+            conn.execute(f'ALTER TABLE "{table_name}" DROP COLUMN "{col}"')
+
+        file_metadata = acc.finalize(filename, table_name)
+        build_search_index(conn, table_name, file_metadata['roles']['categorical'])
+        file_metadata['content_hash'] = content_hash
+        file_metadata['version'] = 1
+        store_file_metadata(conn, file_metadata)
+        record_version(conn, table_name, 1, filename, acc.row_count, content_hash)
+        store_stats(conn, table_name, 1, stats, file_metadata['columns'])
+        elapsed = time.perf_counter() - started
+        rows_per_second = round(acc.row_count / elapsed, 1) if elapsed > 0 else None
+        advance_store_version(conn)
+        if job_id:
+            update_job(conn, job_id, status='succeeded', phase='done', rows_parsed=acc.row_count,
+                       rows_inserted=acc.row_count, rows_per_second=rows_per_second,
+                       result=file_metadata)
+        if sidecar:
+            sidecar.close()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if sidecar:
+            sidecar.discard()
+        raise
+    if sidecar:
+        sidecar.publish()
+
+    _report(progress, phase='done')
+    result = dict(file_metadata)
+    result['elapsed_seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = rows_per_second
+    return result
+
+
+def append_upload(conn: sqlite3.Connection, fileobj, filename: str, table_name: str,
+                  chunk_rows: int = UPLOAD_CHUNK_ROWS, progress=None, job_id: Optional[str] = None,
+                  content_hash: Optional[str] = None) -> dict:
+    """Append an upload to an existing dataset table and bump its version.
+
+    The incoming columns must match the dataset's file_metadata.columns (in
+    any order). Only the new rows are read and written; row_count and
+    column_types are updated from this upload's accumulator, so the cost is
+    proportional to the appended file rather than to the dataset.
+    """
+    started = time.perf_counter()
+    acc = MetadataAccumulator()
+    stats = StatsAccumulator()
+    sidecar = None
+    frames = iter_upload_frames(fileobj, filename, chunk_rows)
+    _report(progress, phase='ingesting', started_at=time.time())
+    # Take the write lock before reading the current version so concurrent
+    # appends to the same dataset serialize instead of reusing a version
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existing = load_file_metadata(conn, table_name)
+        if existing is None:
+            raise DatasetNotFoundError(f'Dataset {table_name} not found')
+        expected = existing['columns']
+        version = (existing.get('version') or 1) + 1
+        sidecar = SidecarWriter.open(conn, table_name, version, expected)
+        indexed_up_to = last_rowid(conn, table_name)
+        extra = None
+        for chunk in _clean_chunks(frames, filename, progress):
+            if extra is None:
+                missing = [c for c in expected if c not in chunk.columns]
+                extra = [c for c in chunk.columns if c not in expected]
+                if missing:
+                    raise SchemaMismatchError(
+                        f'Columns do not match {table_name}: missing {missing}, unexpected {extra}'
+                    )
+            # Columns that were dropped as all-empty when the dataset was
+            # created may come back; accept them as long as they stay empty
+            if extra:
+                filled = [c for c in extra if chunk[c].notna().any()]
+                if filled:
+                    raise SchemaMismatchError(f'Columns do not match {table_name}: unexpected {filled}')
+                chunk = chunk.drop(columns=extra)
+            if chunk.empty:
+                continue
+            acc.update(chunk)
+            stats.update(chunk)
+            _report(progress, rows_parsed=acc.row_count)
+            insert_frame(conn, table_name, chunk)
+            if sidecar:
+                sidecar.write(chunk)
+            _report(progress, rows_inserted=acc.row_count)
+
+        if acc.row_count == 0:
+            raise EmptyUploadError('File contains no data')
+
+        _report(progress, phase='finalizing')
+        column_types = dict(existing['column_types'] or {})
+        for col in expected:
+            if acc.has_values(col):
+                column_types[col] = _merge_dtype(column_types.get(col), acc.column_types[col])
+        previous_roles = roles_for(expected, existing['column_types'], existing.get('roles'))
+        date_col = previous_roles['date']
+        iso_dates = [date_col] if previous_roles.get('date_iso') and (
+            not acc.has_values(date_col) or date_col in acc.iso_date_columns()) else []
+        roles = detect_roles(expected, column_types,
+                             sorted(set(previous_roles['numeric_text']) | set(acc.numeric_text())), iso_dates)
+        # Datasets created before search indexes existed get theirs built now
+        if not index_rows(conn, table_name, indexed_up_to):
+            build_search_index(conn, table_name, roles['categorical'])
+        conn.execute(
+            'UPDATE file_metadata SET row_count = row_count + ?, column_types = ?, version = ?, roles = ? '
+            'WHERE table_name = ?',
+            (acc.row_count, json.dumps(column_types), version, json.dumps(roles), table_name)
+        )
+        record_version(conn, table_name, version, filename, acc.row_count, content_hash)
+        # Fold the new rows into the previous version's statistics; datasets
+        # without a catalog yet get one built on their next summary request
+        previous_stats = load_accumulator(conn, table_name, version - 1)
+        if previous_stats is not None:
+            previous_stats.merge(stats)
+            store_stats(conn, table_name, version, previous_stats, expected)
+        elapsed = time.perf_counter() - started
+        rows_per_second = round(acc.row_count / elapsed, 1) if elapsed > 0 else None
+        summary = {
+            'original_filename': filename,
+            'table_name': table_name,
+            'columns': expected,
+            'column_types': column_types,
+            'roles': roles,
+            'rows_inserted': acc.row_count,
+            'row_count': existing['row_count'] + acc.row_count,
+            'version': version,
+        }
+        advance_store_version(conn)
+        if job_id:
+            update_job(conn, job_id, status='succeeded', phase='done', rows_parsed=acc.row_count,
+                       rows_inserted=acc.row_count, rows_per_second=rows_per_second, result=summary)
+        if sidecar:
+            sidecar.close()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if sidecar:
+            sidecar.discard()
+        raise
+    finally:
+        frames.close()
+    if sidecar:
+        sidecar.publish()
+
+    _report(progress, phase='done')
+    result = dict(summary)
+    result['elapsed_seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = rows_per_second
+    return result
+
+
+# Per-process: each upload worker keeps its own filter warm across uploads
+_fingerprint_index = FingerprintIndex()
+
+
+def normalize_transactions(chunk: pd.DataFrame):
+    """Split a cleaned chunk into (valid rows in transactions shape, invalid rows).
+
+    Valid rows have a parseable date (stored as YYYY-MM-DD) and numeric
+    quantity and price; missing text columns become NULL.
+    """
+    out = pd.DataFrame(index=chunk.index)
+    for col in FINGERPRINT_COLUMNS:
+        out[col] = chunk[col] if col in chunk.columns else None
+    dates = pd.to_datetime(out['date'], errors='coerce')
+    quantity = pd.to_numeric(out['quantity'], errors='coerce')
+    price = pd.to_numeric(out['price'], errors='coerce')
+    valid = dates.notna() & quantity.notna() & price.notna()
+    invalid = chunk[~valid]
+    out = out[valid]
+    out['date'] = dates[valid].dt.strftime('%Y-%m-%d')
+    out['quantity'] = quantity[valid].astype('float64')
+    out['price'] = price[valid].astype('float64')
+    for col in ('type', 'product', 'customer', 'region'):
+        values = out[col].astype(object)
+        out[col] = values.astype(str).str.strip().astype(object).where(values.notna(), None)
+    return out, invalid
+
+
+def ingest_transactions(conn: sqlite3.Connection, fileobj, filename: str,
+                        chunk_rows: int = UPLOAD_CHUNK_ROWS, progress=None, job_id: Optional[str] = None) -> dict:
+    """Append an upload to ``transactions``, skipping rows already stored.
+
+    Per-row fingerprints are hashed for each chunk at once; the Bloom filter
+    separates definitely-new rows from maybe-known ones, which are checked
+    against the unique fingerprint index. INSERT OR IGNORE stays as the final
+    guard, so the reported counts come from what SQLite actually inserted.
+    """
+    started = time.perf_counter()
+    frames = iter_upload_frames(fileobj, filename, chunk_rows)
+    parsed = inserted = duplicates = 0
+    invalid_frames: List[pd.DataFrame] = []
+    invalid_count = 0
+    columns = ', '.join(FINGERPRINT_COLUMNS + ['fingerprint'])
+    placeholders = ', '.join('?' for _ in range(len(FINGERPRINT_COLUMNS) + 1))
+    _report(progress, phase='ingesting', started_at=time.time())
+    conn.execute('BEGIN')
+    try:
+        last_id = last_rowid(conn, 'transactions')
+        for chunk in _clean_chunks(frames, filename, progress):
+            parsed += len(chunk)
+            rows, invalid = normalize_transactions(chunk)
+            if len(invalid):
+                invalid_count += len(invalid)
+                if sum(len(f) for f in invalid_frames) < MAX_ERROR_ROWS:
+                    invalid_frames.append(invalid)
+            _report(progress, rows_parsed=parsed)
+            if rows.empty:
+                continue
+
+            fingerprints = row_fingerprints(rows)
+            hexes = to_hex(fingerprints)
+            _fingerprint_index.sync(conn)
+            fresh = ~_fingerprint_index.known_mask(conn, fingerprints, hexes)
+            fresh &= ~pd.Series(hexes).duplicated().to_numpy()
+            rows = rows[fresh].assign(fingerprint=[h for h, keep in zip(hexes, fresh) if keep])
+
+            before = conn.total_changes
+            conn.executemany(
+                f'INSERT OR IGNORE INTO transactions ({columns}) VALUES ({placeholders})',
+                _frame_rows(rows)
+            )
+            added = conn.total_changes - before
+            inserted += added
+            duplicates += int(len(fresh)) - added
+            _report(progress, rows_inserted=inserted)
+
+        if parsed == 0:
+            raise EmptyUploadError('File contains no data')
+        # Search index and daily rollup pick up the rows inserted past last_id
+        if not index_rows(conn, 'transactions', last_id):
+            build_search_index(conn, 'transactions', TRANSACTION_SEARCH_COLUMNS)
+        if not update_rollup(conn, last_id):
+            build_rollup(conn)
+
+        elapsed = time.perf_counter() - started
+        rows_per_second = round(parsed / elapsed, 1) if elapsed > 0 else None
+        summary = {
+            'original_filename': filename,
+            'table_name': 'transactions',
+            'rows_parsed': parsed,
+            'rows_inserted': inserted,
+            'rows_duplicate': duplicates,
+            'rows_invalid': invalid_count,
+        }
+        advance_store_version(conn)
+        if job_id:
+            update_job(conn, job_id, status='succeeded', phase='done', rows_parsed=parsed,
+                       rows_inserted=inserted, rows_per_second=rows_per_second, result=summary)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        _fingerprint_index.invalidate()
+        raise
+    finally:
+        frames.close()
+
+    _report(progress, phase='done')
+    result = dict(summary)
+    result['invalid_csv'] = (pd.concat(invalid_frames).head(MAX_ERROR_ROWS).to_csv(index=False)
+                             if invalid_frames else None)
+    result['elapsed_seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = rows_per_second
+    return result
+
+
+def ingest_shared_transactions(conn: sqlite3.Connection, fileobj, filename: str,
+                               chunk_rows: int = UPLOAD_CHUNK_ROWS, progress=None,
+                               job_id: Optional[str] = None) -> dict:
+    """``ingest_transactions`` into the shared database of storage.py.
+
+    Other replicas insert into the same table, so there is no local Bloom
+    filter: INSERT ... ON CONFLICT DO NOTHING on the fingerprint index skips
+    the stored rows and RETURNING counts the new ones. The whole upload is one
+    server transaction; ``conn`` only records the job.
+    """
+    started = time.perf_counter()
+    frames = iter_upload_frames(fileobj, filename, chunk_rows)
+    parsed = inserted = duplicates = 0
+    invalid_frames: List[pd.DataFrame] = []
+    invalid_count = 0
+    _report(progress, phase='ingesting', started_at=time.time())
+    try:
+        with shared_engine().begin() as db:
+            for chunk in _clean_chunks(frames, filename, progress):
+                parsed += len(chunk)
+                rows, invalid = normalize_transactions(chunk)
+                if len(invalid):
+                    invalid_count += len(invalid)
+                    if sum(len(f) for f in invalid_frames) < MAX_ERROR_ROWS:
+                        invalid_frames.append(invalid)
+                _report(progress, rows_parsed=parsed)
+                if rows.empty:
+                    continue
+                hexes = pd.Series(to_hex(row_fingerprints(rows)), index=rows.index)
+                fresh = ~hexes.duplicated()
+                added = insert_transactions(db, rows[fresh].assign(fingerprint=hexes[fresh]))
+                inserted += added
+                duplicates += len(rows) - added
+                _report(progress, rows_inserted=inserted)
+            if parsed == 0:
+                raise EmptyUploadError('File contains no data')
+    finally:
+        frames.close()
+
+    elapsed = time.perf_counter() - started
+    rows_per_second = round(parsed / elapsed, 1) if elapsed > 0 else None
+    summary = {
+        'original_filename': filename,
+        'table_name': 'transactions',
+        'rows_parsed': parsed,
+        'rows_inserted': inserted,
+        'rows_duplicate': duplicates,
+        'rows_invalid': invalid_count,
+    }
+    if job_id:
+        update_job(conn, job_id, status='succeeded', phase='done', rows_parsed=parsed,
+                   rows_inserted=inserted, rows_per_second=rows_per_second, result=summary)
+        conn.commit()
+    _report(progress, phase='done')
+    result = dict(summary)
+    result['invalid_csv'] = (pd.concat(invalid_frames).head(MAX_ERROR_ROWS).to_csv(index=False)
+                             if invalid_frames else None)
+    result['elapsed_seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = rows_per_second
+    return result
+
+
+def ingest_into(conn: sqlite3.Connection, fileobj, filename: str, table_name: str,
+                chunk_rows: int = UPLOAD_CHUNK_ROWS, progress=None, job_id: Optional[str] = None,
+                content_hash: Optional[str] = None, append: bool = False) -> dict:
+    """Dispatch to the transactions append, a dataset append or a new dataset."""
+    if table_name == 'transactions':
+        ingest = ingest_shared_transactions if SHARED_STORAGE else ingest_transactions
+        return ingest(conn, fileobj, filename, chunk_rows, progress, job_id)
+    ingest = append_upload if append else ingest_upload
+    return ingest(conn, fileobj, filename, table_name, chunk_rows, progress, job_id, content_hash)
+
+
+def ingest_file(database: str, path: str, filename: str, table_name: str,
+                progress=None, job_id: Optional[str] = None, content_hash: Optional[str] = None,
+                append: bool = False, chunk_rows: int = UPLOAD_CHUNK_ROWS) -> dict:
+    """Process-pool entry point: ingest the upload spooled at ``path``."""
+    conn = connect(database)
+    try:
+        with open(path, 'rb') as fileobj:
+            return ingest_into(conn, fileobj, filename, table_name, chunk_rows, progress, job_id,
+                               content_hash, append)
+    finally:
+        conn.close()
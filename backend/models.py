@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Computed, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -74,4 +74,5 @@ class Transaction(Base):
     price = Column(Float)
     customer = Column(String)
     region = Column(String)
-    fingerprint = Column(String, unique=True)
\ No newline at end of file
+    fingerprint = Column(String, unique=True)
+    amount = Column(Float, Computed('quantity * price', persisted=True))
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""In-memory registry of the uploaded datasets.
+
+The active dataset (the most recent upload, or the legacy transactions table
+when nothing was uploaded yet), its columns and roles, and the file_metadata
+of each dataset are read from SQLite once and then served from memory.
+
+Every change to the stored data — an upload, an append, a transactions
+import or a reset — advances the store_version row in its own transaction
+(see ingest.advance_store_version). Each lookup and each read of ``version``
+checks that row first, so a change committed by another worker process is
+noticed on the next request: it advances ``version`` and drops the cached
+entries, as a ``bump()`` in this process does. ``version`` therefore also
+identifies the state of the data for anything caching results derived from
+it in this process, and ``tag`` identifies it across processes.
+"""
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+try:
+    from .ingest import ensure_metadata_table, load_file_metadata, read_store_version
+    from .roles import TRANSACTION_COLUMN_TYPES, detect_roles, roles_for
+except ImportError:  # support running as a module without package context
+    from ingest import ensure_metadata_table, load_file_metadata, read_store_version
+    from roles import TRANSACTION_COLUMN_TYPES, detect_roles, roles_for
+
+
+class ActiveDataset(NamedTuple):
+    table_name: str
+    columns: List[str]
+    roles: dict
+    # file_metadata of the upload; None for the legacy transactions table
+    metadata: Optional[dict]
+    exists: bool
+
+
+def load_active(conn) -> ActiveDataset:
+    """The active dataset as ``conn`` sees it, bypassing the registry. Only
+    reads, so it can run in a read transaction once ensure_metadata_table
+    has created the catalog."""
+    row = conn.execute("""
+    SELECT m.table_name FROM file_metadata m
+    JOIN sqlite_master s ON s.type = 'table' AND s.name = m.table_name
+    ORDER BY m.upload_timestamp DESC LIMIT 1
+    """).fetchone()
+    if row:
+        metadata = load_file_metadata(conn, row[0])
+        columns = metadata['columns']
+        roles = roles_for(columns, metadata['column_types'] or {}, metadata.get('roles'))
+        return ActiveDataset(row[0], columns, roles, metadata, True)
+    columns = list(TRANSACTION_COLUMN_TYPES)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'").fetchone()
+    return ActiveDataset('transactions', columns, detect_roles(columns, TRANSACTION_COLUMN_TYPES), None,
+                         exists is not None)
+
+
+class DatasetRegistry:
+    """Catalog lookups cached until the stored data changes or ``bump()``.
+
+    ``connect`` returns a connection to read the catalog through; its
+    ``close()`` is called afterwards.
+    """
+
+    def __init__(self, connect: Callable):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._version = 0
+        # (epoch, version) of the store_version row as last read
+        self._stored = ('', 0)
+        self._active: Optional[ActiveDataset] = None
+        self._metadata: Dict[str, Optional[dict]] = {}
+
+    @property
+    def version(self) -> int:
+        """Advances with every change to the stored data, by any process."""
+        self._check()
+        return self._version
+
+    @property
+    def tag(self) -> str:
+        """The stored data version, the same in every process."""
+        self._check()
+        epoch, version = self._stored
+        return f'{epoch}:{version}'
+
+    def _check(self):
+        """Read the store_version row; a change since the last read counts as a bump."""
+        conn = self._connect()
+        try:
+            stored = read_store_version(conn)
+        finally:
+            conn.close()
+        with self._lock:
+            if stored != self._stored:
+                self._stored = stored
+                self._advance()
+
+    def _advance(self):
+        self._version += 1
+        self._active = None
+        self._metadata.clear()
+
+    def bump(self) -> int:
+        """Record a change to data the store_version row doesn't count (the
+        shared transactions table) and drop the cached entries."""
+        with self._lock:
+            self._advance()
+            return self._version
+
+    def _read(self, load):
+        # A change while the catalog is read leaves the result uncached, so
+        # it never outlives the change it may have missed
+        version = self._version
+        conn = self._connect()
+        try:
+            value = load(conn)
+        finally:
+            conn.close()
+        return version, value
+
+    def active(self) -> ActiveDataset:
+        self._check()
+        active = self._active
+        if active is not None:
+            return active
+        def load(conn):
+            ensure_metadata_table(conn)
+            return load_active(conn)
+        version, active = self._read(load)
+        with self._lock:
+            if version == self._version:
+                self._active = active
+        return active
+
+    def metadata(self, table_name: str) -> Optional[dict]:
+        """file_metadata of ``table_name``; None when it isn't an uploaded dataset."""
+        self._check()
+        with self._lock:
+            if table_name in self._metadata:
+                return self._metadata[table_name]
+
+        def load(conn):
+            ensure_metadata_table(conn)
+            return load_file_metadata(conn, table_name)
+        version, metadata = self._read(load)
+        with self._lock:
+            if version == self._version:
+                self._metadata[table_name] = metadata
+        return metadata
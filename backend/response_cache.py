@@ -0,0 +1,88 @@
+"""Byte-bounded LRU cache of serialized responses, tied to a data version.
+
+Report and analytics responses only change when the stored data does, so
+they are kept as the bytes sent to the client, keyed by endpoint and
+normalized parameters. Every entry belongs to the data version it was
+computed at (see registry.DatasetRegistry.version): the first lookup at a
+newer version drops them all, and a response computed at an older version
+than the cache has seen is not stored.
+
+``observers`` are called as ``fn(event, endpoint)`` with event ``'hit'``,
+``'miss'`` or ``'eviction'``.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: Optional[str]
+    headers: Tuple[Tuple[str, str], ...]
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        # one response may take at most this share of the cache
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self.observers: List[Callable[[str, str], None]] = []
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _notify(self, event: str, endpoint: str):
+        for observer in self.observers:
+            try:
+                observer(event, endpoint)
+            except Exception:
+                pass
+
+    def _advance(self, version: int):
+        if version > self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, endpoint: str, params: str, version: int) -> Optional[CachedResponse]:
+        with self._lock:
+            self._advance(version)
+            entry = self._entries.get((endpoint, params)) if version == self._version else None
+            if entry is not None:
+                self._entries.move_to_end((endpoint, params))
+        self._notify('hit' if entry is not None else 'miss', endpoint)
+        return entry
+
+    def put(self, endpoint: str, params: str, version: int, entry: CachedResponse):
+        size = len(entry.body)
+        if size > self.max_entry_bytes:
+            return
+        evicted = []
+        with self._lock:
+            self._advance(version)
+            if version != self._version:
+                return
+            previous = self._entries.pop((endpoint, params), None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._entries[(endpoint, params)] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                (evicted_endpoint, _), old = self._entries.popitem(last=False)
+                self._bytes -= len(old.body)
+                evicted.append(evicted_endpoint)
+        for evicted_endpoint in evicted:
+            self._notify('eviction', evicted_endpoint)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
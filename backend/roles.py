@@ -0,0 +1,113 @@
+"""Semantic column roles (date, quantity, price, product, ...) of a dataset.
+
+Roles are detected once at ingest from the cleaned column names and dtypes and
+stored in ``file_metadata.roles``; the export and analytics handlers read them
+instead of re-running the name heuristics and numeric scans per request.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import re
+
+import pandas as pd
+
+# role -> substrings of the (lower-cased) column name, first matching column wins
+ROLE_KEYWORDS = {
+    'date': ('date',),
+    'quantity': ('quantity', 'qty'),
+    'price': ('price', 'amount'),
+    # by_region/by_customer also accept a sales column as the value
+    'value': ('price', 'amount', 'sales'),
+    'product': ('product', 'item'),
+    'region': ('region', 'location', 'area'),
+    'customer': ('customer', 'client', 'account'),
+}
+TIME_KEYWORDS = ('date', 'time', 'created', 'updated')
+# A text column counts as numeric when more than this share of it parses
+NUMERIC_TEXT_RATIO = 0.5
+# Dates stored like this compare correctly as strings, so date-range filters
+# can be pushed into SQL / Parquet predicates
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+TRANSACTION_COLUMN_TYPES = {
+    'date': 'object', 'type': 'object', 'product': 'object', 'quantity': 'float64',
+    'price': 'float64', 'customer': 'object', 'region': 'object',
+}
+# Declared SQLite column types of tables without file_metadata
+SQL_AFFINITY_DTYPES = {
+    'INTEGER': 'int64', 'REAL': 'float64', 'NUMERIC': 'float64', 'TEXT': 'object', 'VARCHAR': 'object',
+}
+
+
+def _first_match(columns: List[str], keywords: Iterable[str]) -> Optional[str]:
+    return next((c for c in columns if any(k in c.lower() for k in keywords)), None)
+
+
+def is_numeric_dtype(dtype: Optional[str]) -> bool:
+    if not dtype or dtype == 'bool':
+        return False
+    try:
+        return pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype))
+    except TypeError:
+        return False
+
+
+def is_text_dtype(dtype: Optional[str]) -> bool:
+    return dtype in ('object', 'str', 'string')
+
+
+def count_numeric_values(chunk: pd.DataFrame) -> Dict[str, int]:
+    """Per column, how many values of ``chunk`` are or parse as numbers."""
+    counts = {}
+    for col in chunk.columns:
+        dtype = str(chunk[col].dtype)
+        if is_numeric_dtype(dtype):
+            counts[col] = int(chunk[col].notna().sum())
+        elif is_text_dtype(dtype):
+            counts[col] = int(pd.to_numeric(chunk[col], errors='coerce').notna().sum())
+    return counts
+
+
+def count_iso_dates(chunk: pd.DataFrame) -> Dict[str, int]:
+    """Per date-named column, how many values of ``chunk`` are ISO dates."""
+    counts = {}
+    for col in chunk.columns:
+        if not any(k in col.lower() for k in ROLE_KEYWORDS['date']):
+            continue
+        if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+            counts[col] = int(chunk[col].notna().sum())
+        elif is_text_dtype(str(chunk[col].dtype)):
+            counts[col] = int(chunk[col].dropna().astype(str).str.match(ISO_DATE_RE).sum())
+    return counts
+
+
+def is_iso_date(value: Optional[str]) -> bool:
+    return bool(value) and bool(ISO_DATE_RE.match(str(value)))
+
+
+def detect_roles(columns: List[str], column_types: Dict[str, str],
+                 numeric_text: Optional[List[str]] = None, iso_dates: Optional[List[str]] = None) -> dict:
+    """Roles for a dataset's columns.
+
+    ``numeric_text`` lists text columns found to hold mostly numbers while
+    ingesting; they are treated as numeric alongside the numeric dtypes.
+    ``iso_dates`` lists columns whose every value is an ISO-8601 date.
+    """
+    columns = list(columns)
+    column_types = column_types or {}
+    numeric_text = [c for c in (numeric_text or []) if c in columns]
+    roles = {role: _first_match(columns, keywords) for role, keywords in ROLE_KEYWORDS.items()}
+    roles['type'] = next((c for c in columns if c.lower() == 'type'), None)
+    roles['date_iso'] = roles['date'] is not None and roles['date'] in (iso_dates or [])
+    roles['time_columns'] = [c for c in columns if any(k in c.lower() for k in TIME_KEYWORDS)]
+    roles['numeric'] = [c for c in columns if is_numeric_dtype(column_types.get(c))] + \
+        [c for c in columns if c in numeric_text and not is_numeric_dtype(column_types.get(c))]
+    roles['numeric_text'] = numeric_text
+    roles['categorical'] = [c for c in columns if is_text_dtype(column_types.get(c))]
+    return roles
+
+
+def roles_for(columns: List[str], column_types: Optional[Dict[str, str]], roles: Optional[dict]) -> dict:
+    """Stored roles, or detected from the names and types for datasets ingested before roles existed."""
+    if roles:
+        return roles
+    return detect_roles(columns, column_types or {})
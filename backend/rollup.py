@@ -0,0 +1,90 @@
+"""Daily rollup of the legacy ``transactions`` table.
+
+``transactions_daily`` holds one row per (date, type, product, region,
+customer) with the summed quantity, the summed quantity * price and the row
+count. Every insert into ``transactions`` folds its new rows in, in the same
+transaction, so reports and the analytics endpoints can aggregate over
+distinct combinations instead of over raw rows.
+
+The key columns may be NULL, so rows are matched with ``IS`` rather than
+through a unique constraint.
+"""
+import sqlite3
+from typing import Optional
+
+ROLLUP_TABLE = 'transactions_daily'
+ROLLUP_DIMENSIONS = ('date', 'type', 'product', 'region', 'customer')
+# raw transactions expression -> rollup column holding its per-group sum
+ROLLUP_MEASURES = {
+    'amount': 'amount',
+    '(quantity * price)': 'amount',
+    'quantity': 'quantity',
+    '1': 'rows',
+}
+
+_KEYS = ', '.join(ROLLUP_DIMENSIONS)
+_MATCH = ' AND '.join(f'r.{c} IS d.{c}' for c in ROLLUP_DIMENSIONS)
+
+
+def rollup_available(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                        (ROLLUP_TABLE,)).fetchone() is not None
+
+
+def rollup_measure(expr: str) -> Optional[str]:
+    """The rollup column to SUM in place of ``SUM(expr)`` over raw rows, if any."""
+    return ROLLUP_MEASURES.get(expr)
+
+
+def _aggregate(after_id: int) -> str:
+    return f'''
+    SELECT {_KEYS}, TOTAL(quantity) AS quantity, TOTAL(amount) AS amount, COUNT(*) AS rows
+    FROM transactions WHERE id > {int(after_id)}
+    GROUP BY {_KEYS}
+    '''
+
+
+def build_rollup(conn: sqlite3.Connection):
+    """(Re)create the rollup from every row of ``transactions``."""
+    conn.execute(f'DROP TABLE IF EXISTS {ROLLUP_TABLE}')
+    conn.execute(f'''
+    CREATE TABLE {ROLLUP_TABLE} (
+        date TEXT,
+        type TEXT,
+        product TEXT,
+        region TEXT,
+        customer TEXT,
+        quantity REAL,
+        amount REAL,
+        rows INTEGER
+    )
+    ''')
+    conn.execute(f'CREATE INDEX idx_{ROLLUP_TABLE}_key ON {ROLLUP_TABLE}({_KEYS})')
+    conn.execute(f'INSERT INTO {ROLLUP_TABLE} ({_KEYS}, quantity, amount, rows) {_aggregate(0)}')
+
+
+def update_rollup(conn: sqlite3.Connection, after_id: int) -> bool:
+    """Fold the transactions with id > ``after_id`` into the rollup; False if there is none."""
+    if not rollup_available(conn):
+        return False
+    conn.execute('DROP TABLE IF EXISTS temp.rollup_delta')
+    conn.execute(f'CREATE TEMP TABLE rollup_delta AS {_aggregate(after_id)}')
+    conn.execute(f'''
+    UPDATE {ROLLUP_TABLE} AS r
+    SET quantity = r.quantity + d.quantity, amount = r.amount + d.amount, rows = r.rows + d.rows
+    FROM temp.rollup_delta AS d
+    WHERE {_MATCH}
+    ''')
+    conn.execute(f'''
+    INSERT INTO {ROLLUP_TABLE} ({_KEYS}, quantity, amount, rows)
+    SELECT {_KEYS}, quantity, amount, rows FROM temp.rollup_delta AS d
+    WHERE NOT EXISTS (SELECT 1 FROM {ROLLUP_TABLE} AS r WHERE {_MATCH})
+    ''')
+    conn.execute('DROP TABLE temp.rollup_delta')
+    return True
+
+
+def clear_rollup(conn: sqlite3.Connection):
+    """Empty the rollup after every transaction was deleted."""
+    if rollup_available(conn):
+        conn.execute(f'DELETE FROM {ROLLUP_TABLE}')
@@ -0,0 +1,92 @@
+"""Trigram full-text indexes for substring search over dataset tables.
+
+Every searchable table gets an external-content FTS5 table ``fts_<table>``
+over its text columns. The trigram tokenizer indexes every three-character
+sequence, so a MATCH finds any substring of at least MIN_QUERY_LENGTH
+characters (case-insensitively) through the index instead of scanning each
+row with LIKE. The index only holds trigrams; the rows stay in the table and
+are joined back by rowid.
+
+Rows are indexed inside the ingest transaction that inserts them. SQLite
+builds without FTS5 or the trigram tokenizer (before 3.34) simply get no
+index, and callers fall back to scanning.
+"""
+import logging
+import sqlite3
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Trigrams need three characters; shorter queries can't use the index
+MIN_QUERY_LENGTH = 3
+# Text columns of the legacy transactions table, as searched by /transactions
+TRANSACTION_SEARCH_COLUMNS = ['type', 'product', 'customer', 'region']
+
+
+def _fts_table(table_name: str) -> str:
+    return f'fts_{table_name}'
+
+
+def search_columns(conn: sqlite3.Connection, table_name: str) -> Optional[List[str]]:
+    """Columns covered by the table's search index, or None if it has none."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                          (_fts_table(table_name),)).fetchone()
+    if not exists:
+        return None
+    return [r[1] for r in conn.execute(f'PRAGMA table_info("{_fts_table(table_name)}")').fetchall()]
+
+
+def drop_search_index(conn: sqlite3.Connection, table_name: str):
+    conn.execute(f'DROP TABLE IF EXISTS "{_fts_table(table_name)}"')
+
+
+def build_search_index(conn: sqlite3.Connection, table_name: str, columns: List[str]) -> bool:
+    """(Re)create the index over ``columns`` and index every row already in the table."""
+    drop_search_index(conn, table_name)
+    if not columns:
+        return False
+    fts = _fts_table(table_name)
+    cols = ', '.join(f'"{c}"' for c in columns)
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE \"{fts}\" USING fts5({cols}, content='{table_name}', "
+                     f"content_rowid='rowid', tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        logger.warning(f'Search index for {table_name} not available: {e}')
+        return False
+    conn.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+    return True
+
+
+def index_rows(conn: sqlite3.Connection, table_name: str, after_rowid: int) -> bool:
+    """Index the rows inserted after ``after_rowid``; False if the table has no index."""
+    columns = search_columns(conn, table_name)
+    if columns is None:
+        return False
+    cols = ', '.join(f'"{c}"' for c in columns)
+    conn.execute(
+        f'INSERT INTO "{_fts_table(table_name)}"(rowid, {cols}) '
+        f'SELECT rowid, {cols} FROM "{table_name}" WHERE rowid > ?',
+        (after_rowid,)
+    )
+    return True
+
+
+def last_rowid(conn: sqlite3.Connection, table_name: str) -> int:
+    return conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+
+
+def clear_search_index(conn: sqlite3.Connection, table_name: str):
+    """Empty the index after every row of the table was deleted."""
+    if search_columns(conn, table_name) is not None:
+        fts = _fts_table(table_name)
+        conn.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'delete-all\')')
+
+
+def search_filter(conn: sqlite3.Connection, table_name: str, query: str) -> Optional[Tuple[str, list]]:
+    """WHERE term and params selecting the rows whose indexed columns contain
+    ``query``; None when the table has no index or the query is too short."""
+    if not query or len(query) < MIN_QUERY_LENGTH or search_columns(conn, table_name) is None:
+        return None
+    fts = _fts_table(table_name)
+    phrase = '"' + query.replace('"', '""') + '"'
+    return f'rowid IN (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH ?)', [phrase]
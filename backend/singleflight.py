@@ -0,0 +1,58 @@
+"""Single-flight execution of identical concurrent computations.
+
+Requests that need the same result at the same time (a team opening the same
+dashboard together) shouldn't each load the data and call the AI model. The
+first caller for a key runs the computation; callers arriving with the same
+key while it is in flight wait for it and get its result, or its exception.
+Nothing is kept once the computation finishes, so the next caller starts a
+new one.
+
+``observers`` are called as ``fn(event, name)`` with event ``'coalesced'``
+for every caller that waited on another's execution, ``name`` being the first
+element of the key.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self.observers: List[Callable[[str, str], None]] = []
+        self._calls: Dict[Tuple[Hashable, ...], Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Computations in flight."""
+        return len(self._calls)
+
+    def _notify(self, event: str, name: str):
+        for observer in self.observers:
+            try:
+                observer(event, name)
+            except Exception:
+                pass
+
+    def do(self, key: Tuple[Hashable, ...], fn: Callable):
+        """``fn()``, or the result of the call already running for ``key``."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self._notify('coalesced', str(key[0]))
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key: Tuple[Hashable, ...]):
+        with self._lock:
+            self._calls.pop(key, None)
@@ -0,0 +1,295 @@
+"""Per-column statistics catalog, computed while ingesting.
+
+Every dataset version gets one ``column_stats`` row per column holding the
+finished summary (count, nulls, mean/std/min/max/median, distinct estimate,
+top values) plus the mergeable state it was built from, so an append only
+folds the new rows into the previous version's state.
+
+Moments and min/max are exact; min/max keep the column's type. Top values
+and distinct counts are exact until a column exceeds TOPK_CAPACITY distinct
+values. Past that the counts come from a Misra-Gries summary: every value
+seen in more than 1/(TOPK_CAPACITY + 1) of the rows is kept, and each count
+is low by at most ``top_values_max_error``. The distinct count then comes
+from a HyperLogLog. The median is exact up to MEDIAN_SAMPLE values and
+estimated from a uniform sample beyond that.
+"""
+import base64
+import json
+import math
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+TOPK_CAPACITY = 1000
+TOP_VALUES = 10
+MEDIAN_SAMPLE = 1024
+HLL_PRECISION = 11  # 2048 registers; leaves 53 hash bits, exact in float64
+_HLL_REGISTERS = 1 << HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_REGISTERS)
+
+_rng = np.random.default_rng()
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series.dtype)
+
+
+def _plain(value):
+    """numpy scalars -> JSON-serializable Python values."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnStats:
+    """Mergeable summary of one column."""
+
+    def __init__(self):
+        self.rows = 0
+        self.nulls = 0
+        # numeric values (exact moments, Chan et al. parallel update)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        # bottom-k sample by random priority, for the median
+        self.sample_keys = np.empty(0)
+        self.sample_values = np.empty(0)
+        # value counts, bounded to TOPK_CAPACITY entries (Misra-Gries); every
+        # count is low by at most ``error``
+        self.counts = pd.Series(dtype='int64')
+        self.truncated = False
+        self.error = 0
+        self.registers = np.zeros(_HLL_REGISTERS, dtype=np.uint8)
+
+    def update(self, series: pd.Series):
+        self.rows += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+        if _is_numeric(values) and not pd.api.types.is_bool_dtype(values):
+            self._update_numeric(values.to_numpy(dtype='float64'), _plain(values.min()), _plain(values.max()))
+            values = values.astype('float64')
+        self._update_counts(values.value_counts())
+        self._update_hll(values)
+
+    def _update_numeric(self, x: np.ndarray, min_b, max_b):
+        n_b = len(x)
+        mean_b = float(x.mean())
+        m2_b = float(((x - mean_b) ** 2).sum())
+        self._merge_moments(n_b, mean_b, m2_b, min_b, max_b)
+        self._merge_sample(_rng.random(n_b), x)
+
+    def _merge_moments(self, n_b: int, mean_b: float, m2_b: float, min_b, max_b):
+        if n_b == 0:
+            return
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        if self.min is None:
+            self.min, self.max = min_b, max_b
+        else:
+            bounds = (self.min, self.max, min_b, max_b)
+            self.min, self.max = min(self.min, min_b), max(self.max, max_b)
+            if any(isinstance(v, float) for v in bounds):
+                # a column with any float chunk is a float column
+                self.min, self.max = float(self.min), float(self.max)
+
+    def _merge_sample(self, keys: np.ndarray, values: np.ndarray):
+        keys = np.concatenate([self.sample_keys, keys])
+        values = np.concatenate([self.sample_values, values])
+        if len(keys) > MEDIAN_SAMPLE:
+            keep = np.argpartition(keys, MEDIAN_SAMPLE)[:MEDIAN_SAMPLE]
+            keys, values = keys[keep], values[keep]
+        self.sample_keys, self.sample_values = keys, values
+
+    def _update_counts(self, counts: pd.Series, error: int = 0):
+        """Fold in ``counts`` (exact, or low by at most ``error``). Past
+        TOPK_CAPACITY values every count is lowered by the next largest one
+        and the values left at zero are dropped, as in a merge of Misra-Gries
+        summaries."""
+        merged = self.counts.add(counts, fill_value=0) if len(self.counts) else counts
+        self.error += error
+        if len(merged) > TOPK_CAPACITY:
+            cut = merged.nlargest(TOPK_CAPACITY + 1).iloc[-1]
+            merged = merged[merged > cut] - cut
+            self.error += int(cut)
+            self.truncated = True
+        self.counts = merged.astype('int64')
+
+    def _update_hll(self, values: pd.Series):
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        idx = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+        rest = (hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)).astype('float64')
+        with np.errstate(divide='ignore'):
+            rank = np.where(rest > 0, (64 - HLL_PRECISION) - np.floor(np.log2(rest)),
+                            64 - HLL_PRECISION + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: 'ColumnStats'):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self._merge_moments(other.n, other.mean, other.m2, other.min, other.max)
+        self._merge_sample(other.sample_keys, other.sample_values)
+        if len(other.counts) or other.error:
+            self._update_counts(other.counts, other.error)
+        self.truncated = self.truncated or other.truncated
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def distinct(self) -> int:
+        if not self.truncated:
+            return len(self.counts)
+        estimate = _HLL_ALPHA * _HLL_REGISTERS ** 2 / np.power(2.0, -self.registers.astype('float64')).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * _HLL_REGISTERS and zeros:
+            estimate = _HLL_REGISTERS * math.log(_HLL_REGISTERS / zeros)
+        return max(int(round(estimate)), len(self.counts))
+
+    def is_numeric(self) -> bool:
+        """Every non-null value seen was a number."""
+        return self.n > 0 and self.n == self.rows - self.nulls
+
+    def summary(self) -> dict:
+        numeric = self.is_numeric()
+        count = self.rows - self.nulls
+        top = self.counts.nlargest(TOP_VALUES) if len(self.counts) else self.counts
+        stats = {
+            'type': 'numeric' if numeric else 'categorical',
+            'count': count,
+            'null_count': self.nulls,
+            'distinct_count': self.distinct(),
+            'distinct_exact': not self.truncated,
+        }
+        if numeric:
+            stats.update({
+                'mean': self.mean if self.n else 0,
+                'std': math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0,
+                'min': self.min if self.n else 0,
+                'max': self.max if self.n else 0,
+                'median': float(np.median(self.sample_values)) if len(self.sample_values) else 0,
+                'median_exact': self.n <= MEDIAN_SAMPLE,
+            })
+        else:
+            stats['top_values'] = {str(_plain(k)): int(v) for k, v in top.items()}
+            stats['top_values_exact'] = not self.truncated
+            stats['top_values_max_error'] = self.error
+        return stats
+
+    def to_state(self) -> dict:
+        return {
+            'rows': self.rows, 'nulls': self.nulls,
+            'n': self.n, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max,
+            'sample_keys': self.sample_keys.tolist(), 'sample_values': self.sample_values.tolist(),
+            'counts': [[_plain(k), int(v)] for k, v in self.counts.items()],
+            'truncated': self.truncated, 'error': self.error,
+            'registers': base64.b64encode(self.registers.tobytes()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'ColumnStats':
+        col = cls()
+        col.rows, col.nulls = state['rows'], state['nulls']
+        col.n, col.mean, col.m2 = state['n'], state['mean'], state['m2']
+        col.min, col.max = state['min'], state['max']
+        col.sample_keys = np.array(state['sample_keys'], dtype='float64')
+        col.sample_values = np.array(state['sample_values'], dtype='float64')
+        if state['counts']:
+            keys, counts = zip(*state['counts'])
+            col.counts = pd.Series(counts, index=list(keys), dtype='int64')
+        col.truncated = state['truncated']
+        col.error = state.get('error', 0)
+        col.registers = np.frombuffer(base64.b64decode(state['registers']), dtype=np.uint8).copy()
+        return col
+
+
+class StatsAccumulator:
+    """Column statistics of a dataset, fed chunk by chunk."""
+
+    def __init__(self):
+        self.columns: Dict[str, ColumnStats] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        for col in chunk.columns:
+            self.columns.setdefault(col, ColumnStats()).update(chunk[col])
+
+    def merge(self, other: 'StatsAccumulator'):
+        for col, stats in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(stats)
+            else:
+                self.columns[col] = stats
+
+
+def ensure_stats_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS column_stats (
+        table_name TEXT,
+        version INTEGER,
+        column_name TEXT,
+        position INTEGER,
+        stats TEXT,
+        state TEXT,
+        PRIMARY KEY (table_name, version, column_name)
+    )
+    ''')
+
+
+def clear_stats(conn: sqlite3.Connection, table_name: str):
+    ensure_stats_table(conn)
+    conn.execute('DELETE FROM column_stats WHERE table_name = ?', (table_name,))
+
+
+def store_stats(conn: sqlite3.Connection, table_name: str, version: int, acc: StatsAccumulator,
+                columns: List[str]):
+    """Write the catalog rows of ``columns`` for one dataset version."""
+    ensure_stats_table(conn)
+    conn.execute('DELETE FROM column_stats WHERE table_name = ? AND version = ?', (table_name, version))
+    conn.executemany(
+        'INSERT INTO column_stats (table_name, version, column_name, position, stats, state) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(table_name, version, col, i,
+          json.dumps(acc.columns[col].summary()),
+          json.dumps(acc.columns[col].to_state()))
+         for i, col in enumerate(columns) if col in acc.columns]
+    )
+
+
+def load_stats(conn: sqlite3.Connection, table_name: str, version: int) -> Optional[Dict[str, dict]]:
+    """Column -> summary for a dataset version, in column order; None if not cataloged."""
+    ensure_stats_table(conn)
+    rows = conn.execute(
+        'SELECT column_name, stats FROM column_stats WHERE table_name = ? AND version = ? ORDER BY position',
+        (table_name, version)
+    ).fetchall()
+    if not rows:
+        return None
+    return {name: json.loads(stats) for name, stats in rows}
+
+
+def load_accumulator(conn: sqlite3.Connection, table_name: str, version: int) -> Optional[StatsAccumulator]:
+    """The mergeable state behind a version's catalog, for appends."""
+    ensure_stats_table(conn)
+    rows = conn.execute(
+        'SELECT column_name, state FROM column_stats WHERE table_name = ? AND version = ?',
+        (table_name, version)
+    ).fetchall()
+    if not rows:
+        return None
+    acc = StatsAccumulator()
+    for name, state in rows:
+        acc.columns[name] = ColumnStats.from_state(json.loads(state))
+    return acc
+
+
+def scan_table(conn: sqlite3.Connection, table_name: str, chunk_rows: int) -> StatsAccumulator:
+    """Build the statistics of an existing table by reading it in chunks."""
+    acc = StatsAccumulator()
+    for chunk in pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn, chunksize=chunk_rows):
+        acc.update(chunk)
+    return acc
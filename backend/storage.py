@@ -0,0 +1,261 @@
+"""Shared transactions storage on a database server, through SQLAlchemy Core.
+
+With ``DATABASE_URL`` set to a PostgreSQL URL (for example
+``postgresql+psycopg2://user:pass@db:5432/business``) the legacy
+``transactions`` table lives on that server instead of in the local SQLite
+file, so several API replicas can serve and append to the same
+transactions. Each process keeps one pooled engine (``DB_POOL_SIZE``
+connections plus ``DB_MAX_OVERFLOW`` under load, checked with a ping before
+use).
+
+Only ``transactions`` is shared. Uploaded datasets and their catalog
+(file_metadata, versions, statistics), upload jobs, the search index and
+the daily rollup stay in each replica's SQLite file, so a dataset uploaded
+through one replica is not served by the others; transactions search and
+the rollup-backed reports read the server table directly instead.
+
+The queries here mirror the SQLite paths of the transactions endpoints:
+dates are the same ISO text, NULLs sort first in ascending order as in
+SQLite, and duplicate rows are left to the unique fingerprint index.
+tests/test_storage.py runs against the PostgreSQL database named by
+``TEST_DATABASE_URL`` and is skipped without one.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import (Column, Computed, Float, Index, Integer, MetaData, Table, Text, and_, create_engine,
+                        func, literal, literal_column, or_, select, text, tuple_)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine
+
+DATABASE_URL = os.getenv('DATABASE_URL', '').strip()
+SHARED_STORAGE = bool(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Seconds before a pooled connection is replaced, ahead of server-side idle timeouts
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+if SHARED_STORAGE and not DATABASE_URL.startswith('postgresql'):
+    raise ValueError('DATABASE_URL must be a postgresql:// URL; leave it unset to use the SQLite file')
+
+# Serializes the schema setup of replicas starting together
+_SCHEMA_LOCK_ID = 0x6275736d
+
+metadata = MetaData()
+
+transactions = Table(
+    'transactions', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('date', Text),
+    Column('type', Text),
+    Column('product', Text),
+    Column('quantity', Float),
+    Column('price', Float),
+    Column('customer', Text),
+    Column('region', Text),
+    Column('fingerprint', Text),
+    Column('amount', Float, Computed('quantity * price', persisted=True)),
+    Index('idx_transactions_date', 'date'),
+    Index('idx_transactions_product', 'product'),
+    Index('idx_transactions_region', 'region'),
+    Index('idx_transactions_customer', 'customer'),
+    Index('ux_transactions_fingerprint', 'fingerprint', unique=True),
+    Index('idx_transactions_date_type_amount', 'date', 'type', 'amount'),
+    Index('idx_transactions_product_date_amount', 'product', 'date', 'amount'),
+    Index('idx_transactions_region_date_amount', 'region', 'date', 'amount'),
+    Index('idx_transactions_customer_date_amount', 'customer', 'date', 'amount'),
+)
+
+# Columns written by an upload; id and amount come from the server
+INSERT_COLUMNS = ['date', 'type', 'product', 'quantity', 'price', 'customer', 'region', 'fingerprint']
+# normalize_transactions rejects rows without these
+NOT_NULL_COLUMNS = {'date', 'quantity', 'price'}
+
+_engine: Optional[Engine] = None
+_engine_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def shared_engine() -> Engine:
+    """The process-wide pooled engine; a forked worker gets its own. The
+    transactions table is created on first use."""
+    global _engine, _engine_pid
+    with _lock:
+        if _engine is None or _engine_pid != os.getpid():
+            eng = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+            with eng.begin() as conn:
+                conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': _SCHEMA_LOCK_ID})
+                metadata.create_all(conn)
+            _engine, _engine_pid = eng, os.getpid()
+        return _engine
+
+
+def dispose():
+    global _engine
+    with _lock:
+        eng, _engine = _engine, None
+    if eng is not None:
+        eng.dispose()
+
+
+def ping():
+    with shared_engine().connect() as conn:
+        conn.execute(select(literal(1)))
+
+
+def _col(name: str):
+    return transactions.c[name]
+
+
+def _bytewise(name: str):
+    # SQLite compares text byte by byte; the server's locale collation wouldn't
+    col = _col(name)
+    return col.collate('C') if isinstance(col.type, Text) else col
+
+
+def conditions(start_date: Optional[str] = None, end_date: Optional[str] = None,
+               filters: Sequence[Tuple[str, str, object]] = ()) -> list:
+    """WHERE terms: a date range plus ``(column, op, value)`` filters, op
+    ``'like'`` matching ``value`` case-insensitively anywhere in the column
+    and anything else testing equality."""
+    terms = []
+    if start_date:
+        terms.append(_col('date') >= start_date)
+    if end_date:
+        terms.append(_col('date') <= end_date)
+    for name, op, value in filters:
+        if op == 'like':
+            terms.append(func.lower(_col(name)).like(f'%{str(value).lower()}%'))
+        else:
+            terms.append(_col(name) == value)
+    return terms
+
+
+def search_condition(search: str, columns: List[str]):
+    q = f'%{search.lower()}%'
+    return or_(*(func.lower(_col(c)).like(q) for c in columns))
+
+
+def _amount_by_type(terms: list):
+    kind = func.lower(_col('type'))
+    return select(kind, func.coalesce(func.sum(_col('amount')), 0.0), func.count()) \
+        .where(*terms).group_by(kind)
+
+
+def summary(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[float, float, int]:
+    """(sales amount, purchases amount, row count) over the date range."""
+    with shared_engine().connect() as conn:
+        rows = conn.execute(_amount_by_type(conditions(start_date, end_date))).all()
+    amounts = {kind: amount for kind, amount, _ in rows}
+    return float(amounts.get('sale', 0.0)), float(amounts.get('purchase', 0.0)), sum(n for _, _, n in rows)
+
+
+def by_product(start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[dict]:
+    stmt = select(_col('product'),
+                  func.coalesce(func.sum(_col('amount')), 0.0).label('amount'),
+                  func.coalesce(func.sum(_col('quantity')), 0.0).label('quantity')) \
+        .where(_col('product').is_not(None), *conditions(start_date, end_date)) \
+        .group_by(_col('product')).order_by(_bytewise('product'))
+    with shared_engine().connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(stmt)]
+
+
+def distincts(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, list]:
+    """Sorted distinct non-NULL product, region and customer values."""
+    terms = conditions(start_date, end_date)
+    out = {}
+    with shared_engine().connect() as conn:
+        for name in ('product', 'region', 'customer'):
+            stmt = select(_col(name)).where(_col(name).is_not(None), *terms).group_by(_col(name)).order_by(_bytewise(name))
+            out[name] = conn.execute(stmt).scalars().all()
+    return out
+
+
+def _after(col: str, direction: str, value, row_id: int):
+    """Rows after (value, id) in ORDER BY col, id, as _after_cursor in app.py."""
+    c, row = _bytewise(col), _col('id')
+    if value is None:
+        if direction == 'ASC':
+            return or_(and_(c.is_(None), row > row_id), c.is_not(None))
+        return and_(c.is_(None), row < row_id)
+    term = tuple_(c, row) > tuple_(value, row_id) if direction == 'ASC' else tuple_(c, row) < tuple_(value, row_id)
+    if direction == 'DESC' and col not in NOT_NULL_COLUMNS:
+        term = or_(term, c.is_(None))
+    return term
+
+
+def transactions_page(terms: list, col: str, direction: str, limit: int, offset: int,
+                      after: Optional[tuple] = None) -> Tuple[pd.DataFrame, int, Optional[float]]:
+    """(rows of the page, filtered row count, filtered amount); ``after`` is
+    the (value, id) of the previous page's last row."""
+    c, row = _bytewise(col), _col('id')
+    if direction == 'ASC':
+        order = [c.asc().nulls_first(), row.asc()]
+    else:
+        order = [c.desc().nulls_last(), row.desc()]
+    page_terms = terms + [_after(col, direction, *after)] if after else terms
+    stmt = select(transactions).where(*page_terms).order_by(*order).limit(limit).offset(offset)
+    totals = select(func.count(), func.sum(_col('amount'))).where(*terms)
+    with shared_engine().connect() as conn:
+        df = pd.read_sql_query(stmt, conn)
+        total, amount = conn.execute(totals).one()
+    return df, total, amount
+
+
+def _measure(metric: str):
+    m = (metric or '').lower()
+    if m in ('sum_quantity', 'quantity'):
+        return _col('quantity')
+    if m in ('count', 'rows'):
+        return literal_column('1')
+    return _col('amount')
+
+
+def metric_by(metric: str, group_by: str, terms: list, top_n: int = 0) -> List[dict]:
+    label = _col(group_by).label('label')
+    value = func.sum(_measure(metric)).label('value')
+    stmt = select(label, value).where(*terms).group_by(_col(group_by)) \
+        .order_by(value.desc().nulls_last(), label.collate('C').asc().nulls_first())
+    if top_n > 0:
+        stmt = stmt.limit(top_n)
+    with shared_engine().connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(stmt)]
+
+
+def metric_series(metric: str, terms: list) -> pd.DataFrame:
+    stmt = select(_col('date'), func.sum(_measure(metric)).label('value')).where(*terms) \
+        .group_by(_col('date')).order_by(_col('date').asc().nulls_first())
+    with shared_engine().connect() as conn:
+        return pd.read_sql_query(stmt, conn, parse_dates=['date'])
+
+
+def metric_total(metric: str, terms: list):
+    with shared_engine().connect() as conn:
+        return conn.execute(select(func.sum(_measure(metric))).where(*terms)).scalar()
+
+
+def read_transactions() -> pd.DataFrame:
+    """Every transaction, as ``SELECT * FROM transactions`` on SQLite reads them."""
+    with shared_engine().connect() as conn:
+        return pd.read_sql_query(select(transactions), conn, parse_dates=['date'])
+
+
+def insert_transactions(conn: Connection, rows: pd.DataFrame) -> int:
+    """Insert normalized rows with their fingerprints, skipping stored
+    fingerprints; returns the number inserted."""
+    if rows.empty:
+        return 0
+    records = rows[INSERT_COLUMNS].astype(object).where(rows[INSERT_COLUMNS].notna(), None).to_dict('records')
+    stmt = pg_insert(transactions).on_conflict_do_nothing(index_elements=['fingerprint']) \
+        .returning(transactions.c.id)
+    return len(conn.execute(stmt, records).all())
+
+
+def clear_transactions() -> int:
+    """Delete every transaction; returns the count deleted."""
+    with shared_engine().begin() as conn:
+        return conn.execute(transactions.delete()).rowcount
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the backend as a package (``backend.app``), also when
+# pytest runs from backend/ as CI does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,42 @@
+import time
+
+from backend import db
+
+
+def test_write_observers_follow_new_pools(tmp_path):
+    database = str(tmp_path / 'business.db')
+    seen = []
+
+    def observer(kind, seconds):
+        seen.append(kind)
+    db.observe_writes(observer)
+    try:
+        db.pool_for(database).writes.write(lambda conn: conn.execute('CREATE TABLE t (x)'))
+        db.close_pools()
+        db.pool_for(database).writes.write(lambda conn: conn.execute('INSERT INTO t VALUES (1)'))
+        assert seen == ['batch', 'batch']
+    finally:
+        db._write_observers.remove(observer)
+        db.close_pools()
+
+
+def test_batch_waits_for_a_write_lock_held_elsewhere(tmp_path, monkeypatch):
+    database = str(tmp_path / 'business.db')
+    monkeypatch.setattr(db, 'SQLITE_BUSY_TIMEOUT', 0.05)
+    holder = db.connect(database)
+    try:
+        holder.execute('CREATE TABLE t (x)')
+        holder.commit()
+        holder.execute('BEGIN IMMEDIATE')
+        holder.execute('INSERT INTO t VALUES (1)')
+        queue = db.pool_for(database).writes
+        writes = [queue.submit(lambda conn, x: conn.execute('INSERT INTO t VALUES (?)', (x,)), x) for x in (2, 3)]
+        time.sleep(0.3)
+        assert not any(w.done() for w in writes)
+        holder.commit()
+        for w in writes:
+            w.result(timeout=5)
+        assert holder.execute('SELECT x FROM t ORDER BY x').fetchall() == [(1,), (2,), (3,)]
+    finally:
+        holder.close()
+        db.close_pools()
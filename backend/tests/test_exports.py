@@ -0,0 +1,123 @@
+import csv
+import io
+import os
+import shutil
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client():
+    from backend import app as app_module
+    with TestClient(app_module.app) as c:
+        yield c
+    app_module.close_pools()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(app_module.DATABASE + suffix):
+            os.remove(app_module.DATABASE + suffix)
+    shutil.rmtree(os.path.splitext(app_module.DATABASE)[0] + '_parquet', ignore_errors=True)
+
+
+def _dates(text):
+    return sorted(row['date'] for row in csv.DictReader(io.StringIO(text)))
+
+
+def test_non_iso_dates_export_the_same_for_every_sort(client):
+    body = 'date,product,qty,price\n' + ''.join(
+        f'02/{day:02d}/2025,P{day % 3},{30 - day},1.5\n' for day in range(1, 29))
+    client.post('/upload', files={'file': ('us_dates.csv', body.encode(), 'text/csv')})
+
+    by_date = client.get('/export/transactions')
+    by_qty = client.get('/export/transactions?sort_by=qty')
+
+    assert by_date.status_code == by_qty.status_code == 200
+    assert _dates(by_date.text) == _dates(by_qty.text)
+    assert _dates(by_qty.text)[0] == '2025-02-01'
+
+
+def test_pinned_export_source_keeps_its_snapshot(client):
+    from backend import app as app_module
+    body = 'date,product,quantity,price\n2025-01-01,A,1,10\n2025-01-02,B,2,10\n'
+    client.post('/upload', files={'file': ('first.csv', body.encode(), 'text/csv')})
+    before = client.get('/export/summary').text
+
+    conn = app_module._reader()
+    try:
+        app_module.ensure_metadata_table(conn)
+        conn.execute('BEGIN')
+        src = app_module._ExportSource(conn, pinned=True)
+        newer = 'date,product,quantity,price\n2025-03-01,C,5,100\n'
+        client.post('/upload', files={'file': ('second.csv', newer.encode(), 'text/csv')})
+        # the frame cache now holds the newer dataset
+        assert client.get('/reports/income-statement').status_code == 200
+        assert client.get('/export/summary').text != before
+
+        assert app_module._summary_csv(src) == before
+        assert sorted(src.frame()['product']) == ['A', 'B']
+    finally:
+        conn.close()
+
+
+def test_uploads_in_the_same_second_get_their_own_tables(client):
+    names = []
+    for product in ('A', 'B'):
+        body = f'date,product,quantity,price\n2025-01-01,{product},1,10\n'
+        r = client.post('/upload', files={'file': (f'{product}.csv', body.encode(), 'text/csv')})
+        names.append(r.json()['table_name'])
+
+    assert names[0] != names[1]
+    listed = {d['table_name'] for d in client.get('/datasets').json()['datasets']}
+    assert set(names) <= listed
+
+
+def test_integer_aggregates_stay_integers(client):
+    body = 'date,product,quantity\n' + ''.join(f'2025-01-0{d},P{d % 2},{d * 10}\n' for d in range(1, 8))
+    table = client.post('/upload', files={'file': ('ints.csv', body.encode(), 'text/csv')}).json()['table_name']
+
+    groupby = client.post(f'/datasets/{table}/analyze', json={
+        'type': 'groupby', 'group_by': 'product', 'aggregate_column': 'quantity', 'aggregate_function': 'sum'})
+    timeseries = client.post(f'/datasets/{table}/analyze', json={
+        'type': 'timeseries', 'date_column': 'date', 'value_column': 'quantity'})
+
+    assert groupby.json()['data'] == [{'product': 'P0', 'quantity': 120}, {'product': 'P1', 'quantity': 160}]
+    assert all(isinstance(point['quantity'], int) for point in timeseries.json()['data'])
+
+
+def test_reset_during_an_upload_waits_for_it(client, monkeypatch):
+    from backend import app as app_module, db
+    from backend.ingest import ingest_into
+    monkeypatch.setattr(db, 'SQLITE_BUSY_TIMEOUT', 0.05)
+    # the writer thread reconnects with the short busy timeout
+    app_module.close_pools()
+    app_module._ensure_schema()
+    inserting, release = threading.Event(), threading.Event()
+
+    class Stalling(dict):
+        """Progress that holds the ingest, write lock taken, after its first insert."""
+        def update(self, fields):
+            super().update(fields)
+            if 'rows_inserted' in fields:
+                inserting.set()
+                release.wait(5)
+
+    body = 'date,product,quantity,price\n' + ''.join(f'2025-01-{day:02d},P{day},1,10\n' for day in range(1, 29))
+    result = {}
+
+    def upload():
+        conn = db.connect(app_module.DATABASE)
+        try:
+            result.update(ingest_into(conn, io.BytesIO(body.encode()), 'tx.csv', 'transactions',
+                                      progress=Stalling()))
+        finally:
+            conn.close()
+    thread = threading.Thread(target=upload)
+    thread.start()
+    assert inserting.wait(5)
+    threading.Timer(0.5, release.set).start()
+
+    reset = client.post('/admin/reset')
+    thread.join()
+    assert reset.status_code == 200
+    assert reset.json()['deleted'] == result['rows_inserted'] == 28
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from backend.columnar import read_dataset
+
+from backend.ingest import (DatasetExistsError, _merge_dtype, ensure_metadata_table, ingest_file,
+                            load_file_metadata)
+from backend.roles import is_text_dtype
+
+
+def test_merge_dtype_keeps_text():
+    assert _merge_dtype('int64', 'str') == 'object'
+    assert _merge_dtype('object', 'float64') == 'object'
+    assert _merge_dtype('int64', 'float64') == 'float64'
+
+
+def test_text_in_later_chunk_makes_column_text(tmp_path):
+    path = tmp_path / 'codes.csv'
+    rows = [f'{100 + i},{i}' for i in range(10)] + [f'X{81 + i},{i}' for i in range(10)]
+    path.write_text('code,qty\n' + '\n'.join(rows) + '\n')
+    database = str(tmp_path / 'business.db')
+
+    meta = ingest_file(database, str(path), 'codes.csv', 'data_codes', chunk_rows=5)
+
+    conn = sqlite3.connect(database)
+    affinity = {r[1]: r[2] for r in conn.execute('PRAGMA table_info("data_codes")')}
+    stored = conn.execute('SELECT DISTINCT typeof(code) FROM data_codes').fetchall()
+    first = conn.execute('SELECT code FROM data_codes ORDER BY rowid LIMIT 1').fetchone()[0]
+    stored_meta = load_file_metadata(conn, 'data_codes')
+    conn.close()
+    assert affinity['code'] == 'TEXT'
+    assert stored == [('text',)]
+    assert first == '100'
+    assert meta['row_count'] == 20
+    assert is_text_dtype(stored_meta['column_types']['code'])
+    assert 'code' in meta['roles']['categorical']
+
+
+def test_version_log_is_not_listed_as_a_dataset(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'business.db'))
+    conn.execute('CREATE TABLE dataset_versions (table_name TEXT, version INTEGER, original_filename TEXT, '
+                 'row_count INTEGER, content_hash TEXT, created_at TEXT, PRIMARY KEY (table_name, version))')
+    conn.execute("INSERT INTO dataset_versions VALUES ('data_1', 1, 'a.csv', 3, 'h', '')")
+    ensure_metadata_table(conn)
+    datasets = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'data_%'").fetchall()
+    kept = conn.execute('SELECT table_name FROM file_metadata_versions').fetchall()
+    conn.close()
+    assert datasets == []
+    assert kept == [('data_1',)]
+
+
+def test_new_dataset_never_replaces_an_existing_table(tmp_path):
+    database = str(tmp_path / 'business.db')
+    first, second = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    first.write_text('code,qty\na,1\nb,2\n')
+    second.write_text('code,qty\nc,3\n')
+    ingest_file(database, str(first), 'a.csv', 'data_1')
+
+    with pytest.raises(DatasetExistsError):
+        ingest_file(database, str(second), 'b.csv', 'data_1')
+
+    conn = sqlite3.connect(database)
+    rows = conn.execute('SELECT code FROM data_1 ORDER BY rowid').fetchall()
+    conn.close()
+    assert rows == [('a',), ('b',)]
+
+
+def test_sidecar_keeps_integers_until_a_chunk_holds_fractions(tmp_path):
+    database = str(tmp_path / 'business.db')
+    path = tmp_path / 'qty.csv'
+    path.write_text('qty,count\n' + ''.join(f'{i},{i}\n' for i in range(10)) + '2.5,10\n')
+
+    ingest_file(database, str(path), 'qty.csv', 'data_qty', chunk_rows=5)
+
+    df = read_dataset(database, 'data_qty', 1)
+    assert str(df['count'].dtype) == 'int64'
+    assert str(df['qty'].dtype) == 'float64'
+    assert df['qty'].tolist() == [float(i) for i in range(10)] + [2.5]
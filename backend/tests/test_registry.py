@@ -0,0 +1,23 @@
+import sqlite3
+
+from backend.ingest import ingest_file
+from backend.registry import DatasetRegistry
+
+
+def test_changes_committed_elsewhere_reach_the_registry(tmp_path):
+    database = str(tmp_path / 'business.db')
+    first, second = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    first.write_text('code,qty\na,1\nb,2\n')
+    second.write_text('code,qty\nc,3\n')
+    ingest_file(database, str(first), 'a.csv', 'data_1')
+    registry = DatasetRegistry(lambda: sqlite3.connect(database))
+    version, tag = registry.version, registry.tag
+    assert registry.active().table_name == 'data_1'
+
+    # another worker process uploads; this one only sees the database change
+    ingest_file(database, str(second), 'b.csv', 'data_2')
+
+    assert registry.active().table_name == 'data_2'
+    assert registry.version > version
+    assert registry.tag != tag
+    assert DatasetRegistry(lambda: sqlite3.connect(database)).tag == registry.tag
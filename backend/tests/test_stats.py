@@ -0,0 +1,34 @@
+import pandas as pd
+
+from backend import stats
+from backend.stats import ColumnStats, StatsAccumulator
+
+
+def test_integer_bounds_stay_integers():
+    acc = StatsAccumulator()
+    acc.update(pd.DataFrame({'qty': [3, 7, 5], 'price': [1.5, 2.0, 0.5]}))
+    acc.update(pd.DataFrame({'qty': [9, 1], 'price': [4.0, 3.0]}))
+
+    qty = acc.columns['qty'].summary()
+    price = acc.columns['price'].summary()
+    assert (qty['min'], qty['max']) == (1, 9)
+    assert isinstance(qty['min'], int) and isinstance(qty['max'], int)
+    assert (price['min'], price['max']) == (0.5, 4.0)
+
+
+def test_top_values_past_capacity_have_bounded_error(monkeypatch):
+    monkeypatch.setattr(stats, 'TOPK_CAPACITY', 10)
+    col = ColumnStats()
+    # 'h' is evicted by the first chunk's more frequent values, then dominates
+    col.update(pd.Series(['h'] + [f'v{i}' for i in range(20) for _ in range(5)]))
+    for _ in range(20):
+        col.update(pd.Series(['h'] * 10 + ['z']))
+    restored = ColumnStats.from_state(col.to_state())
+
+    summary = restored.summary()
+    error = summary['top_values_max_error']
+    assert not summary['top_values_exact']
+    assert summary['top_values']['h'] <= 201 <= summary['top_values']['h'] + error
+    for value, count in summary['top_values'].items():
+        truth = 201 if value == 'h' else 20 if value == 'z' else 5
+        assert count <= truth <= count + error
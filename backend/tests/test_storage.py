@@ -0,0 +1,68 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from backend import storage
+from backend.ingest import ingest_shared_transactions
+
+# A PostgreSQL database the tests may empty, e.g.
+# postgresql+psycopg2://postgres@localhost/business_test
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL', '')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL.startswith('postgresql'),
+                                reason='TEST_DATABASE_URL is not set to a PostgreSQL database')
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    monkeypatch.setattr(storage, 'DATABASE_URL', TEST_DATABASE_URL)
+    storage.dispose()
+    storage.clear_transactions()
+    yield storage
+    storage.clear_transactions()
+    storage.dispose()
+
+
+def _upload(tmp_path, body: str) -> dict:
+    path = tmp_path / 'tx.csv'
+    path.write_text(body)
+    conn = sqlite3.connect(str(tmp_path / 'business.db'))
+    try:
+        with open(path, 'rb') as fileobj:
+            return ingest_shared_transactions(conn, fileobj, 'tx.csv')
+    finally:
+        conn.close()
+
+
+def test_shared_uploads_skip_stored_rows(shared, tmp_path):
+    body = ('date,type,product,quantity,price,customer,region\n'
+            '2025-01-02,sale,B,2,10,c1,north\n'
+            '2025-01-01,purchase,A,1,4,c2,\n'
+            'not a date,sale,A,1,1,c1,north\n')
+    first = _upload(tmp_path, body)
+    again = _upload(tmp_path, body + '2025-01-03,sale,A,3,10,c2,south\n')
+
+    assert (first['rows_inserted'], first['rows_invalid']) == (2, 1)
+    assert (again['rows_inserted'], again['rows_duplicate']) == (1, 2)
+    assert shared.summary() == (50.0, 4.0, 3)
+    assert shared.summary('2025-01-02') == (50.0, 0.0, 2)
+    assert [r['product'] for r in shared.by_product()] == ['A', 'B']
+
+
+def test_shared_pages_order_nulls_as_sqlite_does(shared, tmp_path):
+    _upload(tmp_path, 'date,type,product,quantity,price,customer,region\n'
+                      '2025-01-01,sale,A,1,1,c1,north\n'
+                      '2025-01-02,sale,B,1,1,c1,\n'
+                      '2025-01-03,sale,C,1,1,c1,South\n')
+
+    page, total, amount = shared.transactions_page([], 'region', 'ASC', 2, 0)
+    rest, _, _ = shared.transactions_page([], 'region', 'ASC', 2, 0,
+                                          after=(page['region'].iloc[-1], int(page['id'].iloc[-1])))
+
+    assert (total, amount) == (3, 3.0)
+    # NULL first, then bytewise: 'South' sorts before 'north'
+    assert list(page['product']) + list(rest['product']) == ['B', 'C', 'A']
+    frame = shared.read_transactions()
+    assert pd.api.types.is_datetime64_any_dtype(frame['date']) and len(frame) == 3